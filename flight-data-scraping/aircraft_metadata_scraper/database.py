@@ -1,42 +1,161 @@
-import mysql.connector
-import os
-from dotenv import load_dotenv
-from sqlalchemy import create_engine
-
-load_dotenv()
-
-def get_connection():
-    return mysql.connector.connect(
-        host=os.getenv("DB_HOST"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        database=os.getenv("DB_NAME"))
-
-def get_engine():
-    engine = create_engine(f'mysql+mysqlconnector://{os.getenv("DB_USER")}:{os.getenv("DB_PASSWORD")}@{os.getenv("DB_HOST")}/{os.getenv("DB_NAME")}')
-    return engine
-
-#Return the date for the last update to the aircraft data in our database
-def get_last_updated(type):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT date FROM last_updated WHERE type = %s;", (type,))
-    row = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    return row[0]
-
-#Use panda datafframe to insert directly into the table (it will make a new table)
-def insert_aircraft_data(df):
-    engine = get_engine()
-    df.to_sql('aircraft_types', engine, if_exists='replace', index=False)
-    
-#Update the date in the last_updated table so that it will be reflected as changed
-def update_date(date):
-    conn = get_connection()
-    cursor = conn.cursor()
-    print(date)
-    cursor.execute("UPDATE last_updated SET date=%s WHERE type='AircraftData';", (date,))
-    conn.commit()
-    cursor.close()
-    conn.close()
\ No newline at end of file
+from collections import defaultdict
+from dotenv import load_dotenv
+import os
+
+from common.db import shared_database
+
+LAST_UPDATED_SQL = "SELECT date FROM last_updated WHERE type = %s;"
+UPDATE_DATE_SQL = "UPDATE last_updated SET date=%s WHERE type='AircraftData';"
+
+CREATE_AIRCRAFT_TYPES_SQL = """
+    CREATE TABLE IF NOT EXISTS aircraft_types (
+        type varchar(10) DEFAULT NULL,
+        parkingArea double DEFAULT NULL,
+        KEY type_idx (type)
+    );
+"""
+AIRCRAFT_TYPES_SQL = "SELECT type, parkingArea FROM {table};"
+TYPE_INDEX_SQL = "SHOW INDEX FROM {table} WHERE Column_name = 'type' AND Seq_in_index = 1;"
+# The type column is TEXT in tables made by pandas, which can't be indexed as it is. FAA designators are at most 4 characters
+ADD_TYPE_INDEX_SQL = "ALTER TABLE {table} MODIFY type varchar(10) DEFAULT NULL, ADD INDEX type_idx (type);"
+
+UPDATE_PARKING_AREA_SQL = "UPDATE {table} SET parkingArea = %s WHERE type = %s;"
+DELETE_TYPE_SQL = "DELETE FROM {table} WHERE type = %s;"
+DELETE_NULL_TYPE_SQL = "DELETE FROM {table} WHERE type IS NULL;"
+INSERT_AIRCRAFT_TYPE_SQL = "INSERT INTO {table} (type, parkingArea) VALUES (%s, %s);"
+
+STAGING_TABLE = "aircraft_types_staging"
+OLD_TABLE = "aircraft_types_old"
+
+load_dotenv()
+# Above this fraction of designators changed, a copy of the table is changed and swapped in instead of changing the live table
+SWAP_THRESHOLD = float(os.getenv('AIRCRAFT_TYPES_SWAP_THRESHOLD', 0.5))
+# How long the swap waits for readers that are using the table, in seconds, before it changes the live table instead
+SWAP_LOCK_WAIT_TIMEOUT = int(os.getenv('AIRCRAFT_TYPES_SWAP_LOCK_WAIT_TIMEOUT', 5))
+
+#Return the date for the last update to the aircraft data in our database
+def get_last_updated(type):
+    row = shared_database().fetch_one(LAST_UPDATED_SQL, (type,), prepared=True)
+    return row[0]
+
+def area_key(area):
+    return (area is None, area or 0.0)
+
+#Return the changes that turn the rows of aircraft_types into the new rows, as {type: (current parking areas, new parking areas)} for every designator whose rows differ
+def diff_aircraft_types(current_rows, new_rows):
+    current = defaultdict(list)
+    for type, area in current_rows:
+        current[type].append(None if area is None else float(area))
+    new = defaultdict(list)
+    for type, area in new_rows:
+        new[type].append(area)
+
+    changes = dict()
+    for type in current.keys() | new.keys():
+        if sorted(current.get(type, []), key=area_key) != sorted(new.get(type, []), key=area_key):
+            changes[type] = (current.get(type, []), new.get(type, []))
+    return changes
+
+#Apply the changed designators to a table: a designator with one row before and after has its parking area updated in place, so the other columns of the row (size) are kept, the rest have their rows replaced
+def apply_changes(cursor, table, changes):
+    updates = []
+    deletes = []
+    inserts = []
+    for type, (current_areas, new_areas) in changes.items():
+        if type is not None and len(current_areas) == 1 and len(new_areas) == 1:
+            updates.append((new_areas[0], type))
+            continue
+        if current_areas:
+            deletes.append(type)
+        inserts.extend((type, area) for area in new_areas)
+
+    if updates:
+        cursor.executemany(UPDATE_PARKING_AREA_SQL.format(table=table), updates)
+    if None in deletes:
+        cursor.execute(DELETE_NULL_TYPE_SQL.format(table=table))
+    deleted_types = [(type,) for type in deletes if type is not None]
+    if deleted_types:
+        cursor.executemany(DELETE_TYPE_SQL.format(table=table), deleted_types)
+    if inserts:
+        cursor.executemany(INSERT_AIRCRAFT_TYPE_SQL.format(table=table), inserts)
+    return len(updates), len(deletes), len(inserts)
+
+def has_type_index(cursor, table):
+    cursor.execute(TYPE_INDEX_SQL.format(table=table))
+    return bool(cursor.fetchall())
+
+def ensure_type_index(cursor, table):
+    if not has_type_index(cursor, table):
+        cursor.execute(ADD_TYPE_INDEX_SQL.format(table=table))
+
+#Turn a parking area cell into a number, or None if it is empty or isn't one
+def parking_area(value):
+    try:
+        return None if value is None or value == '' else float(value)
+    except (TypeError, ValueError):
+        return None
+
+#Bring the aircraft_types table up to date with the (designator, parking area) rows of the workbook, and set the date in last_updated, so readers never see an empty or half loaded table
+#Only the designators whose rows changed are written. A small change is made to the live table in one transaction with the date,
+#a large one is made to a copy of the table, with its indexes and an index on type, that replaces the live table in one atomic RENAME TABLE
+def insert_aircraft_data(rows, date):
+    # Empty cells are NULL in the table
+    new_rows = [(None if type is None else str(type).strip() or None, parking_area(area)) for type, area in rows]
+
+    with shared_database().connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute(CREATE_AIRCRAFT_TYPES_SQL)
+        cursor.execute(AIRCRAFT_TYPES_SQL.format(table="aircraft_types"))
+        current_rows = cursor.fetchall()
+        changes = diff_aircraft_types(current_rows, new_rows)
+
+        changed_types = len(changes)
+        total_types = len({type for type, _ in current_rows} | {type for type, _ in new_rows})
+        print(f"Aircraft types: {changed_types} of {total_types} designators changed ({len(current_rows)} rows before, {len(new_rows)} after)")
+
+        # A table made by pandas (before the scraper made its own) has a TEXT type without an index, that every update and delete by type scans.
+        # It is swapped once for a copy with the index, even if nothing changed, and while the swap fails it is tried again on the next run
+        swapped = False
+        if not has_type_index(cursor, "aircraft_types"):
+            print("Aircraft types: aircraft_types has no index on type, swapping in a copy with one")
+            swapped = swap_aircraft_types(cursor, changes)
+        elif changes and changed_types > SWAP_THRESHOLD * total_types:
+            swapped = swap_aircraft_types(cursor, changes)
+        if changes and not swapped:
+            updated, replaced, inserted = apply_changes(cursor, "aircraft_types", changes)
+            print(f"Aircraft types: updated {updated} designators and replaced {replaced} with {inserted} rows in place")
+
+        cursor.execute(UPDATE_DATE_SQL, (date,))
+        connection.commit()
+        cursor.close()
+
+#Build the new table from a copy of the live one and swap it in. The DDL statements commit on their own, so the date is updated
+#right after the swap, if that fails the next run finds nothing to change and only updates the date. Returns False if the live table is kept
+def swap_aircraft_types(cursor, changes):
+    try:
+        cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE};")
+        # LIKE keeps every column (the web app's size too) and index of the live table
+        cursor.execute(f"CREATE TABLE {STAGING_TABLE} LIKE aircraft_types;")
+        ensure_type_index(cursor, STAGING_TABLE)
+        cursor.execute(f"INSERT INTO {STAGING_TABLE} SELECT * FROM aircraft_types;")
+        updated, replaced, inserted = apply_changes(cursor, STAGING_TABLE, changes)
+
+        # The rename waits for readers in the middle of a query on aircraft_types, and new readers wait behind it,
+        # so give up quickly instead of holding them up
+        cursor.execute("SET SESSION lock_wait_timeout = %s;", (SWAP_LOCK_WAIT_TIMEOUT,))
+        cursor.execute(f"DROP TABLE IF EXISTS {OLD_TABLE};")
+        cursor.execute(f"RENAME TABLE aircraft_types TO {OLD_TABLE}, {STAGING_TABLE} TO aircraft_types;")
+        cursor.execute(f"DROP TABLE {OLD_TABLE};")
+        print(f"Aircraft types: swapped in a new table with {updated} designators updated and {replaced} replaced with {inserted} rows")
+        return True
+    except Exception as e:
+        print("Error swapping aircraft_types, changing the live table instead:", e)
+        cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE};")
+        return False
+    finally:
+        cursor.execute("SET SESSION lock_wait_timeout = DEFAULT;")
+
+#Update the date in the last_updated table so that it will be reflected as changed
+def update_date(date):
+    print(date)
+    shared_database().execute(UPDATE_DATE_SQL, (date,), prepared=True)
@@ -1,32 +1,183 @@
-import requests
-from bs4 import BeautifulSoup
-from datetime import datetime
-from database import get_last_updated, insert_aircraft_data, update_date
-from io import BytesIO
-import pandas as pd
-
-#Scrapes the faa website data to determine if the database has had recent updates not in our database
-def scrape_aircraft_data():
-    url = f'https://www.faa.gov/airports/engineering/aircraft_char_database'
-
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    date = soup.find('div', class_='mb-4 py-4')
-
-    date_text = date.text.strip()
-    split_str = date_text.split("Last updated:")
-    date_str = split_str[1].strip()
-    website_date = datetime.strptime(date_str, '%A, %B %d, %Y').date()
-
-    last_update = get_last_updated('AircraftData')
-    last_update_date = datetime.strptime(last_update, '%Y-%m-%d').date()
-
-    #There is new data to add! Utilizing pandas to make a dataframe so it's easy to upload to our database
-    if website_date > last_update_date:
-        xls_url = f'{url}/aircraft_data'
-        response = requests.get(xls_url)
-        file_content = BytesIO(response.content)
-        df = pd.read_excel(file_content, usecols=["FAA_Designator", "Parking_area_ft2"])
-        df = df.rename(columns={"FAA_Designator": "type", "Parking_area_ft2": "parkingArea"})
-        insert_aircraft_data(df)
-        update_date(website_date)
+import requests
+from bs4 import BeautifulSoup
+from datetime import date, datetime
+from database import get_last_updated, insert_aircraft_data, update_date
+from dotenv import load_dotenv
+from openpyxl import load_workbook
+import hashlib
+import json
+import os
+import pandas as pd
+
+load_dotenv()
+# Can be pointed at the FAA stand-in in testing/faa_stand_in
+AIRCRAFT_DATA_URL = os.getenv('AIRCRAFT_DATA_URL', 'https://www.faa.gov/airports/engineering/aircraft_char_database')
+# Where the last workbook that was loaded is kept, with its hash and the validators the FAA sent with it and the page
+CACHE_DIR = os.getenv('AIRCRAFT_DATA_CACHE_DIR', 'aircraft_data_cache')
+REQUEST_TIMEOUT = float(os.getenv('AIRCRAFT_DATA_REQUEST_TIMEOUT', 60))
+
+# Kept with the extension of its format, i.e. aircraft_data.xlsx
+WORKBOOK_PATH = os.path.join(CACHE_DIR, 'aircraft_data')
+CACHE_INFO_PATH = os.path.join(CACHE_DIR, 'aircraft_data.json')
+# The only columns of the workbook that are loaded, in the order of the aircraft_types columns
+WORKBOOK_COLUMNS = ("FAA_Designator", "Parking_area_ft2")
+
+# The first bytes of an xlsx workbook (a zip file), and of an xls workbook (the older binary format, BIFF, in an OLE2 file)
+XLSX_MAGIC = b'PK\x03\x04'
+XLS_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+#Return what is known about the last page and workbook that were handled, or nothing the first time
+def read_cache_info():
+    try:
+        with open(CACHE_INFO_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+def write_cache_info(info):
+    # Written to a new file that replaces the old one, so a crash can't leave half of it behind
+    with open(CACHE_INFO_PATH + '.tmp', 'w') as f:
+        json.dump(info, f)
+    os.replace(CACHE_INFO_PATH + '.tmp', CACHE_INFO_PATH)
+
+#Headers that ask the server to answer 304 Not Modified if nothing changed since the response the validators came from
+def conditional_headers(validators):
+    headers = dict()
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+def response_validators(response):
+    return {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+
+def parse_website_date(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    date = soup.find('div', class_='mb-4 py-4')
+
+    date_text = date.text.strip()
+    split_str = date_text.split("Last updated:")
+    date_str = split_str[1].strip()
+    return datetime.strptime(date_str, '%A, %B %d, %Y').date()
+
+#Stream the workbook to a file next to the cached one, hashing it on the way. Returns the file and the hash, or None if it is not modified
+def download_workbook(validators):
+    response = requests.get(f'{AIRCRAFT_DATA_URL}/aircraft_data', headers=conditional_headers(validators), stream=True, timeout=REQUEST_TIMEOUT)
+    if response.status_code == 304:
+        response.close()
+        return None
+    response.raise_for_status()
+
+    # The format isn't known until the file is read, so it has no extension
+    download_path = os.path.join(CACHE_DIR, 'aircraft_data.download')
+    digest = hashlib.sha256()
+    with response, open(download_path, 'wb') as f:
+        for chunk in response.iter_content(chunk_size=1 << 16):
+            digest.update(chunk)
+            f.write(chunk)
+    return download_path, digest.hexdigest(), response_validators(response)
+
+#Return 'xlsx' or 'xls' from the first bytes of a workbook, whatever its name or the content type it was served with
+def workbook_format(path):
+    with open(path, 'rb') as f:
+        magic = f.read(len(XLS_MAGIC))
+    if magic.startswith(XLSX_MAGIC):
+        return 'xlsx'
+    if magic.startswith(XLS_MAGIC):
+        return 'xls'
+    raise ValueError(f"Aircraft data workbook is not an xlsx or xls file (it starts with {magic!r})")
+
+#Read the designator and parking area of every aircraft in the workbook, as a list of (designator, parking area)
+def read_workbook(path):
+    if workbook_format(path) == 'xls':
+        return read_xls_workbook(path)
+    return read_xlsx_workbook(path)
+
+#The older binary format can't be read a row at a time, so it is read with pandas like it was before, but only the two columns
+def read_xls_workbook(path):
+    df = pd.read_excel(path, engine='xlrd', usecols=list(WORKBOOK_COLUMNS))
+    rows = []
+    for row in df[list(WORKBOOK_COLUMNS)].itertuples(index=False, name=None):
+        values = tuple(None if pd.isna(value) else value for value in row)
+        if any(value is not None for value in values):
+            rows.append(values)
+    return rows
+
+#Read an xlsx workbook a row at a time in read only mode, and only the cells between the two columns,
+#so the whole sheet is never loaded in memory
+def read_xlsx_workbook(path):
+    # Opened as a file, since openpyxl refuses file names without an xlsx extension
+    with open(path, 'rb') as f:
+        workbook = load_workbook(f, read_only=True, data_only=True)
+        try:
+            return read_sheet(workbook.worksheets[0])
+        finally:
+            workbook.close()
+
+def read_sheet(sheet):
+    header = next(sheet.iter_rows(max_row=1, values_only=True))
+    missing = [column for column in WORKBOOK_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"Aircraft data workbook is missing the columns {missing}")
+
+    indexes = [header.index(column) for column in WORKBOOK_COLUMNS]
+    first, last = min(indexes), max(indexes)
+    rows = []
+    for row in sheet.iter_rows(min_row=2, min_col=first + 1, max_col=last + 1, values_only=True):
+        values = tuple(row[i - first] if i - first < len(row) else None for i in indexes)
+        if any(value is not None for value in values):
+            rows.append(values)
+    return rows
+
+#Scrapes the faa website data to determine if the database has had recent updates not in our database
+#The page and the workbook are only downloaded again when the FAA says they changed, and the workbook is only loaded when its bytes did.
+#What was cached is only trusted as far as the database has it: when the date in last_updated is older than the date the cache was made for
+#(the database was restored, or a load was lost), the workbook is downloaded and loaded again
+def scrape_aircraft_data():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    info = read_cache_info()
+
+    last_update = get_last_updated('AircraftData')
+    last_update_date = datetime.strptime(last_update, '%Y-%m-%d').date()
+
+    page_info = info.get('page', {})
+    response = requests.get(AIRCRAFT_DATA_URL, headers=conditional_headers(page_info), timeout=REQUEST_TIMEOUT)
+    if response.status_code == 304 and page_info.get('date'):
+        # The page is the one handled last time, so it has the same date
+        print("Aircraft data page not modified")
+        website_date = date.fromisoformat(page_info['date'])
+    else:
+        if response.status_code == 304:
+            # Validators cached without the page's date, so ask for the page itself
+            response = requests.get(AIRCRAFT_DATA_URL, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        website_date = parse_website_date(response.text)
+        page_info = dict(response_validators(response), date=website_date.isoformat())
+
+    #There is new data to add!
+    if website_date > last_update_date:
+        workbook_info = info.get('workbook', {})
+        # The cached workbook is only what the database has if the database has the date it was loaded for
+        if not workbook_info.get('date') or date.fromisoformat(workbook_info['date']) > last_update_date:
+            workbook_info = dict()
+
+        download = download_workbook(workbook_info)
+        if download is None:
+            print("Aircraft data workbook not modified")
+            update_date(website_date)
+            info['workbook'] = dict(workbook_info, date=website_date.isoformat())
+        elif download[1] == workbook_info.get('sha256'):
+            print("Aircraft data workbook has the same contents")
+            os.remove(download[0])
+            update_date(website_date)
+            info['workbook'] = dict(download[2], sha256=download[1], date=website_date.isoformat())
+        else:
+            path, content_hash, validators = download
+            insert_aircraft_data(read_workbook(path), website_date)
+            os.replace(path, f'{WORKBOOK_PATH}.{workbook_format(path)}')
+            info['workbook'] = dict(validators, sha256=content_hash, date=website_date.isoformat())
+
+    # Only remembered once the page has been handled, so a failed load is tried again the next day
+    info['page'] = page_info
+    write_cache_info(info)
@@ -0,0 +1,105 @@
+"""
+Measures the write and read throughput of the on-disk FlightPlanLog for each fsync policy, next to the in-memory FlightPlanQueue.
+Writes are single appends like flight_plans_api.add_flight_plan makes, reads are batches like the database manager asks for.
+
+Usage: python bench_flight_plan_log.py [--count 50000] [--batch-size 500] [--directory DIR]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'flight_plan_tracking'))
+
+from common.flight_plan import FlightPlan
+from flight_plan_log import FlightPlanLog, FSYNC_POLICIES
+from flight_plan_queue import FlightPlanQueue
+
+
+def sample_flight_plans(count):
+    return [
+        FlightPlan(flight_ref=str(95000000 + i), acid=f"N{i % 900 + 100}QS", dep_arpt="KTEB", arr_arpt="KPBI",
+                   etd=1742904300 + i, eta=1742914200 + i, status="FLYING", model="C68A", fbo_id=i % 50)
+        for i in range(count)
+    ]
+
+
+def bench_log(directory, flight_plans, batch_size, fsync_policy, max_seconds):
+    log = FlightPlanLog(directory, fsync_policy=fsync_policy)
+
+    # fsync on every append can be very slow on some disks, so stop early and report the rate so far
+    start = time.perf_counter()
+    written = 0
+    for flight_plan in flight_plans:
+        log.append(flight_plan)
+        written += 1
+        if written % 100 == 0 and time.perf_counter() - start > max_seconds:
+            break
+    log.sync()
+    write_rate = written / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    offset = log.start_offset()
+    read = 0
+    while True:
+        records, offset = log.read(offset, batch_size)
+        if not records:
+            break
+        read += len(records)
+    read_rate = read / (time.perf_counter() - start)
+
+    size = log.end_offset() - log.start_offset()
+    log.close()
+    return write_rate, read_rate, size / max(written, 1)
+
+
+def bench_queue(flight_plans, batch_size):
+    # Every flight plan is for a different flight, so nothing is coalesced, and the queue holds all of them
+    queue = FlightPlanQueue(max_size=len(flight_plans))
+
+    start = time.perf_counter()
+    for flight_plan in flight_plans:
+        queue.put(flight_plan)
+    write_rate = len(flight_plans) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    read = 0
+    while True:
+        taken = queue.take(batch_size)
+        if not taken:
+            break
+        read += len(taken)
+    read_rate = read / (time.perf_counter() - start)
+    return write_rate, read_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=50000, help='number of flight plans written')
+    parser.add_argument('--batch-size', type=int, default=500, help='flight plans read per request')
+    parser.add_argument('--directory', default=None, help='where to put the log (defaults to a temporary directory), to test a particular disk')
+    parser.add_argument('--max-seconds', type=float, default=10.0, help='longest time spent writing for one fsync policy')
+    args = parser.parse_args()
+
+    flight_plans = sample_flight_plans(args.count)
+
+    print(f"{'store':22} {'writes/s':>10} {'reads/s':>10} {'bytes/plan':>11}")
+
+    write_rate, read_rate = bench_queue(flight_plans, args.batch_size)
+    print(f"{'memory queue':22} {write_rate:10.0f} {read_rate:10.0f} {'-':>11}")
+
+    for fsync_policy in FSYNC_POLICIES:
+        directory = tempfile.mkdtemp(dir=args.directory)
+        try:
+            write_rate, read_rate, bytes_per_plan = bench_log(directory, flight_plans, args.batch_size, fsync_policy, args.max_seconds)
+        finally:
+            shutil.rmtree(directory)
+        print(f"{'log, fsync ' + fsync_policy:22} {write_rate:10.0f} {read_rate:10.0f} {bytes_per_plan:11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Compares the old dictionary flight plan, with MySQL DATETIME strings and a clock read per comparison, to the slotted
+FlightPlan with epoch seconds and one clock read per batch.
+Reports the memory held per queued flight plan and the CPU time spent per message on building the record and its times.
+
+Usage: python bench_flight_plan_record.py [--count 100000]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from common.flight_plan import FlightPlan, zulu_to_epoch
+
+
+def legacy_convert(zulu_time):
+    dt = datetime.strptime(zulu_time, "%Y-%m-%dT%H:%M:%SZ")
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def legacy_is_before_current_time(datetime_str):
+    dt = datetime.strptime(datetime_str, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    return dt < datetime.now(timezone.utc)
+
+
+def legacy_record(i, etd, eta):
+    flight_plan = dict()
+    flight_plan["flight_ref"] = str(100000000 + i)
+    flight_plan["acid"] = "EJA" + str(i % 1000)
+    flight_plan["arr_arpt"] = "KTEB"
+    flight_plan["dep_arpt"] = "KPBI"
+    flight_plan["eta"] = legacy_convert(eta)
+    flight_plan["etd"] = legacy_convert(etd)
+    flight_plan["model"] = "C68A"
+    if legacy_is_before_current_time(flight_plan["etd"]):
+        flight_plan["status"] = "FLYING" if not legacy_is_before_current_time(flight_plan["eta"]) else None
+    else:
+        flight_plan["status"] = "SCHEDULED"
+    flight_plan["fbo_id"] = i % 50
+    return flight_plan
+
+
+def record(i, etd, eta, current_time):
+    flight_plan = FlightPlan(flight_ref=str(100000000 + i), acid="EJA" + str(i % 1000), arr_arpt="KTEB", dep_arpt="KPBI")
+    flight_plan.eta = zulu_to_epoch(eta)
+    flight_plan.etd = zulu_to_epoch(etd)
+    flight_plan.model = "C68A"
+    if flight_plan.etd < current_time:
+        flight_plan.status = "FLYING" if not flight_plan.eta < current_time else None
+    else:
+        flight_plan.status = "SCHEDULED"
+    flight_plan.fbo_id = i % 50
+    return flight_plan
+
+
+def sample_times(count):
+    times = []
+    for i in range(count):
+        hour = i % 24
+        times.append((f"2025-03-{1 + i % 28:02}T{hour:02}:{i % 60:02}:00Z", f"2025-03-{1 + i % 28:02}T{hour:02}:{(i + 30) % 60:02}:59Z"))
+    return times
+
+
+def memory_per_record(build, times):
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    queued = [build(i, etd, eta) for i, (etd, eta) in enumerate(times)]
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Don't count the list that holds them
+    return (held - baseline - sys.getsizeof(queued)) / len(queued)
+
+
+def cpu_per_message(build, times):
+    start = time.process_time()
+    for i, (etd, eta) in enumerate(times):
+        build(i, etd, eta)
+    return (time.process_time() - start) / len(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=100000, help='number of flight plans built for each record type')
+    args = parser.parse_args()
+
+    times = sample_times(args.count)
+
+    # The new path reads the clock once for the whole batch, like main.py does once per pass
+    def batched_record(i, etd, eta, current_time=int(time.time())):
+        return record(i, etd, eta, current_time)
+
+    for i, (etd, eta) in enumerate(times[:1000]):
+        legacy = legacy_record(i, etd, eta)
+        new = batched_record(i, etd, eta)
+        if legacy['etd'] != datetime.fromtimestamp(new.etd, timezone.utc).strftime("%Y-%m-%d %H:%M:%S") or legacy['status'] != new.status:
+            raise SystemExit(f"Records differ: {legacy} {new}")
+
+    builds = {'dict + DATETIME strings': legacy_record, 'FlightPlan + epoch': batched_record}
+
+    print(f"{'record':26} {'bytes/record':>13} {'us/message':>11}")
+    for name, build in builds.items():
+        print(f"{name:26} {memory_per_record(build, times):13.0f} {cpu_per_message(build, times) * 1e6:11.2f}")
+
+
+if __name__ == "__main__":
+    main()
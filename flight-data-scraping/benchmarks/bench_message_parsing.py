@@ -0,0 +1,80 @@
+"""
+Compares the xmltodict parse with the targeted FlightMessageExtractor parse, for every message type FlightDataProcessor handles.
+Each message is parsed and run through process_message, and the two flight plans are checked to be identical.
+Reports messages per second and the peak memory allocated per message.
+
+Usage: python bench_message_parsing.py [--seconds 1.0]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'flight_plan_tracking'))
+
+import xmltodict
+from flightDataProcessor import FlightDataProcessor
+from flight_message_extractor import FlightMessageExtractor
+from sample_messages import SAMPLE_MESSAGES
+
+
+def messages_per_second(parse, processor, message, seconds):
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            processor.process_message(parse(message).get('fltdMessage'))
+        count += 100
+    return count / (time.perf_counter() - start)
+
+
+def peak_memory_per_message(parse, processor, message):
+    """
+    Returns the peak memory (bytes) allocated while one message is parsed and processed, i.e. the size of everything built for it.
+    """
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    processor.process_message(parse(message).get('fltdMessage'))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak - baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=1.0, help='time spent measuring each parser per message type')
+    args = parser.parse_args()
+
+    processor = FlightDataProcessor()
+    extractor = FlightMessageExtractor()
+    parsers = {'xmltodict': xmltodict.parse, 'targeted': extractor.parse}
+
+    print(f"{'message type':32} {'xmltodict msg/s':>16} {'targeted msg/s':>16} {'speedup':>8} {'xmltodict bytes':>16} {'targeted bytes':>15}")
+
+    # process_message prints for unknown message types, keep that out of the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        rows = []
+        for msg_type, message in SAMPLE_MESSAGES.items():
+            expected = processor.process_message(xmltodict.parse(message).get('fltdMessage'))
+            actual = processor.process_message(extractor.parse(message).get('fltdMessage'))
+            if expected != actual:
+                raise SystemExit(f"{msg_type}: targeted parse gave {actual}, xmltodict parse gave {expected}")
+
+            rates = {name: messages_per_second(parse, processor, message, args.seconds) for name, parse in parsers.items()}
+            allocations = {name: peak_memory_per_message(parse, processor, message) for name, parse in parsers.items()}
+            rows.append((msg_type, rates, allocations))
+
+    for msg_type, rates, allocations in rows:
+        print(f"{msg_type:32} {rates['xmltodict']:16.0f} {rates['targeted']:16.0f} {rates['targeted'] / rates['xmltodict']:7.2f}x "
+              f"{allocations['xmltodict']:16} {allocations['targeted']:15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Measures how parsing throughput scales with the number of ParsingWorkers processes, against parsing in a single process.
+A stream of messages for many flights (every sample message type, each with its own flightRef) is parsed with
+FlightMessageExtractor and FlightDataProcessor.process_message, the same work main.py hands to the workers.
+The flight plans for each flight are checked to come back in the same order as the single process parse.
+
+With --loop, it measures main.py's loop instead: ParsingWorkers.pump fetching each message from a stand-in message API
+(that takes --fetch-latency seconds per request), against the single process loop without its sleep, and the old worker loop,
+which sent a batch of one message and slept 0.2 seconds on every pass (on --old-loop-messages messages, since it is slow).
+
+Usage: python bench_parsing_workers.py [--messages 20000] [--flights 500] [--max-workers N] [--batch-size 50]
+       python bench_parsing_workers.py --loop [--fetch-latency 0.0005] [--old-loop-messages 25]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'flight_plan_tracking'))
+
+from flightDataProcessor import FlightDataProcessor
+from flight_message_extractor import FlightMessageExtractor
+from message_header_filter import MessageHeaderFilter
+from parsing_workers import ParsingWorkers, parse_messages
+from sample_messages import SAMPLE_MESSAGES
+
+
+def message_stream(count, flights):
+    templates = list(SAMPLE_MESSAGES.values())
+    messages = []
+    for i in range(count):
+        flight_ref = str(95000000 + i % flights)
+        messages.append(templates[i % len(templates)].replace('flightRef="95012345"', f'flightRef="{flight_ref}"'))
+    return messages
+
+
+def by_flight(flight_plans):
+    flights = dict()
+    for flight_plan in flight_plans:
+        flights.setdefault(flight_plan.flight_ref, []).append(flight_plan)
+    return flights
+
+
+def single_process(messages):
+    start = time.perf_counter()
+    flight_plans = parse_messages(messages, 'targeted', FlightMessageExtractor(), FlightDataProcessor())
+    return len(messages) / (time.perf_counter() - start), flight_plans
+
+
+def worker_processes(messages, workers, batch_size):
+    parsingWorkers = ParsingWorkers(workers, 'targeted', batch_size)
+    headers = [MessageHeaderFilter.read_header(message) for message in messages]
+
+    start = time.perf_counter()
+    flight_plans = []
+    for header, message in zip(headers, messages):
+        parsingWorkers.submit(header['flightRef'], message)
+    parsingWorkers.flush()
+    while parsingWorkers.in_flight:
+        flight_plans.extend(parsingWorkers.results(timeout=1))
+    rate = len(messages) / (time.perf_counter() - start)
+
+    parsingWorkers.close()
+    return rate, flight_plans
+
+
+class MessageApi:
+    """
+    Stand-in for the message API: hands out the messages one per request, then None, taking latency seconds per request.
+    """
+    def __init__(self, messages, latency):
+        self.messages = iter(messages)
+        self.latency = latency
+
+    def fetch(self):
+        if self.latency:
+            time.sleep(self.latency)
+        return next(self.messages, None)
+
+
+def single_process_loop(messages, fetch_latency):
+    api = MessageApi(messages, fetch_latency)
+    messageHeaderFilter = MessageHeaderFilter()
+    flightMessageExtractor = FlightMessageExtractor()
+    flightDataProcessor = FlightDataProcessor()
+
+    start = time.perf_counter()
+    flight_plans = []
+    while True:
+        message = api.fetch()
+        if message is None:
+            break
+        flightDataProcessor.set_current_time()
+        if messageHeaderFilter.accept(message):
+            flight_plans.extend(parse_messages([message], 'targeted', flightMessageExtractor, flightDataProcessor))
+    return len(messages) / (time.perf_counter() - start), flight_plans
+
+
+def worker_loop(messages, workers, batch_size, fetch_latency):
+    parsingWorkers = ParsingWorkers(workers, 'targeted', batch_size)
+    api = MessageApi(messages, fetch_latency)
+    messageHeaderFilter = MessageHeaderFilter()
+
+    start = time.perf_counter()
+    flight_plans = []
+    # Until the API is empty and every flight plan has come back
+    while parsingWorkers.pump(api.fetch, messageHeaderFilter, flight_plans.append, idle_wait=0.01) or parsingWorkers.in_flight:
+        pass
+    rate = len(messages) / (time.perf_counter() - start)
+
+    parsingWorkers.close()
+    return rate, flight_plans
+
+
+def old_worker_loop(messages, workers, batch_size, fetch_latency):
+    parsingWorkers = ParsingWorkers(workers, 'targeted', batch_size)
+    api = MessageApi(messages, fetch_latency)
+    messageHeaderFilter = MessageHeaderFilter()
+
+    start = time.perf_counter()
+    flight_plans = []
+    fetched = 0
+    while fetched < len(messages) or parsingWorkers.in_flight:
+        message = api.fetch()
+        if message is not None:
+            fetched += 1
+            header = messageHeaderFilter.accept(message)
+            if header:
+                parsingWorkers.submit(header['flightRef'], message)
+        parsingWorkers.flush()
+        flight_plans.extend(parsingWorkers.results())
+        time.sleep(0.2)
+    rate = len(messages) / (time.perf_counter() - start)
+
+    parsingWorkers.close()
+    return rate, flight_plans
+
+
+def compare_loops(args, messages):
+    with contextlib.redirect_stdout(io.StringIO()):
+        baseline, expected = single_process_loop(messages, args.fetch_latency)
+        old_messages = messages[:args.old_loop_messages]
+        old_rate, old_flight_plans = old_worker_loop(old_messages, 2, args.batch_size, args.fetch_latency)
+        rows = []
+        for workers in range(1, args.max_workers + 1):
+            rate, flight_plans = worker_loop(messages, workers, args.batch_size, args.fetch_latency)
+            if by_flight(flight_plans) != by_flight(expected):
+                raise SystemExit(f"{workers} workers: flight plans differ from the single process loop")
+            rows.append((workers, rate))
+
+    print(f"{os.cpu_count()} cores available, {args.fetch_latency * 1000:.2f} ms per message API request")
+    print(f"{'loop':>14} {'msg/s':>10} {'vs single process':>18}")
+    print(f"{'single':>14} {baseline:10.0f} {1:17.2f}x")
+    print(f"{'old, 2 workers':>14} {old_rate:10.1f} {old_rate / baseline:17.4f}x")
+    for workers, rate in rows:
+        print(f"{f'{workers} workers':>14} {rate:10.0f} {rate / baseline:17.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=20000, help='number of messages parsed per run')
+    parser.add_argument('--flights', type=int, default=500, help='number of distinct flightRefs in the stream')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count(), help='largest number of worker processes to try')
+    parser.add_argument('--batch-size', type=int, default=50, help='messages sent to a worker at a time')
+    parser.add_argument('--loop', action='store_true', help="measure main.py's loop with the workers, fetching from a stand-in message API")
+    parser.add_argument('--fetch-latency', type=float, default=0.0005, help='seconds each request to the stand-in message API takes (--loop)')
+    parser.add_argument('--old-loop-messages', type=int, default=25, help='messages run through the old loop, at about 5 a second (--loop)')
+    args = parser.parse_args()
+
+    messages = message_stream(args.messages, args.flights)
+    if args.loop:
+        compare_loops(args, messages)
+        return
+
+    # process_message prints for unknown message types, keep that out of the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        baseline, expected = single_process(messages)
+        rows = []
+        for workers in range(1, args.max_workers + 1):
+            rate, flight_plans = worker_processes(messages, workers, args.batch_size)
+            if by_flight(flight_plans) != by_flight(expected):
+                raise SystemExit(f"{workers} workers: flight plans differ from the single process parse")
+            rows.append((workers, rate))
+
+    print(f"{os.cpu_count()} cores available")
+    print(f"{'workers':>8} {'msg/s':>10} {'vs single process':>18}")
+    print(f"{'none':>8} {baseline:10.0f} {1:17.2f}x")
+    for workers, rate in rows:
+        print(f"{workers:>8} {rate:10.0f} {rate / baseline:17.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+One representative fltdMessage per message type handled by FlightDataProcessor.process_message.
+The message consumer strips namespace prefixes (<fdm:fltdMessage> becomes <fltdMessage>), so these do too,
+except for the arrivalInformation message which keeps the prefixes of the elements below the root, like the messages in testing/test_message_consumer.
+"""
+
+QUALIFIED_AIRCRAFT_ID = '''
+    <qualifiedAircraftId aircraftCategory="JET" userCategory="GENERAL_AVIATION">
+      <aircraftId>EJA{number}</aircraftId>
+      <computerId>
+        <facilityIdentifier>KZNY</facilityIdentifier>
+        <idNumber>{number}</idNumber>
+      </computerId>
+      <gufi>KN0{flight_ref}</gufi>
+      <igtd>2025-03-25T12:00:00Z</igtd>
+      <departurePoint>
+        <airport>{dep_arpt}</airport>
+      </departurePoint>
+      <arrivalPoint>
+        <airport>{arr_arpt}</airport>
+      </arrivalPoint>
+    </qualifiedAircraftId>'''
+
+ROUTE = '''
+      <newRouteData>
+        <routeOfFlight legacyFormat="KTEB./.DIXIE..V1..ATR..SAWED.PALMZ2.KPBI">KTEB./.DIXIE..V1..ATR..SAWED.PALMZ2.KPBI</routeOfFlight>
+        <waypoint fixName="DIXIE" latitude="40.0N" longitude="74.2W" time="2025-03-25T12:20:00Z"/>
+        <waypoint fixName="ATR" latitude="38.4N" longitude="75.1W" time="2025-03-25T12:42:00Z"/>
+        <waypoint fixName="SAWED" latitude="30.1N" longitude="79.2W" time="2025-03-25T14:05:00Z"/>
+        <waypoint fixName="PALMZ" latitude="27.0N" longitude="80.1W" time="2025-03-25T14:38:00Z"/>
+      </newRouteData>'''
+
+ROUTE_DATA = '''
+    <ncsmRouteData>
+      <eta etaType="ESTIMATED" timeValue="2025-03-25T14:50:00Z"/>
+      <etd etdType="PROPOSED" timeValue="2025-03-25T12:05:00Z"/>
+      <rvsmData currentCompliance="true" equipped="true" futureCompliance="true"/>
+      <arrivalFixAndTime arrTime="2025-03-25T14:38:00Z" fixName="PALMZ"/>
+      <departureFixAndTime fixName="DIXIE" time="2025-03-25T12:20:00Z"/>''' + ROUTE + '''
+    </ncsmRouteData>'''
+
+TRACK_DATA = '''
+    <ncsmTrackData>
+      <eta etaType="ESTIMATED" timeValue="2025-03-25T14:52:00Z"/>
+      <rvsmData currentCompliance="true" equipped="true" futureCompliance="true"/>
+      <arrivalFixAndTime arrTime="2025-03-25T14:40:00Z" fixName="PALMZ"/>
+      <nextEvent latitudeDecimal="33.91" longitudeDecimal="-78.02"/>
+    </ncsmTrackData>'''
+
+POSITION = '''
+    <speed>447</speed>
+    <reportedAltitude>
+      <assignedAltitude>
+        <simpleAltitude>410C</simpleAltitude>
+      </assignedAltitude>
+    </reportedAltitude>
+    <position>
+      <latitude>
+        <latitudeDMS degrees="34" direction="NORTH" minutes="54" seconds="32"/>
+      </latitude>
+      <longitude>
+        <longitudeDMS degrees="078" direction="WEST" minutes="01" seconds="11"/>
+      </longitude>
+    </position>
+    <timeAtPosition>2025-03-25T13:31:00Z</timeAtPosition>'''
+
+AIRLINE_DATA = '''
+      <airlineData>
+        <flightStatusAndSpec>
+          <flightStatus>SCHEDULED</flightStatus>
+          <aircraftModel>C68A</aircraftModel>
+          <aircraftSpecification>C68A/L</aircraftSpecification>
+        </flightStatusAndSpec>
+        <etd etdType="SCHEDULED" timeValue="2025-03-25T12:05:00Z"/>
+        <eta etaType="SCHEDULED" timeValue="2025-03-25T14:50:00Z"/>
+        <flightTimeData airlineInTime="2025-03-25T14:58:00Z" airlineOffTime="2025-03-25T12:05:00Z" airlineOnTime="2025-03-25T14:50:00Z" airlineOutTime="2025-03-25T11:55:00Z"/>
+        <gateData arrivalGate="" departureGate=""/>
+      </airlineData>'''
+
+
+def root(msg_type, body, flight_ref="95012345", acid="N123QS", dep_arpt="KTEB", arr_arpt="KPBI"):
+    # Some messages leave the arriving airport out of the root tag
+    arr_arpt_attribute = f'arrArpt="{arr_arpt}" ' if arr_arpt else ''
+    return (
+        f'<fltdMessage acid="{acid}" airline="EJA" {arr_arpt_attribute}cdmPart="false" depArpt="{dep_arpt}" fdTrigger="FD_TRIGGER" '
+        f'flightRef="{flight_ref}" major="EJA" msgType="{msg_type}" sensitivity="A" sourceFacility="KZNY" sourceTimeStamp="2025-03-25T12:00:00Z">'
+        + body.format(number=flight_ref[-3:], flight_ref=flight_ref, dep_arpt=dep_arpt, arr_arpt=arr_arpt or 'KPBI')
+        + '</fltdMessage>'
+    )
+
+
+SAMPLE_MESSAGES = {
+    "flightPlanInformation": root("flightPlanInformation", '''
+  <flightPlanInformation>''' + QUALIFIED_AIRCRAFT_ID + '''
+    <flightAircraftSpecs>C68A</flightAircraftSpecs>
+    <speed>440</speed>
+    <altitude>
+      <requestedAltitude>410</requestedAltitude>
+    </altitude>''' + ROUTE_DATA + '''
+    <flightPlanRemarks>TCAS</flightPlanRemarks>
+  </flightPlanInformation>'''),
+
+    "flightPlanAmendmentInformation": root("flightPlanAmendmentInformation", '''
+  <flightPlanAmendmentInformation>''' + QUALIFIED_AIRCRAFT_ID + '''
+    <amendmentData>
+      <newSpeed>450</newSpeed>
+    </amendmentData>''' + ROUTE_DATA + '''
+    <ncsmDiversionCancelData>
+      <canceledFlightReference flightRefType="CANCELED">95012300</canceledFlightReference>
+      <diversionIndicator>DIVERSION</diversionIndicator>
+    </ncsmDiversionCancelData>
+  </flightPlanAmendmentInformation>''', arr_arpt="PBI"),
+
+    "arrivalInformation": root("arrivalInformation", '''
+  <fdm:arrivalInformation>
+    <nxcm:qualifiedAircraftId aircraftCategory="JET" userCategory="GENERAL_AVIATION">
+      <nxce:aircraftId>EJA{number}</nxce:aircraftId>
+      <nxce:arrivalPoint>
+        <nxce:airport>{arr_arpt}</nxce:airport>
+      </nxce:arrivalPoint>
+    </nxcm:qualifiedAircraftId>
+    <nxcm:timeOfArrival estimated="false">2025-03-25T14:51:00Z</nxcm:timeOfArrival>
+    <nxcm:ncsmFlightTimeData>
+      <nxcm:etd etdType="ACTUAL" timeValue="2025-03-25T12:07:00Z"/>
+      <nxcm:eta etaType="ACTUAL" timeValue="2025-03-25T14:51:00Z"/>
+      <nxcm:rvsmData currentCompliance="true" equipped="true" futureCompliance="true"/>
+    </nxcm:ncsmFlightTimeData>
+  </fdm:arrivalInformation>'''),
+
+    "arrivalInformationStripped": root("arrivalInformation", '''
+  <arrivalInformation>''' + QUALIFIED_AIRCRAFT_ID + '''
+    <timeOfArrival estimated="false">2025-03-25T14:51:00Z</timeOfArrival>
+    <ncsmFlightTimeData>
+      <etd etdType="ACTUAL" timeValue="2025-03-25T12:07:00Z"/>
+      <eta etaType="ACTUAL" timeValue="2025-03-25T14:51:00Z"/>
+      <rvsmData currentCompliance="true" equipped="true" futureCompliance="true"/>
+    </ncsmFlightTimeData>
+  </arrivalInformation>'''),
+
+    "departureInformation": root("departureInformation", '''
+  <departureInformation>''' + QUALIFIED_AIRCRAFT_ID + '''
+    <flightAircraftSpecs>C68A</flightAircraftSpecs>
+    <timeOfDeparture estimated="false">2025-03-25T12:07:00Z</timeOfDeparture>
+    <timeOfArrival estimated="true">2025-03-25T14:50:00Z</timeOfArrival>
+    <ncsmFlightTimeData>
+      <etd etdType="ACTUAL" timeValue="2025-03-25T12:07:00Z"/>
+      <eta etaType="ESTIMATED" timeValue="2025-03-25T14:50:00Z"/>
+      <rvsmData currentCompliance="true" equipped="true" futureCompliance="true"/>
+    </ncsmFlightTimeData>
+  </departureInformation>'''),
+
+    "flightPlanCancellation": root("flightPlanCancellation", '''
+  <flightPlanCancellation>''' + QUALIFIED_AIRCRAFT_ID + '''
+  </flightPlanCancellation>'''),
+
+    "trackInformation": root("trackInformation", '''
+  <trackInformation>''' + QUALIFIED_AIRCRAFT_ID + POSITION + TRACK_DATA + '''
+  </trackInformation>''', arr_arpt=None),
+
+    "boundaryCrossingUpdate": root("boundaryCrossingUpdate", '''
+  <boundaryCrossingUpdate>''' + QUALIFIED_AIRCRAFT_ID + POSITION + '''
+    <crossingPoint>
+      <latitudeDMS degrees="36" direction="NORTH" minutes="10" seconds="00"/>
+    </crossingPoint>
+  </boundaryCrossingUpdate>'''),
+
+    "oceanicReport": root("oceanicReport", '''
+  <oceanicReport>''' + QUALIFIED_AIRCRAFT_ID + POSITION + TRACK_DATA + '''
+  </oceanicReport>'''),
+
+    "FlightCreate": root("FlightCreate", '''
+  <ncsmFlightCreate>''' + QUALIFIED_AIRCRAFT_ID + AIRLINE_DATA + '''
+  </ncsmFlightCreate>'''),
+
+    "FlightModify": root("FlightModify", '''
+  <ncsmFlightModify>''' + QUALIFIED_AIRCRAFT_ID + AIRLINE_DATA + '''
+  </ncsmFlightModify>'''),
+
+    "FlightScheduleActivate": root("FlightScheduleActivate", '''
+  <ncsmFlightScheduleActivate>''' + QUALIFIED_AIRCRAFT_ID + ROUTE_DATA + '''
+  </ncsmFlightScheduleActivate>'''),
+
+    "FlightRoute": root("FlightRoute", '''
+  <ncsmFlightRoute>''' + QUALIFIED_AIRCRAFT_ID + ROUTE_DATA + '''
+  </ncsmFlightRoute>'''),
+
+    "FlightSectors": root("FlightSectors", '''
+  <ncsmFlightSectors>''' + QUALIFIED_AIRCRAFT_ID + '''
+    <sectorData sector="ZNY10" entryTime="2025-03-25T12:10:00Z" exitTime="2025-03-25T12:25:00Z"/>
+    <sectorData sector="ZDC72" entryTime="2025-03-25T12:25:00Z" exitTime="2025-03-25T13:05:00Z"/>
+  </ncsmFlightSectors>'''),
+
+    "FlightTimes": root("FlightTimes", '''
+  <ncsmFlightTimes>''' + QUALIFIED_AIRCRAFT_ID + '''
+    <etd etdType="ESTIMATED" timeValue="2025-03-25T12:25:00Z"/>
+    <eta etaType="ESTIMATED" timeValue="2025-03-25T15:10:00Z"/>
+  </ncsmFlightTimes>'''),
+}
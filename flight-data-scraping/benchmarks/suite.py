@@ -0,0 +1,315 @@
+"""
+Microbenchmarks of the per message hot paths of flight_plan_tracking and database_manager, saved as JSON baselines
+that later runs can be compared against.
+
+CPU cases run anywhere. The database cases (the airport code normalizer, the FBO assigner and the flight plan writer)
+need the test database: start it with `docker compose --profile test up test-db`, which listens on localhost:3306.
+They are skipped if it can't be reached. The writer case writes flight plans with BENCH flightRefs and deletes them afterwards.
+
+Usage: python suite.py run [--save baseline.json] [--compare baseline.json] [--filter TEXT] [--no-db]
+       python suite.py compare baseline.json current.json [--threshold 10]
+"""
+import argparse
+import contextlib
+from datetime import datetime, timezone
+import io
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'flight_plan_tracking'))
+sys.path.insert(0, os.path.join(ROOT, 'database_manager'))
+
+import orjson
+from common.flight_plan import FlightPlan, zulu_to_epoch, epoch_to_mysql_datetime
+from flightDataProcessor import FlightDataProcessor
+from flight_message_extractor import FlightMessageExtractor
+from insert_into_flight_plans_table import flight_plan_column_mask, flight_plan_row, upsert_statement
+from remove_from_flight_plans_table import delete_statement
+from sample_messages import SAMPLE_MESSAGES
+
+# Rows per statement when the database manager writes a full batch
+WRITE_BATCH_SIZE = 500
+
+
+def measure(operation, min_time, repeats):
+    """
+    Returns the seconds per call of operation for each repeat. Each repeat calls it in a loop for at least min_time seconds.
+    """
+    # Find how many calls take about min_time
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            operation()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 10 or loops >= 1 << 24:
+            break
+        loops *= 10
+    loops = max(1, int(loops * min_time / max(elapsed, 1e-9)))
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(loops):
+            operation()
+        times.append((time.perf_counter() - start) / loops)
+    return times
+
+
+def sample_flight_plan(i=0):
+    return FlightPlan(flight_ref=str(95000000 + i), acid="N123QS", dep_arpt="KTEB", arr_arpt="KPBI",
+                      etd=1742904300, eta=1742914200, status="SCHEDULED", model="C68A", fbo_id=3)
+
+
+# --- CPU cases ---
+
+def cpu_cases():
+    """
+    Returns (name, operation) for every case that doesn't need a database.
+    """
+    cases = []
+
+    processor = FlightDataProcessor()
+    extractor = FlightMessageExtractor()
+    for name, message in SAMPLE_MESSAGES.items():
+        # Only process_message is timed, the message is parsed once up front
+        flight_info = extractor.parse(message).get('fltdMessage')
+        cases.append((f"process_message.{name}", lambda flight_info=flight_info: processor.process_message(flight_info)))
+
+    zulu_time = "2025-03-25T12:05:00Z"
+    epoch = zulu_to_epoch(zulu_time)
+    current_time = int(time.time())
+    cases.append(("convert_zulu_to_epoch", lambda: FlightDataProcessor.convert_zulu_to_epoch(zulu_time)))
+    cases.append(("epoch_to_mysql_datetime", lambda: epoch_to_mysql_datetime(epoch)))
+    cases.append(("is_before_current_time", lambda: FlightDataProcessor.is_before_current_time(epoch, current_time)))
+
+    flight_plan = sample_flight_plan()
+    mask = flight_plan_column_mask(flight_plan)
+    cases.append(("sql.flight_plan_column_mask", lambda: flight_plan_column_mask(flight_plan)))
+    cases.append(("sql.flight_plan_row", lambda: flight_plan_row(flight_plan, mask)))
+    cases.append(("sql.upsert_statement.1", lambda: upsert_statement(mask, 1)))
+    cases.append((f"sql.upsert_statement.{WRITE_BATCH_SIZE}", lambda: upsert_statement(mask, WRITE_BATCH_SIZE)))
+    cases.append((f"sql.delete_statement.{WRITE_BATCH_SIZE}", lambda: delete_statement(WRITE_BATCH_SIZE)))
+
+    return cases
+
+
+# --- Database cases ---
+
+def database_available():
+    from common.db import shared_database, CONNECTION_ERRORS
+    try:
+        shared_database().fetch_one("SELECT 1;")
+        return True
+    except CONNECTION_ERRORS as e:
+        print("Error connecting to MySQL, skipping the database cases:", e)
+        return False
+
+
+def database_cases():
+    """
+    Returns (name, operation) for the cases that run against the test database, and a function that cleans up after them.
+    """
+    from common.db import shared_database
+    from airport_code_normalizer import Airport_code_normalizer
+    from aircraft_model_normalizer import Aircraft_model_normalizer
+    from fbo_assigner import Fbo_assigner
+    from flight_plans_writer import Flight_plans_writer
+
+    cases = []
+
+    normalizer = Airport_code_normalizer()
+    iata_plan = FlightPlan(flight_ref="95000001", acid="N123QS", dep_arpt="TEB", arr_arpt="PBI", status="SCHEDULED")
+    icao_plan = FlightPlan(flight_ref="95000001", acid="N123QS", dep_arpt="KTEB", arr_arpt="KPBI", status="SCHEDULED")
+
+    def normalize_iata():
+        iata_plan.dep_arpt = "TEB"
+        iata_plan.arr_arpt = "PBI"
+        normalizer.IATA_codes_to_ICAO_codes(iata_plan)
+
+    cases.append(("IATA_codes_to_ICAO_codes.iata", normalize_iata))
+    cases.append(("IATA_codes_to_ICAO_codes.icao", lambda: normalizer.IATA_codes_to_ICAO_codes(icao_plan)))
+    # The lookup made before the index has loaded, one query per code
+    cases.append(("IATA_codes_to_ICAO_codes.query", lambda: normalizer.query_icao_code("PBI")))
+
+    model_normalizer = Aircraft_model_normalizer()
+    specification_plan = FlightPlan(flight_ref="95000001", acid="N123QS", model="C68A/L", status="FLYING")
+
+    def normalize_model():
+        specification_plan.model = "C68A/L"
+        model_normalizer.normalize_model(specification_plan)
+
+    cases.append(("normalize_model", normalize_model))
+
+    fbo_assigner = Fbo_assigner()
+    counter = iter(range(10 ** 9))
+
+    def assign_new_flight():
+        # A new flight plan for one of 100 planes, so planes keep moving to new flights and the model stays the same size
+        i = next(counter)
+        flight_plan = FlightPlan(flight_ref=f"B{i:09d}", acid=f"N{100 + i % 100}QS", arr_arpt="KTEB", status="FLYING" if i % 2 else "SCHEDULED")
+        fbo_assigner.assign_fbo(flight_plan)
+
+    cases.append(("assign_fbo", assign_new_flight))
+
+    # The same with FBOs packed by parking area, for a mixed fleet
+    area_assigner = Fbo_assigner()
+    area_assigner.area_mode = True
+    area_assigner.reconcile()
+    models = ["E55P", "C68A", "CL35", "GLF6", "UNKNOWN"]
+
+    def assign_new_flight_by_area():
+        i = next(counter)
+        flight_plan = FlightPlan(flight_ref=f"B{i:09d}", acid=f"N{100 + i % 100}QS", arr_arpt="KTEB", status="FLYING" if i % 2 else "SCHEDULED", model=models[i % len(models)])
+        area_assigner.assign_fbo(flight_plan)
+
+    cases.append(("assign_fbo.area", assign_new_flight_by_area))
+    # The assignment made before the occupancy model has loaded, straight from the database
+    cases.append(("assign_fbo.query", lambda: fbo_assigner.assign_fbo_from_database(FlightPlan(flight_ref="B999999999", acid="N999QS", arr_arpt="KTEB", status="SCHEDULED"))))
+
+    database = shared_database()
+    writer = Flight_plans_writer(database, batch_size=WRITE_BATCH_SIZE)
+
+    def write_batch():
+        for i in range(WRITE_BATCH_SIZE):
+            flight_plan = sample_flight_plan()
+            flight_plan.flight_ref = f"BENCH{i:05d}"
+            writer.add(flight_plan)
+        writer.flush()
+
+    cases.append((f"flight_plans_writer.flush.{WRITE_BATCH_SIZE}", write_batch))
+
+    def clean_up():
+        database.execute("DELETE FROM flight_plans WHERE flightRef LIKE 'BENCH%';")
+        database.close()
+
+    return cases, clean_up
+
+
+# --- Results ---
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(args):
+    cases = cpu_cases()
+    clean_up = None
+    if not args.no_db and database_available():
+        # The normalizer and FBO assigner print their own progress, keep it out of the results
+        with contextlib.redirect_stdout(io.StringIO()):
+            db_cases, clean_up = database_cases()
+        cases.extend(db_cases)
+
+    results = dict()
+    try:
+        for name, operation in cases:
+            if args.filter and args.filter not in name:
+                continue
+            times = measure(operation, args.min_time, args.repeats)
+            median = statistics.median(times)
+            results[name] = {
+                'ns_per_op': median * 1e9,
+                'ops_per_sec': 1 / median,
+                'spread_pct': (max(times) - min(times)) / median * 100,
+            }
+            print(f"{name:50} {median * 1e9:14.0f} ns/op {1 / median:14.0f} ops/s  ±{results[name]['spread_pct'] / 2:.1f}%")
+    finally:
+        if clean_up is not None:
+            clean_up()
+
+    report = {
+        'created': datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+    if args.save:
+        with open(args.save, 'wb') as file:
+            file.write(orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS))
+        print(f"Saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare, 'rb') as file:
+            baseline = orjson.loads(file.read())
+        return compare(baseline, report, args.threshold)
+    return 0
+
+
+def compare(baseline, current, threshold):
+    """
+    Prints the change of each case from the baseline, and returns 1 if any case got slower by more than threshold percent.
+    """
+    print(f"Comparing against the baseline from {baseline.get('created')} (commit {baseline.get('commit')}), regressions are over {threshold:g}%")
+    regressions = []
+    for name in sorted(set(baseline['results']) | set(current['results'])):
+        before = baseline['results'].get(name)
+        after = current['results'].get(name)
+        if before is None or after is None:
+            print(f"{name:50} {'not in the baseline' if before is None else 'not run'}")
+            continue
+
+        change = (after['ns_per_op'] - before['ns_per_op']) / before['ns_per_op'] * 100
+        flag = ""
+        if change > threshold:
+            flag = "REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "faster"
+        print(f"{name:50} {before['ns_per_op']:12.0f} -> {after['ns_per_op']:12.0f} ns/op {change:+7.1f}%  {flag}")
+
+    if regressions:
+        print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('--save', default=None, help='write the results to this JSON file')
+    run_parser.add_argument('--compare', default=None, help='compare the results with this saved baseline')
+    run_parser.add_argument('--threshold', type=float, default=10.0, help='percent slower than the baseline that counts as a regression')
+    run_parser.add_argument('--filter', default=None, help='only run the cases whose name contains this')
+    run_parser.add_argument('--min-time', type=float, default=0.2, help='seconds each repeat runs for')
+    run_parser.add_argument('--repeats', type=int, default=5, help='repeats per case, the median is reported')
+    run_parser.add_argument('--no-db', action='store_true', help='skip the database cases')
+    run_parser.add_argument('--db-host', default=None, help='test database host (defaults to DB_HOST, or localhost)')
+
+    compare_parser = commands.add_parser('compare', help='compare two saved results')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=10.0, help='percent slower than the baseline that counts as a regression')
+
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        with open(args.baseline, 'rb') as file:
+            baseline = orjson.loads(file.read())
+        with open(args.current, 'rb') as file:
+            current = orjson.loads(file.read())
+        sys.exit(compare(baseline, current, args.threshold))
+
+    # Default to the test database from docker-compose.yml, set before the services read their .env files
+    os.environ['DB_HOST'] = args.db_host or os.getenv('DB_HOST', 'localhost')
+    os.environ.setdefault('DB_USER', 'user')
+    os.environ.setdefault('DB_PASSWORD', 'password')
+    os.environ.setdefault('DB_NAME', 'netjets')
+    sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+from collections import deque
+from contextlib import contextmanager
+import os
+import threading
+import time
+import mysql.connector
+from dotenv import load_dotenv
+
+
+class DatabaseUnavailable(Exception):
+    """
+    Raised when no connection can be handed out: the database can't be reached (and is waiting to be retried), or every connection in the pool is in use.
+    """
+
+
+# Errors that mean the connection or the server is the problem, not the statement, so the statement can be tried again later
+CONNECTION_ERRORS = (DatabaseUnavailable, mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError)
+
+
+def is_connection_error(error):
+    return isinstance(error, CONNECTION_ERRORS)
+
+
+# Deadlock and lock wait timeout, the transaction was rolled back through no fault of its own and can be run again straight away
+RETRYABLE_ERRNOS = (1205, 1213)
+
+
+def is_retryable_error(error):
+    return isinstance(error, mysql.connector.Error) and error.errno in RETRYABLE_ERRNOS
+
+
+class PooledConnection:
+    """
+    A connection handed out by a Database. Keeps one server side prepared statement per fixed query it has run,
+    so those queries are only parsed by MySQL once per connection.
+    """
+    def __init__(self, raw):
+        self.raw = raw
+        self.last_used = time.monotonic()
+        # sql -> (the sql string the statement was prepared with, prepared cursor)
+        self.statements = dict()
+
+    def cursor(self):
+        return self.raw.cursor()
+
+    def prepared(self, sql, params=()):
+        """
+        Runs a fixed query as a prepared statement and returns its cursor. The cursor is kept and reused for the next call with the same sql.
+        """
+        statement = self.statements.get(sql)
+        if statement is None:
+            statement = (sql, self.raw.cursor(prepared=True))
+            self.statements[sql] = statement
+        # The cursor only skips preparing again when it is given the same string object it was prepared with
+        prepared_sql, cursor = statement
+        cursor.execute(prepared_sql, tuple(params))
+        return cursor
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        try:
+            self.raw.close()
+        except Exception:
+            pass
+
+
+class Database:
+    """
+    Bounded pool of MySQL connections shared by every thread of a service.
+
+    Connections are checked out with `with database.connection() as connection:` and returned when the block ends.
+    A connection that has been idle for health_check_interval seconds is pinged before it is handed out, and replaced if it is dead.
+    A connection that raised a connection error is thrown away instead of going back to the pool.
+    When a new connection can't be opened, the next attempt waits with an exponential backoff (min_backoff up to max_backoff seconds),
+    and until then checkouts fail straight away with DatabaseUnavailable, so callers skip the database instead of stalling on it.
+    """
+    def __init__(self, host, user, password, database, pool_size=4, checkout_timeout=5.0, connect_timeout=5,
+                 health_check_interval=30.0, min_backoff=0.5, max_backoff=30.0):
+        self.connect_args = dict(host=host, user=user, password=password, database=database, connection_timeout=connect_timeout)
+        self.pool_size = max(pool_size, 1)
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        self.condition = threading.Condition()
+        # Idle connections, the most recently used last so busy periods keep reusing the same few
+        self.idle = deque()
+        self.open_connections = 0
+
+        # Consecutive failed connection attempts, and when the next one is allowed
+        self.failures = 0
+        self.retry_at = 0.0
+
+        self.stats = {
+            'connections_opened': 0,
+            'connect_failures': 0,
+            'connections_discarded': 0,
+            'checkout_timeouts': 0,
+        }
+
+    @classmethod
+    def from_env(cls, **overrides):
+        """
+        Makes a Database from the DB_* settings in the environment (or the .env file mounted to the docker image).
+        """
+        load_dotenv()
+        settings = dict(
+            host=os.getenv('DB_HOST'),
+            user=os.getenv('DB_USER'),
+            password=os.getenv('DB_PASSWORD'),
+            database=os.getenv('DB_NAME'),
+            pool_size=int(os.getenv('DB_POOL_SIZE', 4)),
+            checkout_timeout=float(os.getenv('DB_CHECKOUT_TIMEOUT', 5.0)),
+            connect_timeout=int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+            health_check_interval=float(os.getenv('DB_HEALTH_CHECK_INTERVAL', 30.0)),
+            max_backoff=float(os.getenv('DB_RECONNECT_MAX_BACKOFF', 30.0)),
+        )
+        settings.update(overrides)
+        return cls(**settings)
+
+    # --- Checkout ---
+
+    @contextmanager
+    def connection(self):
+        connection = self.checkout()
+        try:
+            yield connection
+        except BaseException as e:
+            if is_connection_error(e):
+                self.discard(connection)
+                connection = None
+            else:
+                # Don't hand out a connection in the middle of a failed transaction
+                try:
+                    connection.rollback()
+                except Exception:
+                    self.discard(connection)
+                    connection = None
+            raise
+        finally:
+            if connection is not None:
+                self.release(connection)
+
+    def checkout(self):
+        deadline = time.monotonic() + self.checkout_timeout
+        with self.condition:
+            while True:
+                if self.idle:
+                    connection = self.idle.pop()
+                    break
+                if self.open_connections < self.pool_size:
+                    # Take the slot now, so the pool never goes over its size while the connection is being opened
+                    self.open_connections += 1
+                    connection = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats['checkout_timeouts'] += 1
+                    raise DatabaseUnavailable(f"All {self.pool_size} database connections are in use")
+                self.condition.wait(remaining)
+
+        try:
+            if connection is not None and not self.healthy(connection):
+                self.stats['connections_discarded'] += 1
+                connection.close()
+                connection = None
+            if connection is None:
+                connection = self.open()
+        except BaseException:
+            with self.condition:
+                self.open_connections -= 1
+                self.condition.notify()
+            raise
+        return connection
+
+    def healthy(self, connection):
+        if time.monotonic() - connection.last_used < self.health_check_interval:
+            return True
+        try:
+            connection.raw.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def open(self):
+        with self.condition:
+            wait = self.retry_at - time.monotonic()
+        if wait > 0:
+            raise DatabaseUnavailable(f"Database is unreachable, retrying in {wait:.1f} s")
+
+        try:
+            raw = mysql.connector.connect(**self.connect_args)
+        except mysql.connector.Error as e:
+            with self.condition:
+                self.failures += 1
+                self.stats['connect_failures'] += 1
+                backoff = min(self.min_backoff * 2 ** (self.failures - 1), self.max_backoff)
+                self.retry_at = time.monotonic() + backoff
+            print(f"Error connecting to MySQL (retrying in {backoff:.1f} s):", e)
+            raise DatabaseUnavailable(str(e)) from e
+
+        with self.condition:
+            self.failures = 0
+            self.retry_at = 0.0
+            self.stats['connections_opened'] += 1
+        return PooledConnection(raw)
+
+    def release(self, connection):
+        connection.last_used = time.monotonic()
+        with self.condition:
+            self.idle.append(connection)
+            self.condition.notify()
+
+    def discard(self, connection):
+        connection.close()
+        with self.condition:
+            self.open_connections -= 1
+            self.stats['connections_discarded'] += 1
+            self.condition.notify()
+
+    # --- Queries ---
+
+    def fetch_all(self, sql, params=(), prepared=False):
+        """
+        Runs a query on a pooled connection and returns every row. The read transaction is ended, so the next read sees new data.
+        Fixed queries that run often should be prepared.
+        """
+        with self.connection() as connection:
+            if prepared:
+                rows = connection.prepared(sql, params).fetchall()
+            else:
+                cursor = connection.cursor()
+                cursor.execute(sql, tuple(params))
+                rows = cursor.fetchall()
+                cursor.close()
+            connection.commit()
+            return rows
+
+    def fetch_one(self, sql, params=(), prepared=False):
+        rows = self.fetch_all(sql, params, prepared)
+        return rows[0] if rows else None
+
+    def execute(self, sql, params=(), prepared=False):
+        """
+        Runs a statement on a pooled connection and commits it. Returns the number of rows it changed.
+        """
+        with self.connection() as connection:
+            if prepared:
+                row_count = connection.prepared(sql, params).rowcount
+            else:
+                cursor = connection.cursor()
+                cursor.execute(sql, tuple(params))
+                row_count = cursor.rowcount
+                cursor.close()
+            connection.commit()
+            return row_count
+
+    # --- State ---
+
+    def available(self):
+        """
+        False while the database is unreachable and waiting for its next connection attempt.
+        """
+        return self.seconds_until_retry() == 0
+
+    def seconds_until_retry(self):
+        with self.condition:
+            return max(0.0, self.retry_at - time.monotonic())
+
+    def info(self):
+        with self.condition:
+            return dict(self.stats, open_connections=self.open_connections, idle_connections=len(self.idle), pool_size=self.pool_size)
+
+    def close(self):
+        with self.condition:
+            while self.idle:
+                self.idle.pop().close()
+                self.open_connections -= 1
+
+
+# The database every module of a service shares, made the first time it is asked for
+shared = None
+shared_lock = threading.Lock()
+
+
+def shared_database():
+    global shared
+    with shared_lock:
+        if shared is None:
+            shared = Database.from_env()
+        return shared
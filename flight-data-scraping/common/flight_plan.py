@@ -0,0 +1,105 @@
+import time
+
+
+class FlightPlan:
+    """
+    A flight plan, as processed from the FAA SWIM messages by flight_plan_tracking and written to the database by database_manager.
+    Fields that a message didn't have are None. etd and eta are integer epoch seconds (UTC), and are only turned into
+    MySQL DATETIME strings when they are written to the database.
+    source_time is the sourceTimeStamp of the message (epoch seconds), used to measure how long it takes to reach the database.
+    """
+    __slots__ = ('flight_ref', 'acid', 'dep_arpt', 'arr_arpt', 'etd', 'eta', 'status', 'model', 'fbo_id', 'source_time')
+
+    def __init__(self, flight_ref=None, acid=None, dep_arpt=None, arr_arpt=None, etd=None, eta=None, status=None, model=None, fbo_id=None, source_time=None):
+        self.flight_ref = flight_ref
+        self.acid = acid
+        self.dep_arpt = dep_arpt
+        self.arr_arpt = arr_arpt
+        self.etd = etd
+        self.eta = eta
+        self.status = status
+        self.model = model
+        self.fbo_id = fbo_id
+        self.source_time = source_time
+
+    def to_dict(self):
+        """
+        Returns the fields that are set, for sending the flight plan as JSON.
+        """
+        return {field: getattr(self, field) for field in self.__slots__ if getattr(self, field) is not None}
+
+    @classmethod
+    def from_dict(cls, fields):
+        """
+        Builds a flight plan from its JSON dictionary. Missing fields are None and unknown keys are ignored.
+        """
+        return cls(*(fields.get(field) for field in cls.__slots__))
+
+    def merge(self, other):
+        """
+        Copies every field that is set in the other flight plan over this one. Fields that are None never overwrite a value.
+        """
+        for field in self.__slots__:
+            value = getattr(other, field)
+            if value is not None:
+                setattr(self, field, value)
+        return self
+
+    def copy(self):
+        return FlightPlan().merge(self)
+
+    def __eq__(self, other):
+        if not isinstance(other, FlightPlan):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self):
+        return "FlightPlan(" + ", ".join(f"{field}={value!r}" for field, value in self.to_dict().items()) + ")"
+
+
+# Days in each month of a non leap year
+DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def zulu_to_epoch(zulu_time):
+    """
+    Converts a Zulu (UTC) time string in the fixed format 'YYYY-MM-DDTHH:MM:SSZ' to integer epoch seconds.
+    Reads the digits straight out of the string instead of going through strptime.
+    Returns None if the string is not in that format or is not a real date.
+    """
+    if (zulu_time is None or len(zulu_time) != 20 or zulu_time[4] != '-' or zulu_time[7] != '-' or zulu_time[10] != 'T'
+            or zulu_time[13] != ':' or zulu_time[16] != ':' or zulu_time[19] != 'Z'):
+        return None
+    year, month, day = zulu_time[0:4], zulu_time[5:7], zulu_time[8:10]
+    hour, minute, second = zulu_time[11:13], zulu_time[14:16], zulu_time[17:19]
+    # int() would also take a sign, spaces or underscores
+    if not (year + month + day + hour + minute + second).isdecimal():
+        return None
+    year, month, day = int(year), int(month), int(day)
+    hour, minute, second = int(hour), int(minute), int(second)
+
+    if year < 1 or not 1 <= month <= 12 or hour > 23 or minute > 59 or second > 59 or day < 1:
+        return None
+    leap = month == 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+    if day > DAYS_IN_MONTH[month - 1] + leap:
+        return None
+
+    # Days since 1970-01-01 of a proleptic Gregorian date, counting years from March so the leap day is last
+    if month <= 2:
+        year -= 1
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    days = era * 146097 + day_of_era - 719468
+
+    return days * 86400 + hour * 3600 + minute * 60 + second
+
+
+def epoch_to_mysql_datetime(epoch):
+    """
+    Converts epoch seconds to a MySQL DATETIME string 'YYYY-MM-DD HH:MM:SS' (UTC).
+    """
+    if epoch is None:
+        return None
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(epoch))
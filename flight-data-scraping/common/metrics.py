@@ -0,0 +1,265 @@
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+import math
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds (seconds) of the latency histogram buckets, from 100 microseconds to 10 seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def escape_help(documentation):
+    # HELP lines escape backslashes and line feeds, but not quotes
+    return documentation.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def format_value(value):
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "NaN"
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+class Metric:
+    """
+    Base of every metric type. A metric with label names keeps one child per combination of label values.
+    """
+    kind = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+        self.children = dict()
+        # A metric without labels is exposed (as 0) before it is first used
+        if not self.label_names:
+            self.children[()] = self.new_child()
+
+    def labels(self, *values, **named_values):
+        if named_values:
+            values = tuple(named_values[name] for name in self.label_names)
+        if len(values) != len(self.label_names):
+            raise ValueError(f"{self.name} takes the labels {self.label_names}, got {values}")
+        values = tuple(str(value) for value in values)
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self.new_child())
+        return child
+
+    def unlabelled(self):
+        return self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {escape_help(self.documentation)}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            children = list(self.children.items())
+        for values, child in children:
+            lines.extend(child.render(self.name, self.label_names, values))
+        return lines
+
+
+class CounterChild:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def render(self, name, label_names, values):
+        return [f"{name}{format_labels(label_names, values)} {format_value(self.value)}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def new_child(self):
+        return CounterChild()
+
+    def inc(self, amount=1):
+        self.unlabelled().inc(amount)
+
+
+class GaugeChild:
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        # The value is read from function every time the metrics are scraped
+        self.function = function
+
+    def render(self, name, label_names, values):
+        value = self.value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                value = math.nan
+        return [f"{name}{format_labels(label_names, values)} {format_value(value)}"]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def new_child(self):
+        return GaugeChild()
+
+    def set(self, value):
+        self.unlabelled().set(value)
+
+    def set_function(self, function):
+        self.unlabelled().set_function(function)
+
+
+class HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Count per bucket (not cumulative), with the last one for values above every bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return Timer(self.observe)
+
+    def render(self, name, label_names, values):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{format_labels(label_names, values, [('le', format_value(float(bound)))])} {cumulative}")
+        lines.append(f"{name}_sum{format_labels(label_names, values)} {format_value(total)}")
+        lines.append(f"{name}_count{format_labels(label_names, values)} {cumulative}")
+        return lines
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, label_names)
+
+    def new_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.unlabelled().observe(value)
+
+    def time(self):
+        return self.unlabelled().time()
+
+
+class Timer:
+    """
+    Context manager that observes how many seconds its block took.
+    """
+    def __init__(self, observe):
+        self.observe = observe
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.observe(perf_counter() - self.start)
+        return False
+
+
+class Registry:
+    """
+    Holds a service's metrics and renders them in the Prometheus text format.
+    Metrics are made through the registry, and asking for a name that is already registered returns the same metric.
+    """
+    def __init__(self):
+        self.metrics = dict()
+        self.lock = threading.Lock()
+
+    def register(self, metric_type, name, documentation, label_names=(), **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = metric_type(name, documentation, label_names, **kwargs)
+                self.metrics[name] = metric
+            return metric
+
+    def counter(self, name, documentation, label_names=()):
+        return self.register(Counter, name, documentation, label_names)
+
+    def gauge(self, name, documentation, label_names=()):
+        return self.register(Gauge, name, documentation, label_names)
+
+    def histogram(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram, name, documentation, label_names, buckets=buckets)
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return ("\n".join(lines) + "\n").encode('utf-8')
+
+
+# The registry every module of a service registers its metrics with
+REGISTRY = Registry()
+
+
+def start_metrics_server(port, registry=REGISTRY):
+    """
+    Serves GET /metrics on its own thread, for services that don't already run a web server.
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Keep scrapes out of the logs
+            pass
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
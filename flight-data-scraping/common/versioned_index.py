@@ -0,0 +1,71 @@
+import threading
+import time
+
+from common.metrics import REGISTRY
+
+DATABASE_ERRORS = REGISTRY.counter('database_errors_total', 'Failed database connections and queries, by component', ('component',))
+
+
+class VersionedIndex:
+    """
+    Base of an index that is read from the database into memory, and reloaded by a background thread when its version changes,
+    or at least every ttl seconds (which also picks up changes the version doesn't show).
+    Subclasses implement get_index_version(), read_index() (the database reads) and use_index() (swaps in what was read),
+    and can override report(), which runs after every check.
+    """
+    # Label of database_errors_total, and what the errors are printed as
+    component = None
+    load_error = "Error loading index from database:"
+    refresh_error = "Error refreshing index:"
+
+    def __init__(self, database, check_interval, ttl):
+        self.database = database
+
+        # How often the background thread checks the version, and the max age of the index before it is reloaded regardless
+        self.refresh_check_interval = check_interval
+        self.ttl = ttl
+
+        self.index_version = None
+        self.index_loaded_time = None
+
+    def start(self):
+        """
+        Loads the index, and starts the background thread that keeps it fresh.
+        """
+        self.load_index()
+        self.refresh_thread = threading.Thread(target=self.refresh_index_loop, daemon=True)
+        self.refresh_thread.start()
+
+    def load_index(self):
+        try:
+            version = self.get_index_version()
+            index = self.read_index()
+        except Exception as e:
+            print(self.load_error, e)
+            DATABASE_ERRORS.labels(self.component).inc()
+            return
+
+        self.use_index(index)
+        self.index_version = version
+        self.index_loaded_time = time.monotonic()
+
+    def refresh_index(self):
+        """
+        Reloads the index if it is older than the TTL or its version has changed since it was loaded.
+        """
+        try:
+            expired = self.index_loaded_time is None or time.monotonic() - self.index_loaded_time >= self.ttl
+            if expired or self.get_index_version() != self.index_version:
+                self.load_index()
+        except Exception as e:
+            print(self.refresh_error, e)
+            DATABASE_ERRORS.labels(self.component).inc()
+
+    def refresh_index_loop(self):
+        while True:
+            time.sleep(self.refresh_check_interval)
+            self.refresh_index()
+            self.report()
+
+    def report(self):
+        pass
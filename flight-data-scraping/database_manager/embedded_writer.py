@@ -0,0 +1,58 @@
+from dotenv import load_dotenv
+import os
+import threading
+import time
+
+from common.db import shared_database
+from flight_plans_writer import Flight_plans_writer
+
+
+class Embedded_writer():
+    """ Runs the database manager's writer inside the flight_plan_tracking process, for small deployments and for benchmarking
+        the pipeline without the network in the way. Flight plans are taken straight from the in-memory flight plan queue
+        and handed to the Flight_plans_writer as objects, instead of being sent as JSON over the batch api and parsed again.
+        The queue wakes the writer as soon as a flight plan is put on it, so there is no polling delay either.
+    """
+    def __init__(self, queue, database=None):
+        load_dotenv()
+
+        self.queue = queue
+        self.database = database or shared_database()
+        self.writer = Flight_plans_writer.from_env(self.database)
+
+        # How many flight plans to take off the queue at once, and the longest wait for one to show up
+        self.batch_size = int(os.getenv('FLIGHT_PLANS_BATCH_SIZE', 500))
+        self.long_poll_timeout = float(os.getenv('FLIGHT_PLANS_LONG_POLL_TIMEOUT', 10))
+
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            self.step()
+
+    def step(self):
+        """
+        Takes one batch off the queue and flushes the writer if it is due. Returns the number of flight plans taken.
+        """
+        writer = self.writer
+
+        # While the database is down, stop taking flight plans and retry the pending writes each time the next connection attempt is due
+        if writer.pending and not self.database.available():
+            time.sleep(self.database.seconds_until_retry())
+            if writer.flush() is False and writer.pending:
+                return 0
+
+        # Don't wait past the point where the pending writes are due to be flushed
+        time_until_flush = writer.time_until_flush()
+        timeout = self.long_poll_timeout if time_until_flush is None else min(self.long_poll_timeout, time_until_flush)
+
+        flight_plans = self.queue.take(self.batch_size, timeout)
+        for flight_plan in flight_plans:
+            writer.add(flight_plan)
+
+        writer.maybe_flush()
+        return len(flight_plans)
@@ -0,0 +1,286 @@
+"""
+Materialized occupancy counters of every FBO and airport, kept in the fbo_occupancy table.
+
+Usage: python fbo_occupancy.py rebuild   (count everything again from netjets_fleet and flight_plans)
+       python fbo_occupancy.py check     (compare the counters with a fresh count, exits with 1 if they differ)
+"""
+from decimal import Decimal
+from dotenv import load_dotenv
+import argparse
+import os
+import sys
+import time
+
+from common.db import Database, DatabaseUnavailable
+
+# The counters row of a whole airport has this fbo_id, airport_parking ids start at 1
+AIRPORT_TOTAL = 0
+
+CREATE_SQL = """
+    CREATE TABLE IF NOT EXISTS fbo_occupancy (
+        airport varchar(10) NOT NULL,
+        fbo_id int NOT NULL,
+        planes int NOT NULL DEFAULT 0,
+        parked_planes int NOT NULL DEFAULT 0,
+        parking_area decimal(15,2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (airport, fbo_id)
+    );
+"""
+TABLE_EXISTS_SQL = "SHOW TABLES LIKE 'fbo_occupancy';"
+COUNTERS_SQL = "SELECT airport, fbo_id, planes, parked_planes, parking_area FROM fbo_occupancy;"
+DELETE_COUNTERS_SQL = "DELETE FROM fbo_occupancy;"
+AIRCRAFT_DATA_DATE_SQL = "SELECT date FROM last_updated WHERE type = 'AircraftData';"
+
+# Taken by every transaction that changes the counters, so a rebuild never runs between a flush's reads and its writes
+LOCK_SQL = "SELECT GET_LOCK('fbo_occupancy', %s);"
+UNLOCK_SQL = "SELECT RELEASE_LOCK('fbo_occupancy');"
+
+# Every plane counts at the FBO its flight plan is assigned to: as a plane, as a parked plane once it has arrived,
+# and by the parking area of its model (the largest row of the designator, like the FBO assigner)
+CONTRIBUTIONS_SQL = """
+    SELECT airport, fbo_id, COUNT(*), SUM(parked), SUM(parking_area) FROM (
+        SELECT COALESCE(airport_parking.Airport_Code, '') AS airport, flight_plans.fbo_id AS fbo_id, flight_plans.status = 'ARRIVED' AS parked,
+            CAST(COALESCE((SELECT MAX(aircraft_types.parkingArea) FROM aircraft_types WHERE aircraft_types.type = netjets_fleet.plane_type), 0) AS DECIMAL(15,2)) AS parking_area
+        FROM netjets_fleet
+        JOIN flight_plans ON netjets_fleet.flightRef = flight_plans.flightRef
+        JOIN airport_parking ON flight_plans.fbo_id = airport_parking.id
+        {where}
+    ) AS planes
+    GROUP BY airport, fbo_id;
+"""
+
+
+def contributions_statement(flight_ref_count=0, acid_count=0):
+    """
+    Returns the count of the planes pointing to one of flight_ref_count flight plans or being one of acid_count planes,
+    or of every plane when both are 0.
+    """
+    conditions = []
+    if flight_ref_count:
+        conditions.append("netjets_fleet.flightRef IN (" + ", ".join(["%s"] * flight_ref_count) + ")")
+    if acid_count:
+        conditions.append("netjets_fleet.acid IN (" + ", ".join(["%s"] * acid_count) + ")")
+    return CONTRIBUTIONS_SQL.format(where="WHERE " + " OR ".join(conditions) if conditions else "")
+
+
+def counters_upsert_statement(row_count):
+    """
+    Returns a statement that adds row_count (airport, fbo_id, planes, parked_planes, parking_area) changes to the counters.
+    """
+    return ("INSERT INTO fbo_occupancy (airport, fbo_id, planes, parked_planes, parking_area) VALUES " + ", ".join(["(%s, %s, %s, %s, %s)"] * row_count) +
+            " ON DUPLICATE KEY UPDATE planes = planes + VALUES(planes), parked_planes = parked_planes + VALUES(parked_planes), parking_area = parking_area + VALUES(parking_area)")
+
+
+def totals(rows):
+    """
+    Turns (airport, fbo_id, planes, parked_planes, parking_area) rows into {(airport, fbo_id): [planes, parked_planes, parking_area]},
+    with the airport totals added under AIRPORT_TOTAL.
+    """
+    counters = dict()
+    for airport, fbo_id, planes, parked_planes, parking_area in rows:
+        values = (int(planes or 0), int(parked_planes or 0), Decimal(parking_area or 0))
+        for key in ((airport, fbo_id), (airport, AIRPORT_TOTAL)):
+            counter = counters.setdefault(key, [0, 0, Decimal(0)])
+            for i, value in enumerate(values):
+                counter[i] += value
+    return counters
+
+
+class Fbo_occupancy():
+    """ Keeps the fbo_occupancy table, the planes, parked (ARRIVED) planes and parking area at every FBO and airport, in step with
+        netjets_fleet and flight_plans, so the occupancy of an FBO or airport is a single-row lookup instead of a join over every plane.
+        The flight plans writer counts the planes its batch touches before and after writing it, and adds the difference
+        to the counters in the same transaction, so arrivals, departures, cancellations and superseded flight plans are all counted.
+        The counters are rebuilt from scratch in the first transaction after a start, and when the aircraft data changes,
+        since that moves the parking area of planes no batch touches.
+    """
+    def __init__(self, lock_timeout=10, refresh_interval=60.0):
+        # How long a transaction waits for a rebuild that holds the lock, and how often the aircraft data date is checked
+        self.lock_timeout = lock_timeout
+        self.refresh_interval = refresh_interval
+
+        # Whether the table is known to exist, and whether the next transaction has to count everything again
+        self.table_ready = False
+        self.rebuild_needed = True
+        # The last_updated date of the aircraft data the counters were built with, the date seen by the transaction in progress, and when it was checked
+        self.aircraft_data_date = None
+        self.pending_date = None
+        self.last_date_check = None
+        # Whether the transaction in progress holds the lock
+        self.locked = False
+
+    @classmethod
+    def from_env(cls):
+        load_dotenv()
+        lock_timeout = int(os.getenv('FBO_OCCUPANCY_LOCK_TIMEOUT', 10))
+        refresh_interval = float(os.getenv('FBO_OCCUPANCY_REFRESH_INTERVAL', 60))
+        return cls(lock_timeout, refresh_interval)
+
+    def lock(self, cursor):
+        cursor.execute(LOCK_SQL, (self.lock_timeout,))
+        if cursor.fetchone()[0] != 1:
+            raise DatabaseUnavailable(f"Timed out after {self.lock_timeout} s waiting for a rebuild of fbo_occupancy")
+        self.locked = True
+
+    def unlock(self, cursor):
+        if not self.locked:
+            return
+        self.locked = False
+        # The lock goes with the connection if it was lost
+        try:
+            cursor.execute(UNLOCK_SQL)
+            cursor.fetchall()
+        except Exception:
+            pass
+
+    def ensure_table(self, cursor):
+        cursor.execute(TABLE_EXISTS_SQL)
+        if not cursor.fetchall():
+            cursor.execute(CREATE_SQL)
+            self.rebuild_needed = True
+        self.table_ready = True
+
+    def due(self):
+        """
+        True if the counters have to be rebuilt, or the aircraft data date is due to be checked, even by a transaction that doesn't touch any planes.
+        """
+        return self.rebuild_needed or self.last_date_check is None or time.monotonic() - self.last_date_check >= self.refresh_interval
+
+    def prepare(self, cursor):
+        """
+        Takes the lock for a transaction that changes the counters, and rebuilds them in it if they are due.
+        Returns True if they were rebuilt.
+        """
+        self.lock(cursor)
+        if not self.table_ready:
+            self.ensure_table(cursor)
+
+        now = time.monotonic()
+        if self.last_date_check is None or now - self.last_date_check >= self.refresh_interval:
+            cursor.execute(AIRCRAFT_DATA_DATE_SQL)
+            row = cursor.fetchone()
+            self.pending_date = row[0] if row is not None else None
+            self.last_date_check = now
+            if self.pending_date != self.aircraft_data_date:
+                self.rebuild_needed = True
+
+        if self.rebuild_needed:
+            self.rebuild(cursor)
+            return True
+        return False
+
+    def count(self, cursor, flight_refs, acids):
+        """
+        Returns the counters of the planes pointing to one of the flight refs or being one of the acids, as totals() does.
+        """
+        flight_refs = list(flight_refs)
+        acids = list(acids)
+        if not flight_refs and not acids:
+            return dict()
+        cursor.execute(contributions_statement(len(flight_refs), len(acids)), tuple(flight_refs + acids))
+        return totals(cursor.fetchall())
+
+    def apply(self, cursor, before, after):
+        """
+        Adds the difference between two counts of the same planes to the counters. Returns the number of counters changed.
+        """
+        rows = []
+        for key in before.keys() | after.keys():
+            old = before.get(key, (0, 0, Decimal(0)))
+            new = after.get(key, (0, 0, Decimal(0)))
+            change = [new[i] - old[i] for i in range(3)]
+            if any(change):
+                rows.append(key + tuple(change))
+
+        if rows:
+            cursor.execute(counters_upsert_statement(len(rows)), tuple(value for row in rows for value in row))
+        return len(rows)
+
+    def rebuild(self, cursor, chunk_size=500):
+        """
+        Counts every plane again and replaces the counters with the result. Returns the number of counters.
+        """
+        cursor.execute(contributions_statement())
+        rows = [key + tuple(counter) for key, counter in totals(cursor.fetchall()).items()]
+
+        cursor.execute(DELETE_COUNTERS_SQL)
+        for i in range(0, len(rows), chunk_size):
+            chunk = rows[i:i + chunk_size]
+            cursor.execute(counters_upsert_statement(len(chunk)), tuple(value for row in chunk for value in row))
+        return len(rows)
+
+    def rebuild_committed(self):
+        """
+        Records that the transaction the counters were rebuilt in has been committed. Until then, every transaction rebuilds them.
+        """
+        self.rebuild_needed = False
+        self.aircraft_data_date = self.pending_date
+
+    def differences(self, cursor):
+        """
+        Compares the counters with a fresh count of every plane.
+        Returns {(airport, fbo_id): (counters, counted)} for every counter that is off, run it in one transaction so both reads see the same data.
+        """
+        cursor.execute(COUNTERS_SQL)
+        stored = {(airport, fbo_id): [planes, parked_planes, Decimal(parking_area)] for airport, fbo_id, planes, parked_planes, parking_area in cursor.fetchall()}
+        cursor.execute(contributions_statement())
+        counted = totals(cursor.fetchall())
+
+        differences = dict()
+        for key in stored.keys() | counted.keys():
+            stored_counter = tuple(stored.get(key, (0, 0, Decimal(0))))
+            counted_counter = tuple(counted.get(key, (0, 0, Decimal(0))))
+            if stored_counter != counted_counter:
+                differences[key] = (stored_counter, counted_counter)
+        return differences
+
+
+def rebuild(database, occupancy):
+    with database.connection() as connection:
+        cursor = connection.cursor()
+        try:
+            occupancy.lock(cursor)
+            occupancy.ensure_table(cursor)
+            count = occupancy.rebuild(cursor)
+            connection.commit()
+        finally:
+            occupancy.unlock(cursor)
+        cursor.close()
+    print(f"FBO occupancy: rebuilt {count} counters")
+
+
+def check(database, occupancy):
+    with database.connection() as connection:
+        cursor = connection.cursor()
+        # Both reads see the same snapshot, and flushes change the counters in the same transaction as the planes, so no lock is needed
+        connection.commit()
+        cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY;")
+        differences = occupancy.differences(cursor)
+        connection.commit()
+        cursor.close()
+
+    if differences:
+        print("FBO occupancy counters differ from the planes ((airport, fbo id): ((planes, parked planes, parking area) in the counters, counted)):")
+        for key in sorted(differences):
+            print(f"  {key}: {differences[key]}")
+        print("Run `python fbo_occupancy.py rebuild` to count them again")
+        return False
+    print("FBO occupancy counters match the planes")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=('rebuild', 'check'))
+    args = parser.parse_args()
+
+    database = Database.from_env(pool_size=1)
+    occupancy = Fbo_occupancy.from_env()
+    if args.command == 'rebuild':
+        rebuild(database, occupancy)
+    elif not check(database, occupancy):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import time
+
+FLEET_SQL = "SELECT acid, flightRef, plane_type FROM netjets_fleet;"
+
+
+class Fleet_cache():
+    """ In-memory copy of the netjets_fleet table (acid -> [flightRef, plane_type]), so the flight plans writer
+        doesn't have to read the table to find the flight plan a plane points to, and can skip fleet rows that wouldn't change.
+        Only the database manager writes netjets_fleet, so the copy is kept up to date by applying each committed batch to it.
+        It is reloaded every refresh_interval seconds anyway, in case the table was edited by hand.
+    """
+    def __init__(self, refresh_interval=300.0):
+        self.refresh_interval = refresh_interval
+
+        # acid -> [flightRef, plane_type], or None until the table has been loaded
+        self.fleet = None
+        # flightRef -> acid
+        self.acid_by_ref = dict()
+        self.loaded_time = None
+
+    def ensure_loaded(self, cursor):
+        if self.fleet is None or time.monotonic() - self.loaded_time >= self.refresh_interval:
+            self.load(cursor)
+
+    def load(self, cursor):
+        cursor.execute(FLEET_SQL)
+        rows = cursor.fetchall()
+
+        self.fleet = {acid: [flight_ref, plane_type] for acid, flight_ref, plane_type in rows}
+        self.acid_by_ref = {flight_ref: acid for acid, flight_ref, _ in rows}
+        self.loaded_time = time.monotonic()
+
+    def invalidate(self):
+        self.fleet = None
+        self.acid_by_ref = dict()
+
+    def flight_ref(self, acid):
+        plane = self.fleet.get(acid)
+        return plane[0] if plane is not None else None
+
+    def unchanged(self, acid, flight_ref, model):
+        """
+        True if the fleet upsert for this plane would leave its row as it is.
+        """
+        plane = self.fleet.get(acid)
+        return plane is not None and plane[0] == flight_ref and (model is None or model == plane[1])
+
+    def apply(self, acid, flight_ref, model):
+        """
+        Records a fleet upsert once it has been committed.
+        """
+        if self.fleet is None:
+            return
+
+        # The upsert updates whichever row already has this flightRef, which can't be mirrored reliably, so read the table again instead
+        owner = self.acid_by_ref.get(flight_ref)
+        if owner is not None and owner != acid:
+            self.invalidate()
+            return
+
+        plane = self.fleet.get(acid)
+        if plane is None:
+            self.fleet[acid] = [flight_ref, model]
+        else:
+            self.acid_by_ref.pop(plane[0], None)
+            plane[0] = flight_ref
+            if model is not None:
+                plane[1] = model
+        self.acid_by_ref[flight_ref] = acid
+
+    def size(self):
+        return len(self.fleet) if self.fleet is not None else 0
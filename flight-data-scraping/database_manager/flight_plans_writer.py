@@ -0,0 +1,484 @@
+from dotenv import load_dotenv
+import json
+import os
+import time
+
+from common.db import is_connection_error, is_retryable_error
+from common.flight_plan import FlightPlan
+from common.metrics import REGISTRY
+from fbo_occupancy import Fbo_occupancy
+from fleet_cache import Fleet_cache
+from written_flight_plans import Written_flight_plans
+from insert_into_flight_plans_table import flight_plan_column_mask, flight_plan_row, upsert_statement
+from remove_from_flight_plans_table import delete_statement
+from update_fleet_table import fleet_upsert_statement
+
+# Upper bounds (seconds) of the freshness lag buckets, from 1 second to 1 day
+FRESHNESS_BUCKETS = (1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 24 * 3600)
+
+DB_WRITE_SECONDS = REGISTRY.histogram('flight_plans_db_write_seconds', 'Time to write one batch of flight plan operations in a single transaction')
+DB_ROWS = REGISTRY.counter('flight_plans_db_rows_total', 'Rows written by the flight plan writer, by operation', ('operation',))
+DB_ROWS_SKIPPED = REGISTRY.counter('flight_plans_db_rows_skipped_total', 'Rows the flight plan writer left alone because the database already has them, by operation', ('operation',))
+DB_COLUMNS = REGISTRY.counter('flight_plans_db_columns_total', 'Optional flight_plans columns in the upserts, by whether they were written or left out as unchanged', ('result',))
+DATABASE_ERRORS = REGISTRY.counter('database_errors_total', 'Failed database connections and queries, by component', ('component',))
+FRESHNESS_LAG = REGISTRY.histogram('flight_plan_freshness_lag_seconds', 'Time from the sourceTimeStamp of a message to its flight plan being committed to the database', buckets=FRESHNESS_BUCKETS)
+DB_RETRIES = REGISTRY.counter('flight_plans_db_retries_total', 'Flight plan transactions run again after a deadlock or lock wait timeout')
+DB_DROPPED = REGISTRY.counter('flight_plans_db_operations_dropped_total', 'Flight plan operations left out because the database would not take them')
+PENDING = REGISTRY.gauge('flight_plans_writer_pending', 'Flight plan operations waiting to be written')
+
+# Row counts kept for each flush
+COUNT_KEYS = ('upserted', 'upserts_unchanged', 'columns_written', 'columns_unchanged', 'deleted', 'fleet', 'fleet_unchanged', 'occupancy', 'occupancy_rebuilds', 'statements')
+
+
+def describe_operation(operation):
+    if operation[0] == 'upsert':
+        flight_plan = operation[1]
+        return f"upsert of flight plan {flight_plan.flight_ref} ({flight_plan.acid})"
+    if operation[0] == 'delete':
+        return f"delete of flight plan {operation[1]}"
+    _, acid, flight_ref, model = operation
+    return f"fleet update of {acid} to flight plan {flight_ref} (model {model})"
+
+
+def dead_letter_record(operation, error):
+    """
+    Returns the JSON record of an operation that was dropped, with what it would have written.
+    """
+    record = {'time': time.time(), 'operation': operation[0], 'error': str(error)}
+    if operation[0] == 'upsert':
+        record['flight_plan'] = operation[1].to_dict()
+    elif operation[0] == 'delete':
+        record['flight_ref'] = operation[1]
+    else:
+        _, record['acid'], record['flight_ref'], record['model'] = operation
+    return record
+
+
+
+class Flight_plans_writer():
+    """ Write-behind stage for the database manager.
+        Flight plans are collected in memory and written as a few multi-row statements in a single transaction,
+        once the batch reaches batch_size operations or the oldest pending operation is flush_interval seconds old.
+        The end state of the database is the same as writing every flight plan one at a time, in order.
+        Each batch is written on a connection checked out of the given Database pool.
+        The netjets_fleet table is mirrored in a Fleet_cache, so planes that still point to the same flight plan are not written again,
+        and the last values written to each flight plan are kept in Written_flight_plans, so upserts only send the columns that changed.
+        Given an Fbo_occupancy, the fbo_occupancy counters are changed in the same transaction as the planes and flight plans.
+        A batch the database won't take is split up until the operation it won't take is found, so only that one is dropped.
+    """
+    def __init__(self, database, batch_size=500, flush_interval=1.0, stats_interval=60.0, fleet_cache=None, written_flight_plans=None, occupancy=None,
+                 retries=3, retry_backoff=0.05, dead_letter_file=None):
+        self.database = database
+        self.fleet_cache = fleet_cache or Fleet_cache()
+        self.written_flight_plans = written_flight_plans or Written_flight_plans()
+        self.occupancy = occupancy
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats_interval = stats_interval
+        # Times a transaction is run again after a deadlock or lock wait timeout, the first wait in seconds, doubling each time
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        # Dropped operations are appended here as JSON lines, so they can be looked at and written by hand
+        self.dead_letter_file = dead_letter_file
+
+        # Pending operations, in the order they were received
+        # ('upsert', flight_plan), ('delete', flight_ref) or ('fleet', acid, flight_ref, model)
+        self.pending = []
+        self.first_pending_time = None
+        # sourceTimeStamps (epoch seconds) of the flight plans in the pending operations, for the freshness lag
+        self.pending_source_times = []
+        PENDING.set_function(lambda: len(self.pending))
+
+        self.stats = {
+            'flushes': 0,
+            'failed_flushes': 0,
+            'split_flushes': 0,
+            'retries': 0,
+            'dropped_operations': 0,
+            'operations': 0,
+            'flight_plan_rows_upserted': 0,
+            'flight_plan_rows_unchanged': 0,
+            'columns_written': 0,
+            'columns_unchanged': 0,
+            'flight_plan_rows_deleted': 0,
+            'fleet_rows_upserted': 0,
+            'fleet_rows_unchanged': 0,
+            'occupancy_counters_changed': 0,
+            'occupancy_rebuilds': 0,
+            'statements': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+        self.last_stats_print = time.monotonic()
+
+    @classmethod
+    def from_env(cls, database):
+        """
+        Makes the writer and its caches from the FLIGHT_PLANS_WRITE_*, FLEET_CACHE_*, FLIGHT_PLAN_* and FBO_OCCUPANCY_* settings in the environment.
+        """
+        load_dotenv()
+
+        # Flight plans are written to the database in batches, once either limit is reached
+        batch_size = int(os.getenv('FLIGHT_PLANS_WRITE_BATCH_SIZE', 500))
+        flush_interval = float(os.getenv('FLIGHT_PLANS_WRITE_FLUSH_INTERVAL', 1.0))
+        # How often the in-memory copy of netjets_fleet is read again from the database
+        fleet_cache_refresh_interval = float(os.getenv('FLEET_CACHE_REFRESH_INTERVAL', 300))
+        # How many flight plans to remember the last written values of, and the smallest ETA change (seconds) that is written
+        flight_plan_cache_size = int(os.getenv('FLIGHT_PLAN_CACHE_SIZE', 50000))
+        eta_threshold = float(os.getenv('FLIGHT_PLAN_ETA_THRESHOLD', 60))
+        # Times a transaction is run again after a deadlock or lock wait timeout
+        retries = int(os.getenv('FLIGHT_PLANS_WRITE_RETRIES', 3))
+        # Where the operations the database won't take are set aside
+        dead_letter_file = os.getenv('FLIGHT_PLANS_DEAD_LETTER_FILE', os.path.join('dead_letter', 'flight_plans.ndjson'))
+        # Keep the fbo_occupancy counters in step with the planes
+        occupancy_counters = os.getenv('FBO_OCCUPANCY_COUNTERS', 'True') == "True"
+
+        return cls(
+            database, batch_size, flush_interval,
+            fleet_cache=Fleet_cache(fleet_cache_refresh_interval),
+            written_flight_plans=Written_flight_plans(flight_plan_cache_size, eta_threshold),
+            occupancy=Fbo_occupancy.from_env() if occupancy_counters else None,
+            retries=retries,
+            dead_letter_file=dead_letter_file or None
+        )
+
+    def add(self, flight_plan):
+        """
+        Queues up the database changes for a single FlightPlan from the flight_plan_tracking microservice.
+        """
+        status = flight_plan.status
+        flight_ref = flight_plan.flight_ref
+
+        if flight_plan.source_time is not None:
+            self.pending_source_times.append(flight_plan.source_time)
+
+        # If the status is anything other than "CANCELLED", then insert the flight plan into the database
+        if status != "CANCELED":
+            if flight_ref is None or flight_plan.acid is None:
+                return
+            self.queue(('upsert', flight_plan))
+
+            # If the status is "FLYING", then make the fleet table point to this flight plan as the most "recent" flight plan (the flight plan that was most recently acitve)
+            if status == "FLYING":
+                self.queue(('fleet', flight_plan.acid, flight_ref, flight_plan.model))
+        else:
+            # The flight plan was cancelled, so we need to remove it from the flight plans
+            self.queue(('delete', flight_ref))
+
+    def queue(self, operation):
+        if not self.pending:
+            self.first_pending_time = time.monotonic()
+        self.pending.append(operation)
+
+    def time_until_flush(self):
+        """
+        Seconds until the pending operations are due to be flushed, or None if nothing is pending.
+        """
+        if not self.pending:
+            return None
+        return max(0.0, self.first_pending_time + self.flush_interval - time.monotonic())
+
+    def maybe_flush(self):
+        """
+        Flushes the pending operations if the batch is full or the oldest operation has waited long enough.
+        Returns the result of the flush, or None if it wasn't time to flush.
+        """
+        flushed = None
+        if self.pending and (len(self.pending) >= self.batch_size or self.time_until_flush() == 0):
+            flushed = self.flush()
+
+        if time.monotonic() - self.last_stats_print >= self.stats_interval:
+            self.print_stats()
+
+        return flushed
+
+    def flush(self):
+        """
+        Writes all pending operations to the database, in one transaction if it goes through.
+        A transaction that hits a deadlock or lock wait timeout is run again, up to retries times.
+        A batch that fails on any other statement error is split in half and each half written on its own, down to single operations,
+        so only the operation that can't be written (i.e. a value too long for its column) is dropped, and logged.
+        Returns False if the database couldn't be reached, otherwise True. The operations that weren't written then stay pending,
+        so they are written once it is back.
+        """
+        if not self.pending:
+            return True
+
+        operations = self.pending
+        source_times = self.pending_source_times
+        first_pending_time = self.first_pending_time
+        self.pending = []
+        self.pending_source_times = []
+        self.first_pending_time = None
+
+        start = time.perf_counter()
+        counts = dict.fromkeys(COUNT_KEYS, 0)
+        remaining, error = self.write_operations(operations, counts)
+        if remaining:
+            print(f"Error writing {len(remaining)} flight plan operations to the database:", error)
+            self.stats['failed_flushes'] += 1
+            DATABASE_ERRORS.labels('flight_plans_writer').inc()
+
+            # Writing the batch again is safe even if the commit did go through, since every statement sets rows to their final state
+            self.pending = remaining + self.pending
+            self.pending_source_times = source_times + self.pending_source_times
+            self.first_pending_time = first_pending_time
+            return False
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        committed_at = time.time()
+        for source_time in source_times:
+            FRESHNESS_LAG.observe(committed_at - source_time)
+        DB_WRITE_SECONDS.observe(elapsed_ms / 1000)
+        DB_ROWS.labels('upsert').inc(counts['upserted'])
+        DB_ROWS.labels('delete').inc(counts['deleted'])
+        DB_ROWS.labels('fleet').inc(counts['fleet'])
+        DB_ROWS.labels('occupancy').inc(counts['occupancy'])
+        DB_ROWS_SKIPPED.labels('upsert').inc(counts['upserts_unchanged'])
+        DB_ROWS_SKIPPED.labels('fleet').inc(counts['fleet_unchanged'])
+        DB_COLUMNS.labels('written').inc(counts['columns_written'])
+        DB_COLUMNS.labels('unchanged').inc(counts['columns_unchanged'])
+
+        self.stats['flushes'] += 1
+        self.stats['operations'] += len(operations)
+        self.stats['flight_plan_rows_upserted'] += counts['upserted']
+        self.stats['flight_plan_rows_unchanged'] += counts['upserts_unchanged']
+        self.stats['columns_written'] += counts['columns_written']
+        self.stats['columns_unchanged'] += counts['columns_unchanged']
+        self.stats['flight_plan_rows_deleted'] += counts['deleted']
+        self.stats['fleet_rows_upserted'] += counts['fleet']
+        self.stats['fleet_rows_unchanged'] += counts['fleet_unchanged']
+        self.stats['occupancy_counters_changed'] += counts['occupancy']
+        self.stats['occupancy_rebuilds'] += counts['occupancy_rebuilds']
+        self.stats['statements'] += counts['statements']
+        self.stats['last_flush_ms'] = elapsed_ms
+        self.stats['max_flush_ms'] = max(self.stats['max_flush_ms'], elapsed_ms)
+        self.stats['total_flush_ms'] += elapsed_ms
+        return True
+
+    def write_operations(self, operations, counts):
+        """
+        Writes the operations in as few transactions as possible, splitting a batch in half when it fails on a statement error,
+        and dropping an operation that fails on its own. The row counts of the committed transactions are added to counts.
+        Returns the operations that weren't written because the database couldn't be reached (in order), and the error.
+        """
+        # Batches still to write, the next one last
+        batches = [operations]
+        while batches:
+            batch = batches.pop()
+            try:
+                self.commit(batch, counts)
+            except Exception as e:
+                if is_connection_error(e):
+                    return [operation for remaining in [batch] + batches[::-1] for operation in remaining], e
+
+                DATABASE_ERRORS.labels('flight_plans_writer').inc()
+                if len(batch) == 1:
+                    self.drop(batch[0], e)
+                    continue
+                if batch is operations:
+                    print(f"Error writing {len(batch)} flight plan operations to the database, writing them in smaller batches:", e)
+                    self.stats['split_flushes'] += 1
+                middle = len(batch) // 2
+                batches.append(batch[middle:])
+                batches.append(batch[:middle])
+        return [], None
+
+    def commit(self, operations, counts):
+        """
+        Writes the operations in one transaction, running it again after a deadlock or lock wait timeout, and updates the caches once it is committed.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                with self.database.connection() as connection:
+                    cursor = connection.cursor()
+                    try:
+                        batch_counts, changes = self.write(cursor, operations)
+                        connection.commit()
+                    finally:
+                        if self.occupancy is not None:
+                            self.occupancy.unlock(cursor)
+                    cursor.close()
+                break
+            except Exception as e:
+                if not is_retryable_error(e) or attempt == self.retries:
+                    raise
+                self.stats['retries'] += 1
+                DB_RETRIES.inc()
+                time.sleep(self.retry_backoff * 2 ** attempt)
+
+        self.apply_committed(*changes)
+        if batch_counts['occupancy_rebuilds']:
+            self.occupancy.rebuild_committed()
+        for key, count in batch_counts.items():
+            counts[key] += count
+
+    def drop(self, operation, error):
+        """
+        Leaves out an operation the database won't take, so the rest of its batch can be written.
+        """
+        where = f"setting it aside in {self.dead_letter_file}" if self.dead_letter_file else "dropping it"
+        print(f"Error writing flight plan operation {describe_operation(operation)}, {where}:", error)
+        self.stats['dropped_operations'] += 1
+        DB_DROPPED.inc()
+
+        if self.dead_letter_file is None:
+            return
+        try:
+            directory = os.path.dirname(self.dead_letter_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.dead_letter_file, 'a') as f:
+                f.write(json.dumps(dead_letter_record(operation, error)) + "\n")
+        except OSError as e:
+            print("Error writing to the dead letter file:", e)
+
+    def write(self, cursor, operations):
+        """
+        Collapses the operations into their final effect on each row, then writes it with multi-row statements.
+        Upserts are cut down to the columns that changed since they were last written.
+        The planes the batch touches are counted before and after it is written, and the difference is added to the occupancy counters.
+        Returns the row counts, and the (deleted flight refs, flight plan upserts, fleet upserts) to apply to the caches once the transaction is committed.
+        """
+        # Find out which flight plan each plane in this batch is currently linked to
+        acids = {operation[1] for operation in operations if operation[0] == 'fleet'}
+        current_flight_refs = dict()
+        if acids:
+            self.fleet_cache.ensure_loaded(cursor)
+            current_flight_refs = {acid: self.fleet_cache.flight_ref(acid) for acid in acids}
+
+        # flight_ref -> [deleted first, FlightPlan merged from the upserts after the delete (or None)]
+        flight_plans = dict()
+        # acid -> [flight_ref, model]
+        fleet = dict()
+
+        def delete(flight_ref):
+            flight_plans[flight_ref] = [True, None]
+
+        for operation in operations:
+            if operation[0] == 'upsert':
+                flight_plan = operation[1]
+                state = flight_plans.setdefault(flight_plan.flight_ref, [False, None])
+                if state[1] is None:
+                    state[1] = FlightPlan()
+                # Later values overwrite earlier ones, and None values never overwrite anything, just like running the upserts in order
+                state[1].merge(flight_plan)
+
+            elif operation[0] == 'delete':
+                delete(operation[1])
+
+            else:
+                _, acid, flight_ref, model = operation
+
+                # If the plane was linked to a different flight plan, that flight plan gets removed
+                current_flight_ref = current_flight_refs.get(acid)
+                if current_flight_ref is not None and current_flight_ref != flight_ref:
+                    delete(current_flight_ref)
+                current_flight_refs[acid] = flight_ref
+
+                previous = fleet.get(acid)
+                if model is None and previous is not None:
+                    model = previous[1]
+                fleet[acid] = [flight_ref, model]
+
+        counts = dict.fromkeys(COUNT_KEYS, 0)
+
+        deletes = [flight_ref for flight_ref, state in flight_plans.items() if state[0]]
+
+        # Leave out the columns that already have these values, then group the upserts by the columns they write, so each group can share one statement
+        upserts = []
+        upserts_by_mask = dict()
+        for flight_ref, state in flight_plans.items():
+            if state[1] is None:
+                continue
+
+            changed, columns_unchanged = self.written_flight_plans.changes(state[1], deleted=state[0])
+            counts['columns_unchanged'] += columns_unchanged
+            if changed is None:
+                counts['upserts_unchanged'] += 1
+                continue
+
+            upserts.append(changed)
+            mask = flight_plan_column_mask(changed)
+            counts['columns_written'] += bin(mask).count("1")
+            upserts_by_mask.setdefault(mask, []).append(flight_plan_row(changed, mask))
+
+        # Point the planes at their newest flying flight plans, leaving out the planes whose row already says the same
+        fleet_changes = []
+        for acid, (flight_ref, model) in fleet.items():
+            if self.fleet_cache.unchanged(acid, flight_ref, model):
+                counts['fleet_unchanged'] += 1
+            else:
+                fleet_changes.append((acid, flight_ref, model))
+
+        # Count the planes whose FBO, status or model the batch can change, before and after it is written
+        occupancy_refs = set(deletes) | {flight_plan.flight_ref for flight_plan in upserts} | {flight_ref for _, flight_ref, _ in fleet_changes}
+        occupancy_acids = {acid for acid, _, _ in fleet_changes}
+        count_occupancy = self.occupancy is not None and (occupancy_refs or occupancy_acids or self.occupancy.due())
+        if count_occupancy:
+            if self.occupancy.prepare(cursor):
+                counts['occupancy_rebuilds'] += 1
+            occupancy_before = self.occupancy.count(cursor, occupancy_refs, occupancy_acids)
+
+        # Deletes go first, since every upsert left in a flight plan's state happened after its delete
+        for chunk in self.chunks(deletes):
+            cursor.execute(delete_statement(len(chunk)), tuple(chunk))
+            counts['deleted'] += len(chunk)
+            counts['statements'] += 1
+
+        for mask, rows in upserts_by_mask.items():
+            for chunk in self.chunks(rows):
+                cursor.execute(upsert_statement(mask, len(chunk)), tuple(value for row in chunk for value in row))
+                counts['upserted'] += len(chunk)
+                counts['statements'] += 1
+
+        # Finally, the fleet rows
+        for with_model in (True, False):
+            rows = [(acid, model, flight_ref) if with_model else (acid, flight_ref)
+                    for acid, flight_ref, model in fleet_changes if (model is not None) == with_model]
+            for chunk in self.chunks(rows):
+                cursor.execute(fleet_upsert_statement(with_model, len(chunk)), tuple(value for row in chunk for value in row))
+                counts['fleet'] += len(chunk)
+                counts['statements'] += 1
+
+        if count_occupancy:
+            occupancy_after = self.occupancy.count(cursor, occupancy_refs, occupancy_acids)
+            counts['occupancy'] = self.occupancy.apply(cursor, occupancy_before, occupancy_after)
+
+        return counts, (deletes, upserts, fleet_changes)
+
+    def apply_committed(self, deletes, upserts, fleet_changes):
+        """
+        Updates the caches with a batch that has been committed, in the order it was written.
+        """
+        for flight_ref in deletes:
+            self.written_flight_plans.remove(flight_ref)
+        for flight_plan in upserts:
+            self.written_flight_plans.apply(flight_plan)
+        for acid, flight_ref, model in fleet_changes:
+            self.fleet_cache.apply(acid, flight_ref, model)
+
+    def chunks(self, rows):
+        for i in range(0, len(rows), self.batch_size):
+            yield rows[i:i + self.batch_size]
+
+    def print_stats(self):
+        """
+        Prints the flush stats, so the batch size and flush interval can be tuned.
+        """
+        self.last_stats_print = time.monotonic()
+
+        flushes = self.stats['flushes']
+        if flushes == 0:
+            return
+
+        print(
+            f"Flight plan writer: {flushes} flushes ({self.stats['failed_flushes']} failed, {self.stats['split_flushes']} split, {self.stats['retries']} retries, {self.stats['dropped_operations']} operations dropped), "
+            f"{self.stats['operations'] / flushes:.1f} operations/flush, "
+            f"{self.stats['flight_plan_rows_upserted']} upserted ({self.stats['flight_plan_rows_unchanged']} unchanged, {self.stats['columns_unchanged']} of {self.stats['columns_written'] + self.stats['columns_unchanged']} columns unchanged), {self.stats['flight_plan_rows_deleted']} deleted, "
+            f"{self.stats['fleet_rows_upserted']} fleet rows ({self.stats['fleet_rows_unchanged']} unchanged), "
+            f"{self.stats['occupancy_counters_changed']} occupancy counters changed ({self.stats['occupancy_rebuilds']} rebuilds), {self.stats['statements']} statements, "
+            f"flush latency avg {self.stats['total_flush_ms'] / flushes:.1f} ms / max {self.stats['max_flush_ms']:.1f} ms / last {self.stats['last_flush_ms']:.1f} ms"
+        )
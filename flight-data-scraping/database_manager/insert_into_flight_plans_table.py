@@ -1,79 +1,89 @@
+from functools import lru_cache
+
+from common.flight_plan import epoch_to_mysql_datetime
+
+# The flight_plans columns that are only written when the flight plan has a value for them, in column mask bit order
+# (flight plan field, flight_plans column)
+OPTIONAL_COLUMNS = (
+    ('dep_arpt', 'departing_airport'),
+    ('arr_arpt', 'arrival_airport'),
+    ('etd', 'etd'),
+    ('eta', 'eta'),
+    ('status', 'status'),
+    ('fbo_id', 'fbo_id'),
+)
+
+# Flight plan fields kept as epoch seconds, that are only turned into DATETIME strings here, as the statement parameters are built
+DATETIME_FIELDS = ('etd', 'eta')
+
+
+def flight_plan_column_mask(flight_plan):
+    """
+    Returns a bit mask of which optional columns are non-None in the flight plan.
+    Flight plans with the same mask can share the same SQL statement.
+    """
+    mask = 0
+    for bit, (field, _) in enumerate(OPTIONAL_COLUMNS):
+        if getattr(flight_plan, field) is not None:
+            mask |= 1 << bit
+    return mask
+
+
+def flight_plan_row(flight_plan, mask):
+    """
+    Returns the statement parameters for one flight plan, in the column order used by the statement for this mask.
+    """
+    row = [flight_plan.flight_ref, flight_plan.acid]
+    for bit, (field, _) in enumerate(OPTIONAL_COLUMNS):
+        if mask & (1 << bit):
+            value = getattr(flight_plan, field)
+            row.append(epoch_to_mysql_datetime(value) if field in DATETIME_FIELDS else value)
+    return row
+
+
+@lru_cache(maxsize=None)
+def upsert_statement_parts(mask):
+    """
+    Builds (and caches) the pieces of the INSERT ... ON DUPLICATE KEY UPDATE statement for a column mask.
+    There are only 2^6 masks, so every statement shape is only ever built once.
+    Returns the statement head, the placeholder group for one row, and the update clause.
+    """
+    # Always include flightRef and acid
+    columns = ['flightRef', 'acid']
+    for bit, (_, column) in enumerate(OPTIONAL_COLUMNS):
+        if mask & (1 << bit):
+            columns.append(column)
+
+    head = "INSERT INTO flight_plans (" + ", ".join(columns) + ") VALUES "
+    row_placeholder = "(" + ", ".join(["%s"] * len(columns)) + ")"
+
+    # Only UPDATE the columns that were given, the others will just stay as the same value they were before
+    updates = " ON DUPLICATE KEY UPDATE " + ", ".join(column + " = VALUES(" + column + ")" for column in columns[1:])
+
+    return head, row_placeholder, updates
+
+
+def upsert_statement(mask, row_count):
+    """
+    Returns a multi-row upsert statement for row_count flight plans that all have the same column mask.
+    """
+    head, row_placeholder, updates = upsert_statement_parts(mask)
+    return head + ", ".join([row_placeholder] * row_count) + updates
+
+
 def insert_into_flight_plans_table(connection, flight_plan):
     """
-    Inserts flight plan data into the flight_plans table. Builds the SQL dynamically so that only
+    Inserts a FlightPlan into the flight_plans table. Builds the SQL dynamically so that only
     non-None fields are included. The SQL statment will only UPDATE columns that are non-None, the others will just stay
     as the same value they were before.
     """
 
-    flight_ref = flight_plan.get('flight_ref')
-    acid = flight_plan.get('acid')
-    dep_arpt = flight_plan.get('dep_arpt')
-    arr_arpt = flight_plan.get('arr_arpt')
-    etd = flight_plan.get('etd')
-    eta = flight_plan.get('eta')
-    status = flight_plan.get('status')
-    fbo_id = flight_plan.get('fbo_id')
-
-    if flight_ref is None or acid is None:
+    if flight_plan.flight_ref is None or flight_plan.acid is None:
         return
 
-    # Start building the query parts
-    sql = "INSERT INTO flight_plans (flightRef"
-    values = " VALUES (%s"
-    updates = " ON DUPLICATE KEY UPDATE "
-    params = [flight_ref]
-
-    # Always include acid
-    sql += ", acid"
-    values += ", %s"
-    updates += "acid = VALUES(acid), "
-    params.append(acid)
-
-    # Dynamically append columns and values based on which fields are not None
-    if dep_arpt is not None:
-        sql += ", departing_airport"
-        values += ", %s"
-        updates += "departing_airport = VALUES(departing_airport), "
-        params.append(dep_arpt)
-
-    if arr_arpt is not None:
-        sql += ", arrival_airport"
-        values += ", %s"
-        updates += "arrival_airport = VALUES(arrival_airport), "
-        params.append(arr_arpt)
-
-    if etd is not None:
-        sql += ", etd"
-        values += ", %s"
-        updates += "etd = VALUES(etd), "
-        params.append(etd)
-
-    if eta is not None:
-        sql += ", eta"
-        values += ", %s"
-        updates += "eta = VALUES(eta), "
-        params.append(eta)
-
-    if status is not None:
-        sql += ", status"
-        values += ", %s"
-        updates += "status = VALUES(status), "
-        params.append(status)
-
-    if fbo_id is not None:
-        sql += ", fbo_id"
-        values += ", %s"
-        updates += "fbo_id = VALUES(fbo_id), "
-        params.append(fbo_id)
-
-    # Close the column and values parts
-    sql += ")" + values + ")"
-
-    # Append the update clause if any extra fields were added.
-    # Remove the trailing comma and space from the updates clause.
-    if updates.strip() != "ON DUPLICATE KEY UPDATE":
-        updates = updates.rstrip(", ")
-        sql += updates
+    mask = flight_plan_column_mask(flight_plan)
+    sql = upsert_statement(mask, 1)
+    params = flight_plan_row(flight_plan, mask)
 
     try:
         cursor = connection.cursor()
@@ -81,4 +91,4 @@ def insert_into_flight_plans_table(connection, flight_plan):
         connection.commit()
         cursor.close()
     except Exception as e:
-        print("Error inserting into flight_plans:", e)
\ No newline at end of file
+        print("Error inserting into flight_plans:", e)
@@ -1,75 +1,123 @@
-import mysql.connector
 from dotenv import load_dotenv
 import os
-import requests
 import time
+import requests
 
-from insert_into_flight_plans_table import insert_into_flight_plans_table
-from update_fleet_table import update_fleet_table
-from remove_from_flight_plans_table import remove_from_flight_plans_table
+from common.db import Database
+from common.flight_plan import FlightPlan
+from common.metrics import start_metrics_server
+from flight_plans_writer import Flight_plans_writer
+
+
+def fetch_flight_plans(session, api_url, batch_size, long_poll_timeout, offset=None):
+    """
+    Pulls up to batch_size flight plans from the batch api endpoint in a single request.
+    The api holds the request open for up to long_poll_timeout seconds when there are no flight plans queued, so there is no need to sleep between calls.
+    When the api keeps flight plans in its log, the batch starts at offset (or at the last committed offset if None).
+    Returns the flight plans and the offset to read from next (None if the api doesn't use a log).
+    """
+    params = {'max': batch_size, 'timeout': long_poll_timeout}
+    if offset is not None:
+        params['offset'] = offset
+
+    response = session.get(
+        api_url,
+        params=params,
+        # Give the server enough time to finish its long poll before giving up on the request
+        timeout=long_poll_timeout + 5
+    )
+    response.raise_for_status()
+    body = response.json()
+    return body['flight_plans'], body.get('next_offset')
+
+
+def commit_offset(session, commit_url, offset):
+    """
+    Tells the api every flight plan before offset is in the database, so they are not sent again after a restart.
+    """
+    response = session.post(commit_url, json={'consumer': 'database_manager', 'offset': offset}, timeout=5)
+    response.raise_for_status()
 
-if __name__ == "__main__":
 
-    # Maintain a connection to the database
-    while True:
-        # Get the databse conneciton info from the .env file that was mounted to this docker image
-        load_dotenv()
-
-        # The api for grabbing flight plan objects, as prcoessed by the flight_plan_tracking microservice
-        API_URL = os.getenv('FLIGHT_PLANS_API')
-
-        DEBUG = os.getenv('DEBUG')
-        # If debug is True, then use debugpy to connect this container to a local debugger 
-        if DEBUG == "True":
-            import debugpy
-            debugpy.listen(("0.0.0.0", 5679))  # Listen on all interfaces at port 5679
-            print("Waiting for debugger to attach...")
-            debugpy.wait_for_client()  # Wait until the debugger is connected
-            print("Debugger is attached.")
-
-        # Establish MySQL connection
-        try:
-            connection = mysql.connector.connect(
-                host=os.getenv('DB_HOST'),
-                user=os.getenv('DB_USER'),
-                password=os.getenv('DB_PASSWORD'),
-                database=os.getenv('DB_NAME')
-            )
-
-        except mysql.connector.Error as e:
-            print("Error connecting to MySQL:", e)
-
-        while connection:
-            # Pull flight plan dictionaries from the api endpoint
-            try:
-                flight_plan = dict()
-                response = requests.get(API_URL)
-                flight_plan = response.json()['flight_plan']
+if __name__ == "__main__":
 
-            except requests.exceptions.RequestException as e:
-                print("Error requesting from flight plans API:", e)
-                break
+    # Get the databse conneciton info from the .env file that was mounted to this docker image
+    load_dotenv()
 
-            if flight_plan:
-                status = flight_plan.get('status')
+    # Serve the write latency, row counts, database errors and freshness lag at GET /metrics
+    start_metrics_server(int(os.getenv('DATABASE_MANAGER_METRICS_PORT', 9100)))
 
-                # If the status is anything other than "CANCELLED", then insert the flight plan into the database
-                if status != "CANCELED":
-                    insert_into_flight_plans_table(connection, flight_plan)
+    # The batch api for grabbing flight plan objects, as prcoessed by the flight_plan_tracking microservice
+    API_URL = os.getenv('FLIGHT_PLANS_BATCH_API')
+    BATCH_SIZE = int(os.getenv('FLIGHT_PLANS_BATCH_SIZE', 500))
+    LONG_POLL_TIMEOUT = float(os.getenv('FLIGHT_PLANS_LONG_POLL_TIMEOUT', 10))
+    # Where to commit the offset of the written flight plans, when the api keeps them in a log
+    COMMIT_URL = os.getenv('FLIGHT_PLANS_COMMIT_API') or f"{API_URL}/commit"
 
-                    # If the status is "FLYING", then make the fleet table point to this flight plan as the most "recent" flight plan (the flight plan that was most recently acitve)
-                    if status == "FLYING":
-                        update_fleet_table(connection, flight_plan.get('acid'), flight_plan.get('flight_ref'), flight_plan.get('model'))
-                else:
-                    # The flight plan was cancelled, so we need to remove it from the flight plans
-                    remove_from_flight_plans_table(connection, flight_plan.get('flight_ref'))
+    DEBUG = os.getenv('DEBUG')
+    # If debug is True, then use debugpy to connect this container to a local debugger
+    if DEBUG == "True":
+        import debugpy
+        debugpy.listen(("0.0.0.0", 5679))  # Listen on all interfaces at port 5679
+        print("Waiting for debugger to attach...")
+        debugpy.wait_for_client()  # Wait until the debugger is connected
+        print("Debugger is attached.")
 
-            # Sleep for a short period to avoid overwhelming the API
-            time.sleep(0.2)
+    # The connection pool reconnects on its own, backing off while the database is down
+    database = Database.from_env()
 
+    # Reuse one keep-alive HTTP connection for every batch request
+    session = requests.Session()
 
+    # Flight plans are written to the database in batches (FLIGHT_PLANS_WRITE_BATCH_SIZE and FLIGHT_PLANS_WRITE_FLUSH_INTERVAL)
+    writer = Flight_plans_writer.from_env(database)
 
+    # Offset to read the next batch from (None starts from the last committed offset), and the last offset committed
+    offset = None
+    committed_offset = None
 
+    while True:
+        # While the database is down, stop reading and retry the pending writes each time the next connection attempt is due
+        if writer.pending and not database.available():
+            time.sleep(database.seconds_until_retry())
+            if writer.flush() is False and writer.pending:
+                continue
 
+        # Don't long poll past the point where the pending writes are due to be flushed
+        time_until_flush = writer.time_until_flush()
+        long_poll_timeout = LONG_POLL_TIMEOUT if time_until_flush is None else min(LONG_POLL_TIMEOUT, time_until_flush)
 
-   
\ No newline at end of file
+        # Pull a batch of flight plans from the api endpoint
+        try:
+            flight_plans, next_offset = fetch_flight_plans(session, API_URL, BATCH_SIZE, long_poll_timeout, offset)
+
+        except requests.exceptions.RequestException as e:
+            # The api's log has no flight plan starting at offset (i.e. the log was replaced), so read from the committed offset again
+            if isinstance(e, requests.exceptions.HTTPError) and e.response.status_code == 400 and offset is not None:
+                print(f"Flight plans API rejected offset {offset}, reading from the committed offset instead:", e)
+                offset = None
+                committed_offset = None
+                continue
+
+            print("Error requesting from flight plans API:", e)
+            writer.flush()
+            # Start over with a new HTTP connection, after a pause so an api that is down isn't hammered
+            session = requests.Session()
+            time.sleep(1)
+            continue
+
+        for flight_plan in flight_plans:
+            writer.add(FlightPlan.from_dict(flight_plan))
+        if next_offset is not None:
+            offset = next_offset
+
+        writer.maybe_flush()
+
+        # A failed flush keeps its operations pending until the database is back, and the writer sets aside the ones the database won't take,
+        # so once nothing is pending everything read so far is in the database or the dead letter file
+        if offset is not None and not writer.pending and offset != committed_offset:
+            try:
+                commit_offset(session, COMMIT_URL, offset)
+                committed_offset = offset
+            except requests.exceptions.RequestException as e:
+                print("Error committing flight plans offset:", e)
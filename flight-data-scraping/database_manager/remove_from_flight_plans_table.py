@@ -12,4 +12,11 @@ def remove_from_flight_plans_table(connection, flight_ref):
         connection.commit()
         cursor.close()
     except Exception as e:
-        print("Error deleting from flight_plans:", e)
\ No newline at end of file
+        print("Error deleting from flight_plans:", e)
+
+
+def delete_statement(row_count):
+    """
+    Returns a statement that removes row_count flight plans from the flight_plans table at once.
+    """
+    return "DELETE FROM flight_plans WHERE flightRef IN (" + ", ".join(["%s"] * row_count) + ")"
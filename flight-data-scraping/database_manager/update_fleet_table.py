@@ -44,4 +44,15 @@ def update_fleet_table(connection, acid, flight_ref, model=None):
         connection.commit()
         cursor.close()
     except Exception as e:
-        print("Error updating netjets_fleet:", e)
\ No newline at end of file
+        print("Error updating netjets_fleet:", e)
+
+def fleet_upsert_statement(with_model, row_count):
+    """
+    Returns a multi-row version of the netjets_fleet upsert above, for row_count planes.
+    Planes that have a model use the statement with plane_type, the rest leave plane_type as it was.
+    """
+    if with_model:
+        return ("INSERT INTO netjets_fleet (acid, plane_type, flightRef) VALUES " + ", ".join(["(%s, %s, %s)"] * row_count) +
+                " ON DUPLICATE KEY UPDATE acid = VALUES(acid), plane_type = VALUES(plane_type), flightRef = VALUES(flightRef)")
+    return ("INSERT INTO netjets_fleet (acid, flightRef) VALUES " + ", ".join(["(%s, %s)"] * row_count) +
+            " ON DUPLICATE KEY UPDATE acid = VALUES(acid), flightRef = VALUES(flightRef)")
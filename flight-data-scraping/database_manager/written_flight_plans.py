@@ -0,0 +1,74 @@
+from collections import OrderedDict
+
+from common.flight_plan import FlightPlan
+from insert_into_flight_plans_table import OPTIONAL_COLUMNS
+
+
+class Written_flight_plans():
+    """ The last values written to each row of flight_plans, for the max_size most recently written flight plans.
+        The flight plans writer compares each upsert against them and only sends the columns that changed,
+        or no statement at all when nothing did. ETA changes of less than eta_threshold seconds don't count as a change.
+        Only the database manager writes flight_plans, and it starts with an empty copy, so a flight plan it doesn't know is always written.
+    """
+    def __init__(self, max_size=50000, eta_threshold=60):
+        self.max_size = max_size
+        self.eta_threshold = eta_threshold
+
+        # flight ref -> FlightPlan with the values in its row, least recently written first
+        self.flight_plans = OrderedDict()
+
+    def changes(self, flight_plan, deleted=False):
+        """
+        Returns a FlightPlan with the flight ref, acid and only the columns that differ from the row, or None if the upsert would change nothing.
+        If deleted is True, the row is removed earlier in the same transaction, so every column is a change.
+        Also returns the number of columns left out.
+        """
+        written = None if deleted else self.flight_plans.get(flight_plan.flight_ref)
+        if written is None:
+            return flight_plan, 0
+
+        changed = FlightPlan(flight_ref=flight_plan.flight_ref, acid=flight_plan.acid)
+        unchanged = 0
+        for field, _ in OPTIONAL_COLUMNS:
+            value = getattr(flight_plan, field)
+            if value is None:
+                continue
+            if self.same_value(field, value, getattr(written, field)):
+                unchanged += 1
+            else:
+                setattr(changed, field, value)
+
+        if flight_plan.acid == written.acid and all(getattr(changed, field) is None for field, _ in OPTIONAL_COLUMNS):
+            return None, unchanged
+        return changed, unchanged
+
+    def same_value(self, field, value, written_value):
+        if value == written_value:
+            return True
+        return field == 'eta' and written_value is not None and abs(value - written_value) < self.eta_threshold
+
+    def apply(self, flight_plan):
+        """
+        Records an upsert once it has been committed.
+        """
+        written = self.flight_plans.get(flight_plan.flight_ref)
+        if written is None:
+            written = FlightPlan(flight_ref=flight_plan.flight_ref)
+            self.flight_plans[flight_plan.flight_ref] = written
+        else:
+            self.flight_plans.move_to_end(flight_plan.flight_ref)
+
+        written.acid = flight_plan.acid
+        for field, _ in OPTIONAL_COLUMNS:
+            value = getattr(flight_plan, field)
+            if value is not None:
+                setattr(written, field, value)
+
+        if len(self.flight_plans) > self.max_size:
+            self.flight_plans.popitem(last=False)
+
+    def remove(self, flight_ref):
+        self.flight_plans.pop(flight_ref, None)
+
+    def size(self):
+        return len(self.flight_plans)
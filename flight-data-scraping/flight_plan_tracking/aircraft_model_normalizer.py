@@ -0,0 +1,188 @@
+from dotenv import load_dotenv
+from collections import Counter
+import csv
+import re
+import os
+
+from common.db import shared_database
+from common.versioned_index import VersionedIndex
+
+# Set by the aircraft-metadata-scraper in the same transaction that writes aircraft_types, so a change is found without reading the table
+INDEX_VERSION_SQL = "SELECT date FROM last_updated WHERE type = 'AircraftData';"
+DESIGNATORS_SQL = "SELECT DISTINCT type FROM aircraft_types WHERE type IS NOT NULL AND type <> '';"
+
+DEFAULT_ALIASES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'aircraft_model_aliases.csv')
+
+# Everything but letters and digits is ignored when a model name is looked up as an alias (i.e. "Phenom 300" -> PHENOM300)
+SEPARATORS = re.compile(r'[^A-Z0-9]')
+
+# Cached as the result of a string that doesn't resolve
+UNRESOLVED = ''
+
+# How many of the strings that don't resolve are counted, the most common are kept once there are twice as many
+MAX_UNRESOLVED_MODELS = 1000
+
+
+def alias_key(model):
+    return SEPARATORS.sub('', model.upper())
+
+
+class Aircraft_model_normalizer(VersionedIndex):
+    """ Resolve the aircraft model strings in the messages (aircraftModel, aircraftSpecification, flightAircraftSpecs),
+        i.e. C68A, C68A/L or H/B744/L, to the FAA designator that is the type column of aircraft_types,
+        so netjets_fleet.plane_type joins aircraft_types on an exact, indexed key instead of being matched by hand.
+        The index holds every designator in aircraft_types, and the aliases in AIRCRAFT_MODEL_ALIASES_FILE (alias -> designator)
+        for the names that aren't designators. Resolved strings are cached, there are only a few of them.
+        A background thread reloads the index when the AircraftData date in last_updated or the alias file changes,
+        or at least every AIRCRAFT_MODEL_INDEX_TTL seconds (which also picks up edits made to aircraft_types by hand).
+        Strings that don't resolve are kept as they are, and reported.
+        Connections come from the service's shared database pool.
+    """
+    component = 'aircraft_model_normalizer'
+    load_error = "Error loading aircraft types from database:"
+    refresh_error = "Error refreshing aircraft model index:"
+
+    def __init__(self, database=None):
+        load_dotenv()
+
+        # How often the background thread checks if aircraft_types or the aliases changed, and the max age of the index before it is reloaded regardless
+        super().__init__(database or shared_database(),
+                         float(os.getenv('AIRCRAFT_MODEL_INDEX_CHECK_INTERVAL', 60)),
+                         float(os.getenv('AIRCRAFT_MODEL_INDEX_TTL', 3600)))
+        self.aliases_file = os.getenv('AIRCRAFT_MODEL_ALIASES_FILE', DEFAULT_ALIASES_FILE)
+        self.max_cache_size = int(os.getenv('AIRCRAFT_MODEL_CACHE_SIZE', 10000))
+
+        # Designators in aircraft_types, or None until the index has been loaded, and alias key -> designator
+        self.designators = None
+        self.aliases = dict()
+        # Model string as it came in -> designator, or UNRESOLVED
+        self.cache = dict()
+
+        # Lookups that resolved to a designator, and strings that didn't
+        self.hits = 0
+        self.misses = 0
+        self.unresolved_models = Counter()
+        self.reported_misses = 0
+
+        # Load the index, and keep it fresh in the background
+        self.start()
+
+    def get_index_version(self):
+        # Changes when the scraper writes aircraft_types, and when the alias file is edited
+        row = self.database.fetch_one(INDEX_VERSION_SQL, prepared=True)
+        return row[0] if row else None, self.get_aliases_version()
+
+    def get_aliases_version(self):
+        try:
+            return os.stat(self.aliases_file).st_mtime
+        except OSError:
+            return None
+
+    def load_aliases(self):
+        aliases = dict()
+        try:
+            with open(self.aliases_file, newline='') as f:
+                for row in csv.DictReader(f):
+                    alias = (row.get('alias') or '').strip()
+                    designator = (row.get('designator') or '').strip().upper()
+                    if alias and designator:
+                        aliases[alias_key(alias)] = designator
+        except OSError as e:
+            print("Error loading aircraft model aliases:", e)
+        return aliases
+
+    def read_index(self):
+        """
+        Reads every designator in aircraft_types.
+        """
+        return self.database.fetch_all(DESIGNATORS_SQL, prepared=True)
+
+    def use_index(self, rows):
+        designators = {designator.strip().upper() for designator, in rows}
+        aliases = self.load_aliases()
+
+        # Swap the whole index at once, so lookups never see a half loaded index, and start a new cache for it
+        self.aliases = aliases
+        self.designators = designators
+        self.cache = dict()
+
+    def report(self):
+        self.report_unresolved_models()
+
+    def report_unresolved_models(self):
+        # Only report when there are new misses, to keep the logs quiet
+        if self.misses == self.reported_misses:
+            return
+        self.reported_misses = self.misses
+
+        most_common = ", ".join(f"{model} ({count})" for model, count in self.unresolved_models.most_common(10))
+        print(f"Aircraft model normalizer: {self.hits} hits, {self.misses} misses. Models not in aircraft_types or the aliases: {most_common}")
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'designators': len(self.designators) if self.designators is not None else 0,
+            'aliases': len(self.aliases),
+            'cached_models': len(self.cache),
+            'unresolved_models': dict(self.unresolved_models),
+        }
+
+    def resolve(self, model):
+        """
+        Returns the designator for a model string, or None if it doesn't resolve.
+        """
+        designators = self.designators
+        aliases = self.aliases
+
+        key = model.strip().upper()
+        if key in designators:
+            return key
+        designator = aliases.get(alias_key(key))
+        if designator:
+            return designator
+
+        # Specifications carry the designator between a weight class and an equipment code, i.e. H/B744/L or C68A/L
+        for part in key.split('/'):
+            part = part.strip()
+            if part in designators:
+                return part
+            designator = aliases.get(alias_key(part)) if part else None
+            if designator:
+                return designator
+        return None
+
+    def lookup_designator(self, model):
+        """
+        Returns the designator for a model string, from the cache when it has been seen before, or None if it doesn't resolve.
+        """
+        # Until the index is loaded, leave the models as they are
+        if self.designators is None:
+            return None
+
+        designator = self.cache.get(model)
+        if designator is None:
+            designator = self.resolve(model) or UNRESOLVED
+            cache = self.cache
+            if len(cache) >= self.max_cache_size:
+                cache.clear()
+            cache[model] = designator
+
+        if designator == UNRESOLVED:
+            self.misses += 1
+            unresolved_models = self.unresolved_models
+            unresolved_models[model] += 1
+            if len(unresolved_models) > 2 * MAX_UNRESOLVED_MODELS:
+                self.unresolved_models = Counter(dict(unresolved_models.most_common(MAX_UNRESOLVED_MODELS)))
+            return None
+        self.hits += 1
+        return designator
+
+    def normalize_model(self, flight_plan):
+        if flight_plan.model:
+            designator = self.lookup_designator(flight_plan.model)
+            if designator:
+                flight_plan.model = designator
+
+        # Send the modified flight plan back to the flight plan tracker
+        return flight_plan
@@ -1,75 +1,133 @@
-import mysql.connector
 from dotenv import load_dotenv
+from collections import Counter
 import os
 
-class Airport_code_normalizer():
+from common.db import shared_database
+from common.versioned_index import VersionedIndex
+from pipeline_metrics import DATABASE_ERRORS
+
+# Set by the web app's airport import whenever it writes airport_data, so a change is found without reading the table
+INDEX_VERSION_SQL = "SELECT date FROM last_updated WHERE type = 'AirportData';"
+# Ordered by ident, so a code used by more than one airport resolves to the same airport the single row lookup found
+INDEX_SQL = "SELECT iata_code, ident FROM airport_data WHERE iata_code IS NOT NULL AND iata_code <> '' ORDER BY ident;"
+ICAO_CODE_SQL = "SELECT ident FROM airport_data WHERE iata_code = %s;"
+
+
+class Airport_code_normalizer(VersionedIndex):
     """ Convert any 3 letter codes (IATA) to 4 letter codes (ICAO) by
-        referencing the airport data stored in the database
+        referencing the airport data stored in the database.
+        The whole IATA -> ICAO mapping is held in memory, so no database round trip is needed per message.
+        A background thread reloads it when the AirportData row of last_updated changes, or at least every AIRPORT_INDEX_TTL seconds
+        (which also picks up edits made to airport_data by hand).
+        Connections come from the service's shared database pool.
     """
-    def __init__(self):
-        self.connect_to_db()
+    component = 'airport_code_normalizer'
+    load_error = "Error loading airport data from database:"
+    refresh_error = "Error refreshing airport data index:"
 
-    def connect_to_db(self):
-        # Get the databse conneciton info from the .env file that was mounted to this docker image
+    def __init__(self, database=None):
         load_dotenv()
 
-        self.connection = None
-
-        # Establish MySQL connection
+        # How often the background thread checks if airport_data changed, and the max age of the index before it is reloaded regardless
+        super().__init__(database or shared_database(),
+                         float(os.getenv('AIRPORT_INDEX_CHECK_INTERVAL', 60)),
+                         float(os.getenv('AIRPORT_INDEX_TTL', 3600)))
+
+        # IATA code -> ICAO code, or None until the index has been loaded
+        self.iata_to_icao = None
+
+        # Lookups answered by the index, and codes that are not in airport_data
+        self.hits = 0
+        self.misses = 0
+        self.missing_codes = Counter()
+        self.reported_misses = 0
+
+        # Load the index, and keep it fresh in the background
+        self.start()
+
+    def get_index_version(self):
+        # None if the row isn't there, then only the TTL reloads the index
+        row = self.database.fetch_one(INDEX_VERSION_SQL, prepared=True)
+        return row[0] if row else None
+
+    def read_index(self):
+        """
+        Reads the IATA -> ICAO mapping of every airport in airport_data.
+        """
+        return self.database.fetch_all(INDEX_SQL, prepared=True)
+
+    def use_index(self, rows):
+        iata_to_icao = dict()
+        for iata_code, ident in rows:
+            # The database compares codes case insensitively, so store them in upper case and look them up in upper case
+            iata_to_icao.setdefault(iata_code.upper(), ident)
+
+        # Swap the whole index at once, so lookups never see a half loaded index
+        self.iata_to_icao = iata_to_icao
+
+    def report(self):
+        self.report_missing_codes()
+
+    def report_missing_codes(self):
+        # Only report when there are new misses, to keep the logs quiet
+        if self.misses == self.reported_misses:
+            return
+        self.reported_misses = self.misses
+
+        most_common = ", ".join(f"{code} ({count})" for code, count in self.missing_codes.most_common(10))
+        print(f"Airport code normalizer: {self.hits} hits, {self.misses} misses. Codes missing from airport_data: {most_common}")
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'index_size': len(self.iata_to_icao) if self.iata_to_icao is not None else 0,
+            'missing_codes': dict(self.missing_codes),
+        }
+
+    def lookup_icao_code(self, iata_code):
+        """
+        Returns the ICAO code for an IATA code, or None if airport_data doesn't have one.
+        """
+        iata_to_icao = self.iata_to_icao
+
+        # Until the index is loaded, fall back to asking the database directly
+        if iata_to_icao is None:
+            return self.query_icao_code(iata_code)
+
+        icao_code = iata_to_icao.get(iata_code.upper())
+        if icao_code is None:
+            self.misses += 1
+            self.missing_codes[iata_code] += 1
+        else:
+            self.hits += 1
+        return icao_code
+
+    def query_icao_code(self, iata_code):
         try:
-            self.connection = mysql.connector.connect(
-                host=os.getenv('DB_HOST'),
-                user=os.getenv('DB_USER'),
-                password=os.getenv('DB_PASSWORD'),
-                database=os.getenv('DB_NAME')
-            )
+            icao_code = self.database.fetch_one(ICAO_CODE_SQL, (iata_code,), prepared=True)
 
-        except mysql.connector.Error as e:
-            print("Error connecting to MySQL:", e)
+            if icao_code:
+                return icao_code[0]
+        except Exception as e:
+            print("Error grabbing airport data from database:", e)
+            DATABASE_ERRORS.labels('airport_code_normalizer').inc()
+        return None
 
     def IATA_codes_to_ICAO_codes(self, flight_plan):
-        if flight_plan.get('status') == "CANCELED":
+        if flight_plan.status == "CANCELED":
             return flight_plan
-        
-        if self.connection is None:
-            self.connection = self.connect_to_db()
-
-        # If the airport code is 3 letters, check if there is a 4 letter code in the database    
-        sql = "SELECT ident FROM airport_data WHERE iata_code = %s;"
-
-        if flight_plan.get('dep_arpt') and len(flight_plan['dep_arpt']) == 3:
-            
-            params = [flight_plan['dep_arpt']]
-
-            try:
-                cursor = self.connection.cursor()
-                cursor.execute(sql, tuple(params))
-
-                icao_code = cursor.fetchone()
-
-                cursor.close()
-
-                if icao_code:
-                    flight_plan['dep_arpt'] = icao_code[0]
-            except Exception as e:
-                print("Error grabbing airport data from database:", e)
-
-        if flight_plan.get('arr_arpt') and len(flight_plan['arr_arpt']) == 3:
-            
-            params = [flight_plan['arr_arpt']]
-
-            try:
-                cursor = self.connection.cursor()
-                cursor.execute(sql, tuple(params))
-
-                icao_code = cursor.fetchone()
 
-                cursor.close()
+        # If the airport code is 3 letters, check if there is a 4 letter code in the database
+        if flight_plan.dep_arpt and len(flight_plan.dep_arpt) == 3:
+            icao_code = self.lookup_icao_code(flight_plan.dep_arpt)
+            if icao_code:
+                flight_plan.dep_arpt = icao_code
 
-                if icao_code:
-                    flight_plan['arr_arpt'] = icao_code[0]
-            except Exception as e:
-                print("Error grabbing airport data from database:", e)
+        if flight_plan.arr_arpt and len(flight_plan.arr_arpt) == 3:
+            icao_code = self.lookup_icao_code(flight_plan.arr_arpt)
+            if icao_code:
+                flight_plan.arr_arpt = icao_code
 
         # Send the modified flight plan back to the flight plan tracker
-        return flight_plan
\ No newline at end of file
+        return flight_plan
@@ -0,0 +1,168 @@
+import asyncio
+import requests
+
+import flight_plans_api
+from parsing_workers import parse_messages
+from pipeline_metrics import NORMALIZER_SECONDS, MODEL_NORMALIZER_SECONDS, FBO_ASSIGNER_SECONDS, STAGE_ERRORS
+
+
+class AsyncPipeline:
+    """
+    Runs flight_plan_tracking as four asyncio stages joined by bounded queues: fetch -> parse -> enrich -> publish.
+    When a queue is full the stage feeding it waits, so a slow stage slows down fetching instead of piling up messages.
+    Fetching reuses one keep-alive HTTP connection and only sleeps when the message API has nothing to give,
+    backing off exponentially from min_poll_interval to max_poll_interval while it stays empty.
+    Blocking calls (HTTP requests, database lookups in the enrich stage, a full flight plan queue) run in worker threads.
+    """
+    def __init__(self, api_url, messageHeaderFilter, flightMessageExtractor, flightDataProcessor, airport_code_normalizer, fboAssigner,
+                 staleMessageFilter=None, aircraft_model_normalizer=None, xml_parser='targeted', queue_size=100, min_poll_interval=0.05, max_poll_interval=2.0, request_timeout=5.0, stats_interval=60.0):
+        self.api_url = api_url
+        self.messageHeaderFilter = messageHeaderFilter
+        self.flightMessageExtractor = flightMessageExtractor
+        self.flightDataProcessor = flightDataProcessor
+        self.airport_code_normalizer = airport_code_normalizer
+        self.fboAssigner = fboAssigner
+        self.staleMessageFilter = staleMessageFilter
+        self.aircraft_model_normalizer = aircraft_model_normalizer
+        self.xml_parser = xml_parser
+        self.queue_size = queue_size
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.request_timeout = request_timeout
+        self.stats_interval = stats_interval
+
+        # Reuse one keep-alive HTTP connection for every request to the message API
+        self.session = requests.Session()
+
+        self.counts = {
+            'messages_fetched': 0,
+            'empty_polls': 0,
+            'request_errors': 0,
+            'flight_plans_published': 0,
+        }
+
+    async def run(self):
+        # The queues are made here, so they belong to the running event loop
+        self.parse_queue = asyncio.Queue(self.queue_size)
+        self.enrich_queue = asyncio.Queue(self.queue_size)
+        self.publish_queue = asyncio.Queue(self.queue_size)
+
+        await asyncio.gather(
+            self.fetch_stage(),
+            self.parse_stage(),
+            self.enrich_stage(),
+            self.publish_stage(),
+            self.stats_stage(),
+        )
+
+    def fetch_message(self):
+        response = self.session.get(self.api_url, timeout=self.request_timeout)
+        return response.json()['message']
+
+    async def fetch_stage(self):
+        poll_interval = 0
+        while True:
+            try:
+                message = await asyncio.to_thread(self.fetch_message)
+            except requests.exceptions.RequestException as e:
+                print("Error requesting from JMS API:", e)
+                self.counts['request_errors'] += 1
+                message = None
+            except (ValueError, KeyError) as e:
+                # A body that isn't JSON, or has no message in it
+                print("Error reading the response of the JMS API:", e)
+                STAGE_ERRORS.labels('fetch').inc()
+                message = None
+
+            if message:
+                self.counts['messages_fetched'] += 1
+                # There may be a backlog, so ask again right away
+                poll_interval = 0
+                await self.parse_queue.put(message)
+            else:
+                self.counts['empty_polls'] += 1
+                poll_interval = min(max(poll_interval * 2, self.min_poll_interval), self.max_poll_interval)
+                await asyncio.sleep(poll_interval)
+
+    async def parse_stage(self):
+        while True:
+            # Take every message that is waiting, so the clock is read once for the whole batch
+            messages = [await self.parse_queue.get()]
+            while not self.parse_queue.empty():
+                messages.append(self.parse_queue.get_nowait())
+
+            self.flightDataProcessor.set_current_time()
+
+            # Only the root tag is read for messages that would be thrown away anyway
+            messages = [message for message in messages if self.accept(message)]
+            for flight_plan in parse_messages(messages, self.xml_parser, self.flightMessageExtractor, self.flightDataProcessor):
+                # Messages can arrive out of order, so leave out what a newer message already published for this flight
+                try:
+                    flight_plans = [flight_plan] if self.staleMessageFilter is None else self.staleMessageFilter.filter(flight_plan)
+                except Exception as e:
+                    print("Error filtering stale flight plan:", e)
+                    STAGE_ERRORS.labels('parse').inc()
+                    continue
+                for flight_plan in flight_plans:
+                    await self.enrich_queue.put(flight_plan)
+
+    def accept(self, message):
+        try:
+            return self.messageHeaderFilter.accept(message)
+        except Exception as e:
+            print("Error reading flight message header:", e)
+            STAGE_ERRORS.labels('parse').inc()
+            return False
+
+    def enrich(self, flight_plan):
+        # Sometimes, the airport code comes in as a 3 letter code (IATA), and sometimes it comes in as a 4 letter code (ICAO)
+        # So, attempt to convert all 3 letter codes to their 4 letter equivalent, if it exists
+        with NORMALIZER_SECONDS.time():
+            flight_plan = self.airport_code_normalizer.IATA_codes_to_ICAO_codes(flight_plan)
+
+        # Store the aircraft model as the FAA designator in aircraft_types
+        if self.aircraft_model_normalizer is not None:
+            with MODEL_NORMALIZER_SECONDS.time():
+                flight_plan = self.aircraft_model_normalizer.normalize_model(flight_plan)
+
+        # Assign the flight plan a mock FBO (this function is a placeholder until the real FBO assignment data is incorporated)
+        with FBO_ASSIGNER_SECONDS.time():
+            return self.fboAssigner.assign_fbo(flight_plan)
+
+    async def enrich_stage(self):
+        while True:
+            flight_plan = await self.enrich_queue.get()
+            try:
+                flight_plan = await asyncio.to_thread(self.enrich, flight_plan)
+            except Exception as e:
+                print("Error enriching flight plan:", e)
+                STAGE_ERRORS.labels('enrich').inc()
+                continue
+            await self.publish_queue.put(flight_plan)
+
+    async def publish_stage(self):
+        while True:
+            flight_plan = await self.publish_queue.get()
+            # Expose the objects to an api endpoint so it can be used by a database managing microservice
+            # (in a thread, since a full flight plan queue with the 'block' policy waits for space)
+            try:
+                await asyncio.to_thread(flight_plans_api.add_flight_plan, flight_plan)
+            except Exception as e:
+                print("Error publishing flight plan:", e)
+                STAGE_ERRORS.labels('publish').inc()
+                continue
+            self.counts['flight_plans_published'] += 1
+
+    def stats(self):
+        return dict(
+            self.counts,
+            parse_queue_depth=self.parse_queue.qsize(),
+            enrich_queue_depth=self.enrich_queue.qsize(),
+            publish_queue_depth=self.publish_queue.qsize(),
+        )
+
+    async def stats_stage(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            stats = self.stats()
+            print("Async pipeline: " + ", ".join(f"{name} {value}" for name, value in stats.items()))
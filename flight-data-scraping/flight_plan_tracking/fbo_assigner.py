@@ -1,74 +1,389 @@
-import mysql.connector
 from dotenv import load_dotenv
+from bisect import insort, bisect_left
+import time
 import os
 
+from common.db import shared_database
+from pipeline_metrics import DATABASE_ERRORS
+
+PARKING_SQL = "SELECT id, Airport_Code, Total_Space, Area_ft2, Priority FROM airport_parking;"
+PLAN_FBOS_SQL = "SELECT flightRef, fbo_id FROM flight_plans;"
+FLEET_SQL = "SELECT acid, flightRef, plane_type FROM netjets_fleet;"
+AIRCRAFT_DATA_DATE_SQL = "SELECT date FROM last_updated WHERE type = 'AircraftData';"
+# A designator can have more than one row (one per variant), the largest is used so its planes always fit
+PARKING_AREAS_SQL = "SELECT type, MAX(parkingArea) FROM aircraft_types WHERE type IS NOT NULL AND parkingArea IS NOT NULL GROUP BY type;"
+OCCUPANCY_SQL = "SELECT flight_plans.fbo_id, COUNT(*) FROM netjets_fleet JOIN flight_plans ON netjets_fleet.flightRef = flight_plans.flightRef WHERE flight_plans.fbo_id IS NOT NULL GROUP BY flight_plans.fbo_id;"
+PLAN_FBO_SQL = "SELECT fbo_id FROM flight_plans WHERE flightRef = %s;"
+# Get only the FBOs with open space and order it by the stored priority
+OPEN_FBO_SQL = "SELECT id FROM airport_parking WHERE Airport_Code = %s AND (SELECT COUNT(*) FROM netjets_fleet JOIN flight_plans ON netjets_fleet.flightRef = flight_plans.flightRef WHERE flight_plans.fbo_id = airport_parking.id) < Total_Space ORDER BY Priority LIMIT 1;"
+# The same from the fbo_occupancy counters the database manager keeps, one row per FBO instead of a count of its planes
+OPEN_FBO_COUNTERS_SQL = "SELECT airport_parking.id FROM airport_parking LEFT JOIN fbo_occupancy ON fbo_occupancy.airport = airport_parking.Airport_Code AND fbo_occupancy.fbo_id = airport_parking.id WHERE airport_parking.Airport_Code = %s AND COALESCE(fbo_occupancy.planes, 0) < airport_parking.Total_Space ORDER BY airport_parking.Priority LIMIT 1;"
+
+
 class Fbo_assigner():
     """ This is technically mock data. NetJets has internal data that assigns each aircraft to an FBO.
         This service is a place holder until that data is incorporated.
         For now, this service will assign an aircraft to the highest priority FBO with open space.
-    """
-    def __init__(self):
-        self.connect_to_db()
 
-    def connect_to_db(self):
-        # Get the databse conneciton info from the .env file that was mounted to this docker image
+        The occupancy of every FBO is kept in memory and updated as flight plans come through, mirroring what the
+        database manager will write. An FBO's occupancy is the number of planes in netjets_fleet whose flight plan is assigned to it.
+        With FBO_ASSIGNMENT_MODE=area it is the square footage those planes park in instead, looked up by their model
+        in aircraft_types, and an aircraft goes to the highest priority FBO with enough area left for it (Area_ft2).
+        The model is reconciled against the database every FBO_RECONCILE_INTERVAL seconds.
+        Connections come from the service's shared database pool.
+    """
+    def __init__(self, database=None):
         load_dotenv()
 
-        self.connection = None
+        self.database = database or shared_database()
+
+        self.reconcile_interval = float(os.getenv('FBO_RECONCILE_INTERVAL', 300))
+
+        # If True, compare the in-memory occupancy with the database on every reconcile and print any differences
+        self.consistency_check = os.getenv('FBO_CONSISTENCY_CHECK') == "True"
+
+        # If True, the database manager keeps the fbo_occupancy counters, so looking up an open FBO doesn't have to count planes
+        self.occupancy_counters = os.getenv('FBO_OCCUPANCY_COUNTERS', 'True') == "True"
+
+        # 'slots' counts every aircraft as one of an FBO's Total_Space, 'area' packs FBOs by the square footage each aircraft parks in
+        self.area_mode = os.getenv('FBO_ASSIGNMENT_MODE', 'slots') == "area"
+        # Parking area, in square feet, of a model that isn't in aircraft_types (or of a plane with no model)
+        self.default_parking_area = float(os.getenv('FBO_DEFAULT_PARKING_AREA', 3000))
+        # Room each plane takes beyond its own parking area, the web app's area pages count the same 10%
+        self.parking_area_factor = float(os.getenv('FBO_PARKING_AREA_FACTOR', 1.1))
+
+        # model -> parking area in square feet, from aircraft_types, and the last_updated date it was loaded for
+        self.parking_areas = dict()
+        self.parking_areas_date = None
+        # Models that were not in aircraft_types, printed once each
+        self.unknown_models = set()
+
+        # fbo id -> [airport code, capacity, priority, occupancy], capacity and occupancy are planes or square feet depending on the mode
+        self.fbos = None
+        # airport code -> sorted list of (priority, fbo id) for the FBOs that have open space
+        self.open_fbos = dict()
+        # flight ref -> assigned fbo id (or None), for every flight plan that is in the database or on its way there
+        self.plan_fbos = dict()
+        # flight ref -> when it was last seen, for flight plans that are not in the database yet
+        self.pending_plans = dict()
+        # acid -> flight ref, and the reverse, and acid -> plane type, mirroring netjets_fleet
+        self.fleet = dict()
+        self.fleet_by_ref = dict()
+        self.plane_models = dict()
+        # flight ref -> (fbo id, space), what each flight plan is counted as in the occupancy of an FBO
+        self.counted = dict()
+
+        self.last_reconcile = None
+
+        self.reconcile()
+
+    # --- Occupancy model ---
+
+    def reconcile(self):
+        """
+        Reloads the occupancy model from the database.
+        Flight plans that were seen recently but are not in the database yet are kept, so they don't get assigned a second time.
+        """
+        self.last_reconcile = time.monotonic()
 
-        # Establish MySQL connection
         try:
-            self.connection = mysql.connector.connect(
-                host=os.getenv('DB_HOST'),
-                user=os.getenv('DB_USER'),
-                password=os.getenv('DB_PASSWORD'),
-                database=os.getenv('DB_NAME')
-            )
+            # All three in one read transaction, so they describe the same moment
+            with self.database.connection() as connection:
+                parking_rows = connection.prepared(PARKING_SQL).fetchall()
+                plan_rows = connection.prepared(PLAN_FBOS_SQL).fetchall()
+                fleet_rows = connection.prepared(FLEET_SQL).fetchall()
+                # End the read transaction, so the next reconcile sees new data
+                connection.commit()
+        except Exception as e:
+            print("Error grabbing parking data from database:", e)
+            DATABASE_ERRORS.labels('fbo_assigner').inc()
+            return
 
-        except mysql.connector.Error as e:
-            print("Error connecting to MySQL:", e)
+        if self.area_mode:
+            self.load_parking_areas()
 
-    def assign_fbo(self, flight_plan):
-        if flight_plan.get('status') == "CANCELED":
-            return flight_plan
-        
-        if self.connection is None:
-            self.connection = self.connect_to_db()
+        if self.consistency_check and self.fbos is not None:
+            self.check_consistency()
+
+        plan_fbos = dict(plan_rows)
+
+        # Keep the flight plans that are still on their way to the database
+        for flight_ref, seen in list(self.pending_plans.items()):
+            if flight_ref in plan_fbos or self.last_reconcile - seen > 2 * self.reconcile_interval:
+                del self.pending_plans[flight_ref]
+            elif flight_ref in self.plan_fbos:
+                plan_fbos[flight_ref] = self.plan_fbos[flight_ref]
+
+        self.fbos = {
+            fbo_id: [airport.upper() if airport else airport, self.capacity(total_space, area), priority, 0]
+            for fbo_id, airport, total_space, area, priority in parking_rows
+        }
+        self.plan_fbos = plan_fbos
+        self.fleet = {acid: flight_ref for acid, flight_ref, _ in fleet_rows}
+        self.fleet_by_ref = {flight_ref: acid for acid, flight_ref, _ in fleet_rows}
+        self.plane_models = {acid: plane_type for acid, _, plane_type in fleet_rows if plane_type is not None}
+
+        self.counted = dict()
+        for flight_ref in self.fleet_by_ref:
+            counted = self.counted_space(flight_ref)
+            if counted is not None and counted[0] in self.fbos:
+                self.fbos[counted[0]][3] += counted[1]
+                self.counted[flight_ref] = counted
 
-        # Check if the flight plan has an FBO assigned already
-        sql = "SELECT fbo_id FROM flight_plans WHERE flightRef = %s;"
-        params = [flight_plan.get('flight_ref')]
+        self.open_fbos = dict()
+        for fbo_id, fbo in self.fbos.items():
+            if self.has_open_space(fbo):
+                insort(self.open_fbos.setdefault(fbo[0], []), (fbo[2], fbo_id))
 
+    def check_consistency(self):
+        """
+        Compares the in-memory occupancy of each FBO with a COUNT(*) from the database.
+        Returns {fbo id: (in-memory count, database count)} for every FBO that doesn't match.
+        """
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(sql, tuple(params))
+            database_counts = dict(self.database.fetch_all(OCCUPANCY_SQL))
+        except Exception as e:
+            print("Error grabbing parking data from database:", e)
+            DATABASE_ERRORS.labels('fbo_assigner').inc()
+            return None
 
-            fbo_assignment = cursor.fetchone()
+        # Compared as planes in both modes
+        memory_counts = dict()
+        for fbo_id, _ in self.counted.values():
+            memory_counts[fbo_id] = memory_counts.get(fbo_id, 0) + 1
 
-            cursor.close()
+        differences = dict()
+        for fbo_id in (self.fbos or dict()):
+            memory_count = memory_counts.get(fbo_id, 0)
+            database_count = database_counts.get(fbo_id, 0)
+            if memory_count != database_count:
+                differences[fbo_id] = (memory_count, database_count)
 
-            # If the flight plan has no FBO assigned, then assign it to one
-            if fbo_assignment is None:
-                # Get only the FBOs with open space and order it by the stored priority
-                sql = "SELECT id FROM airport_parking WHERE Airport_Code = %s AND (SELECT COUNT(*) FROM netjets_fleet JOIN flight_plans ON netjets_fleet.flightRef = flight_plans.flightRef WHERE flight_plans.fbo_id = airport_parking.id) < Total_Space ORDER BY Priority LIMIT 1;"
-                params = [flight_plan['arr_arpt']]
+        if differences:
+            print("FBO occupancy differs from the database (fbo id: (in memory, database)):", differences)
+        return differences
 
-                try:
-                    cursor = self.connection.cursor()
-                    cursor.execute(sql, tuple(params))
+    # --- Parking areas ---
+
+    def load_parking_areas(self):
+        """
+        Reloads the parking area of every model from aircraft_types, when the aircraft-metadata-scraper has updated it since the last load.
+        """
+        try:
+            with self.database.connection() as connection:
+                rows = connection.prepared(AIRCRAFT_DATA_DATE_SQL).fetchall()
+                date = rows[0][0] if rows else None
+                if self.parking_areas_date is not None and date == self.parking_areas_date:
+                    connection.commit()
+                    return
+                rows = connection.prepared(PARKING_AREAS_SQL).fetchall()
+                connection.commit()
+        except Exception as e:
+            print("Error grabbing aircraft parking areas from database:", e)
+            DATABASE_ERRORS.labels('fbo_assigner').inc()
+            return
+
+        self.parking_areas = {model.strip().upper(): float(area) for model, area in rows}
+        self.parking_areas_date = date
+        self.unknown_models = set()
+        print(f"Loaded the parking areas of {len(self.parking_areas)} aircraft models (aircraft data from {date})")
+
+    def parking_area(self, model):
+        """
+        The square feet a plane of this model takes up at an FBO, rounded to whole square feet so the occupancy adds up exactly.
+        """
+        area = self.parking_areas.get(model.strip().upper()) if model else None
+        if area is None:
+            if model and model not in self.unknown_models:
+                self.unknown_models.add(model)
+                print(f"No parking area for aircraft model {model}, using {self.default_parking_area:g} ft2")
+            area = self.default_parking_area
+        return int(round(area * self.parking_area_factor))
+
+    def capacity(self, total_space, area):
+        if not self.area_mode:
+            return total_space
+        if area is not None:
+            return int(area)
+        # An FBO without a known area holds Total_Space planes of the default size
+        return None if total_space is None else total_space * self.parking_area(None)
+
+    def space_needed(self, model):
+        return self.parking_area(model) if self.area_mode else 1
 
-                    fbo_assignment = cursor.fetchone()
+    # --- Occupancy ---
 
-                    cursor.close()
+    def has_open_space(self, fbo):
+        return fbo[1] is not None and fbo[3] < fbo[1]
+
+    def has_room_for(self, fbo, space):
+        return fbo[1] is not None and fbo[3] + space <= fbo[1]
+
+    def counted_space(self, flight_ref):
+        """
+        Returns (fbo id, space) for where the flight plan takes up space and how much, or None if it doesn't.
+        """
+        # A flight plan takes up space at its FBO while a plane in the fleet points to it
+        acid = self.fleet_by_ref.get(flight_ref)
+        if acid is None:
+            return None
+        fbo_id = self.plan_fbos.get(flight_ref)
+        if fbo_id is None:
+            return None
+        return fbo_id, self.space_needed(self.plane_models.get(acid))
+
+    def add_to_occupancy(self, fbo_id, amount):
+        fbo = self.fbos.get(fbo_id)
+        if fbo is None:
+            return
+
+        was_open = self.has_open_space(fbo)
+        fbo[3] += amount
+        is_open = self.has_open_space(fbo)
+
+        if was_open != is_open:
+            open_fbos = self.open_fbos.setdefault(fbo[0], [])
+            entry = (fbo[2], fbo_id)
+            if is_open:
+                insort(open_fbos, entry)
+            else:
+                i = bisect_left(open_fbos, entry)
+                if i < len(open_fbos) and open_fbos[i] == entry:
+                    del open_fbos[i]
+
+    def update_occupancy(self, flight_ref, change):
+        """
+        Applies a change to the model and moves the flight plan's occupancy to wherever it is counted afterwards.
+        """
+        change()
+        before = self.counted.get(flight_ref)
+        after = self.counted_space(flight_ref)
+
+        if before != after:
+            if before is not None:
+                self.add_to_occupancy(before[0], -before[1])
+            if after is not None:
+                self.add_to_occupancy(after[0], after[1])
+                self.counted[flight_ref] = after
+            else:
+                del self.counted[flight_ref]
+
+    def remove_flight_plan(self, flight_ref):
+        self.update_occupancy(flight_ref, lambda: self.plan_fbos.pop(flight_ref, None))
+        self.pending_plans.pop(flight_ref, None)
+
+    def add_flight_plan(self, flight_ref, fbo_id):
+        def change():
+            self.plan_fbos[flight_ref] = fbo_id
+        self.update_occupancy(flight_ref, change)
+        self.pending_plans[flight_ref] = time.monotonic()
+
+    def point_fleet_to(self, acid, flight_ref):
+        current_flight_ref = self.fleet.get(acid)
+        if current_flight_ref == flight_ref:
+            return
+
+        # The database manager removes the flight plan the plane was pointing to before
+        if current_flight_ref is not None:
+            self.remove_flight_plan(current_flight_ref)
+            self.update_occupancy(current_flight_ref, lambda: self.fleet_by_ref.pop(current_flight_ref, None))
+
+        def change():
+            self.fleet[acid] = flight_ref
+            self.fleet_by_ref[flight_ref] = acid
+        self.update_occupancy(flight_ref, change)
+
+    def set_plane_model(self, acid, model):
+        if self.plane_models.get(acid) == model:
+            return
+
+        def change():
+            self.plane_models[acid] = model
+        # The plane's flight plan takes up a different area at its FBO
+        flight_ref = self.fleet.get(acid)
+        if flight_ref is None:
+            change()
+        else:
+            self.update_occupancy(flight_ref, change)
+
+    def track_flight_plan(self, flight_plan):
+        """
+        Updates the occupancy model with the changes the database manager will make for this flight plan.
+        """
+        flight_ref = flight_plan.flight_ref
+        acid = flight_plan.acid
+        if flight_ref is None:
+            return
+
+        if flight_plan.status == "CANCELED":
+            self.remove_flight_plan(flight_ref)
+            return
+
+        if acid is None:
+            return
+
+        if flight_ref not in self.plan_fbos:
+            self.add_flight_plan(flight_ref, flight_plan.fbo_id)
+
+        if flight_plan.status == "FLYING":
+            # The database manager only writes the model along with a FLYING status
+            if flight_plan.model is not None:
+                self.set_plane_model(acid, flight_plan.model)
+            self.point_fleet_to(acid, flight_ref)
+
+    # --- Assignment ---
+
+    def assign_fbo(self, flight_plan):
+        if self.last_reconcile is None or time.monotonic() - self.last_reconcile >= self.reconcile_interval:
+            self.reconcile()
+
+        # Until the model has been loaded, ask the database directly
+        if self.fbos is None:
+            return self.assign_fbo_from_database(flight_plan)
+
+        if flight_plan.status != "CANCELED" and flight_plan.flight_ref not in self.plan_fbos:
+            # If the flight plan has no FBO assigned, then assign it to the highest priority FBO with open space
+            arr_arpt = flight_plan.arr_arpt
+            open_fbos = self.open_fbos.get(arr_arpt.upper()) if arr_arpt else None
+            if open_fbos and not self.area_mode:
+                flight_plan.fbo_id = open_fbos[0][1]
+            elif open_fbos:
+                # The first FBO, by priority, with enough area left for this plane. An airport only has a few FBOs
+                space = self.space_needed(flight_plan.model or self.plane_models.get(flight_plan.acid))
+                for _, fbo_id in open_fbos:
+                    if self.has_room_for(self.fbos[fbo_id], space):
+                        flight_plan.fbo_id = fbo_id
+                        break
+
+        self.track_flight_plan(flight_plan)
+
+        # Send the modified flight plan back to the flight plan tracker
+        return flight_plan
+
+    def assign_fbo_from_database(self, flight_plan):
+        if flight_plan.status == "CANCELED":
+            return flight_plan
+
+        try:
+            # Check if the flight plan has an FBO assigned already
+            fbo_assignment = self.database.fetch_one(PLAN_FBO_SQL, (flight_plan.flight_ref,), prepared=True)
+
+            # If the flight plan has no FBO assigned, then assign it to one
+            if fbo_assignment is None:
+                try:
+                    open_fbo_sql = OPEN_FBO_COUNTERS_SQL if self.occupancy_counters else OPEN_FBO_SQL
+                    fbo_assignment = self.database.fetch_one(open_fbo_sql, (flight_plan.arr_arpt,), prepared=True)
                 except Exception as e:
                     print("Error grabbing parking data from database:", e)
+                    DATABASE_ERRORS.labels('fbo_assigner').inc()
 
                 if fbo_assignment:
                     # Assign the flight plan to this FBO, if an available one was found
-                    flight_plan['fbo_id'] = fbo_assignment[0]
+                    flight_plan.fbo_id = fbo_assignment[0]
 
         except Exception as e:
             print("Error grabbing parking data from database:", e)
+            DATABASE_ERRORS.labels('fbo_assigner').inc()
 
         # Send the modified flight plan back to the flight plan tracker
-        return flight_plan
\ No newline at end of file
+        return flight_plan
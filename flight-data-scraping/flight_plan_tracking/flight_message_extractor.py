@@ -0,0 +1,181 @@
+from xml.parsers import expat
+import xmltodict
+
+
+# Every path (below the fltdMessage root) that FlightDataProcessor.process_message reads for each message type.
+# The root's attributes are always kept. Each path's last element is kept whole, the elements along the way only
+# keep their attributes, text and the children on some path. Everything else is skipped without being built.
+ROUTE_DATA_PATHS = (
+    "ncsmRouteData/eta",
+    "ncsmRouteData/etd",
+    "ncsmTrackData/eta",
+    "ncsmTrackData/etd",
+)
+
+ARRIVAL_AIRPORT_PATHS = (
+    "qualifiedAircraftId/arrivalPoint/airport",
+)
+
+AIRLINE_DATA_PATHS = (
+    "airlineData/eta",
+    "airlineData/etd",
+    "airlineData/flightStatusAndSpec/aircraftModel",
+    "airlineData/flightStatusAndSpec/aircraftSpecification",
+)
+
+def under(parent, paths):
+    return tuple(parent + "/" + path for path in paths)
+
+MESSAGE_PATHS = {
+    "flightPlanInformation": under("flightPlanInformation", ROUTE_DATA_PATHS + ARRIVAL_AIRPORT_PATHS + ("flightAircraftSpecs",)),
+    "flightPlanAmendmentInformation": under("flightPlanAmendmentInformation", ROUTE_DATA_PATHS + ARRIVAL_AIRPORT_PATHS + ("ncsmDiversionCancelData/canceledFlightReference",)),
+    "arrivalInformation": under("arrivalInformation", ("ncsmFlightTimeData/nxcm:eta", "timeOfArrival")),
+    "departureInformation": under("departureInformation", ("ncsmFlightTimeData/eta", "timeOfDeparture", "flightAircraftSpecs")),
+    "flightPlanCancellation": (),
+    "trackInformation": under("trackInformation", ROUTE_DATA_PATHS + ARRIVAL_AIRPORT_PATHS),
+    "boundaryCrossingUpdate": (),
+    "oceanicReport": under("oceanicReport", ROUTE_DATA_PATHS),
+    "FlightCreate": under("ncsmFlightCreate", AIRLINE_DATA_PATHS),
+    "FlightModify": under("ncsmFlightModify", AIRLINE_DATA_PATHS),
+    "FlightScheduleActivate": under("ncsmFlightScheduleActivate", ROUTE_DATA_PATHS),
+    "FlightRoute": under("ncsmFlightRoute", ROUTE_DATA_PATHS),
+    "FlightSectors": (),
+    "FlightTimes": under("ncsmFlightTimes", ("eta", "etd")),
+}
+
+# Marks an element that is kept whole
+WHOLE = "whole"
+
+# Stands in for the skipped children of an element that has nothing else in it, so the element is still truthy like the full parse
+SKIPPED_KEY = "#skipped"
+
+MISSING = object()
+
+
+def compile_paths(paths):
+    """
+    Turns a list of 'a/b/c' paths into a tree of {element name: subtree}, where the last element of each path is WHOLE.
+    """
+    tree = dict()
+    for path in paths:
+        node = tree
+        names = path.split("/")
+        for name in names[:-1]:
+            node = node.setdefault(name, dict())
+        node[names[-1]] = WHOLE
+    return tree
+
+MESSAGE_TREES = {msg_type: compile_paths(paths) for msg_type, paths in MESSAGE_PATHS.items()}
+
+
+class UnknownMessageType(Exception):
+    pass
+
+
+class FlightMessageExtractor:
+    """
+    Parses a fltdMessage XML string into the same dictionary shape xmltodict.parse produces, but only builds the elements
+    FlightDataProcessor.process_message reads for the message's msgType (see MESSAGE_PATHS).
+    It runs on expat's streaming events, like xmltodict does, and element names are matched exactly as they appear in the
+    message (prefix included), which is also how xmltodict names them. That keeps the output of process_message identical.
+    Messages with a msgType that has no spec are handed to xmltodict in full.
+    """
+
+    def parse(self, message):
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+
+        # State of the element being built: its item (attributes and children), text, path subtree, and whether children were skipped
+        self.item = None
+        self.data = []
+        self.node = None
+        self.skipped = False
+        self.stack = []
+        # Depth inside an element that is being skipped
+        self.skip_depth = 0
+
+        parser = expat.ParserCreate()
+        parser.ordered_attributes = True
+        parser.buffer_text = True
+        parser.StartElementHandler = self.start_element
+        parser.EndElementHandler = self.end_element
+        parser.CharacterDataHandler = self.characters
+
+        try:
+            parser.Parse(message, True)
+        except UnknownMessageType:
+            return xmltodict.parse(message)
+
+        return self.item
+
+    def start_element(self, name, attributes):
+        if self.skip_depth:
+            self.skip_depth += 1
+            return
+
+        if not self.stack:
+            # The root element decides which paths are kept
+            msg_type = None
+            for i in range(0, len(attributes), 2):
+                if attributes[i] == "msgType":
+                    msg_type = attributes[i + 1]
+                    break
+            node = MESSAGE_TREES.get(msg_type)
+            if node is None:
+                raise UnknownMessageType(msg_type)
+        elif self.node is WHOLE:
+            node = WHOLE
+        else:
+            node = self.node.get(name)
+            if node is None:
+                self.skipped = True
+                self.skip_depth = 1
+                return
+
+        self.stack.append((self.item, self.data, self.node, self.skipped))
+
+        if attributes:
+            self.item = {"@" + attributes[i]: attributes[i + 1] for i in range(0, len(attributes), 2)}
+        else:
+            self.item = None
+        self.data = []
+        self.node = node
+        self.skipped = False
+
+    def end_element(self, name):
+        if self.skip_depth:
+            self.skip_depth -= 1
+            return
+
+        data = "".join(self.data) if self.data else None
+        item = self.item
+        if item is None and self.skipped:
+            item = {SKIPPED_KEY: True}
+
+        self.item, self.data, self.node, self.skipped = self.stack.pop()
+
+        if data:
+            data = data.strip() or None
+        if item is not None:
+            if data:
+                item = self.push_data(item, "#text", data)
+            self.item = self.push_data(self.item, name, item)
+        else:
+            self.item = self.push_data(self.item, name, data)
+
+    def characters(self, data):
+        if not self.skip_depth:
+            self.data.append(data)
+
+    @staticmethod
+    def push_data(item, key, data):
+        if item is None:
+            item = dict()
+        value = item.get(key, MISSING)
+        if value is MISSING:
+            item[key] = data
+        elif isinstance(value, list):
+            value.append(data)
+        else:
+            item[key] = [value, data]
+        return item
@@ -0,0 +1,310 @@
+import mmap
+import os
+import threading
+import time
+import orjson
+
+FSYNC_POLICIES = ("always", "interval", "never")
+
+# Segment files are named after the offset of their first record, padded so they sort in order
+SEGMENT_SUFFIX = ".log"
+SEGMENT_NAME_DIGITS = 20
+OFFSETS_FILE = "offsets.json"
+
+
+def segment_name(base_offset):
+    return str(base_offset).zfill(SEGMENT_NAME_DIGITS) + SEGMENT_SUFFIX
+
+
+class Segment:
+    """
+    One file of the log. Records are NDJSON lines, and a record's offset is the byte position of its line in the whole log,
+    so the record at an offset is found by subtracting the segment's base offset, without an index.
+    Reads go through a memory map of the file, which is remapped when the file has grown past it.
+    """
+    def __init__(self, directory, base_offset):
+        self.base_offset = base_offset
+        self.path = os.path.join(directory, segment_name(base_offset))
+        self.size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        self.map = None
+
+    def end_offset(self):
+        return self.base_offset + self.size
+
+    def mapped(self):
+        if self.size == 0:
+            return None
+        if self.map is None or len(self.map) < self.size:
+            self.close_map()
+            with open(self.path, 'rb') as file:
+                self.map = mmap.mmap(file.fileno(), self.size, access=mmap.ACCESS_READ)
+        return self.map
+
+    def read(self, offset, max_records):
+        """
+        Returns the raw records starting at offset (up to max_records), and the offset after the last one.
+        """
+        data = self.mapped()
+        records = []
+        position = offset - self.base_offset
+        while data is not None and len(records) < max_records and position < self.size:
+            end = data.find(b'\n', position, self.size)
+            if end == -1:
+                break
+            records.append(data[position:end])
+            position = end + 1
+        return records, self.base_offset + position
+
+    def close_map(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+
+class FlightPlanLog:
+    """
+    Append-only log of flight plans on local disk, split into segment files of up to segment_bytes.
+    Each flight plan is one NDJSON line. Consumers read from an offset and commit the offset they have finished with,
+    which is saved to disk, so a consumer that restarts picks up where it left off.
+    fsync_policy decides when appends are forced to disk: 'always' (every append), 'interval' (at most every
+    fsync_interval seconds) or 'never' (left to the OS). Closed segments are deleted once every consumer has committed
+    past them and they are older than retention_seconds, or sooner if the log is bigger than retention_bytes.
+    """
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, fsync_policy="interval", fsync_interval=1.0,
+                 retention_seconds=7 * 24 * 3600, retention_bytes=1024 * 1024 * 1024):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync_policy}', expected one of {FSYNC_POLICIES}")
+
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.retention_seconds = retention_seconds
+        self.retention_bytes = retention_bytes
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.condition = threading.Condition()
+
+        base_offsets = sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+        self.segments = [Segment(directory, base_offset) for base_offset in base_offsets] or [Segment(directory, 0)]
+
+        # A crash can leave half a record at the end of the log, drop it
+        self.active = self.segments[-1]
+        self.truncate_partial_record(self.active)
+
+        self.file = open(self.active.path, 'ab')
+        # Whether there are bytes written to the file object that readers can't see yet, or that are not forced to disk yet
+        self.unflushed = False
+        self.unsynced = False
+        self.last_fsync = time.monotonic()
+
+        self.offsets = self.load_offsets()
+
+        self.stats = {
+            'appended': 0,
+            'bytes_appended': 0,
+            'fsyncs': 0,
+            'segments_deleted': 0,
+        }
+
+    # --- Writing ---
+
+    def truncate_partial_record(self, segment):
+        if segment.size == 0:
+            return
+        with open(segment.path, 'rb+') as file:
+            data = mmap.mmap(file.fileno(), segment.size, access=mmap.ACCESS_READ)
+            last_newline = data.rfind(b'\n')
+            data.close()
+            if last_newline + 1 != segment.size:
+                print(f"Dropping {segment.size - last_newline - 1} bytes of a partly written flight plan from {segment.path}")
+                file.truncate(last_newline + 1)
+                segment.size = last_newline + 1
+
+    def append(self, flight_plan):
+        """
+        Appends a FlightPlan to the log, and returns its offset.
+        """
+        record = orjson.dumps(flight_plan.to_dict()) + b'\n'
+
+        with self.condition:
+            if self.active.size >= self.segment_bytes:
+                self.roll_segment()
+
+            offset = self.active.end_offset()
+            self.file.write(record)
+            self.active.size += len(record)
+            self.unflushed = True
+            self.unsynced = True
+
+            self.stats['appended'] += 1
+            self.stats['bytes_appended'] += len(record)
+
+            if self.fsync_policy == "always" or (self.fsync_policy == "interval" and time.monotonic() - self.last_fsync >= self.fsync_interval):
+                self.sync()
+
+            self.condition.notify_all()
+            return offset
+
+    def flush(self):
+        # Hand the buffered bytes to the OS, so the memory map can see them
+        if self.unflushed:
+            self.file.flush()
+            self.unflushed = False
+
+    def sync(self):
+        self.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = False
+        self.last_fsync = time.monotonic()
+        self.stats['fsyncs'] += 1
+
+    def roll_segment(self):
+        self.sync()
+        self.file.close()
+
+        self.active = Segment(self.directory, self.active.end_offset())
+        self.segments.append(self.active)
+        self.file = open(self.active.path, 'ab')
+
+        self.apply_retention()
+
+    def end_offset(self):
+        return self.active.end_offset()
+
+    def start_offset(self):
+        return self.segments[0].base_offset
+
+    # --- Reading ---
+
+    def read(self, offset, max_records, timeout=0):
+        """
+        Returns up to max_records raw JSON flight plans starting at offset, and the offset to read from next.
+        Waits up to timeout seconds for a record if there are none past offset yet.
+        An offset from before the oldest segment that is left starts from the oldest segment.
+        """
+        with self.condition:
+            if timeout > 0:
+                deadline = time.monotonic() + timeout
+                while offset >= self.end_offset():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+            self.flush()
+            # Appends only check the fsync interval when they happen, so make sure a quiet log still gets synced
+            if self.fsync_policy == "interval" and self.unsynced and time.monotonic() - self.last_fsync >= self.fsync_interval:
+                self.sync()
+
+            offset = max(offset, self.start_offset())
+            records = []
+            for segment in self.segments:
+                if len(records) >= max_records:
+                    break
+                if offset >= segment.end_offset():
+                    continue
+                segment_records, offset = segment.read(offset, max_records - len(records))
+                records.extend(segment_records)
+            return records, offset
+
+    def is_record_start(self, offset):
+        """
+        True if a record starts at offset, or it is the end of the log. Offsets from before the oldest segment that is left count too,
+        since reads start them from the oldest segment. Any other offset is in the middle of a record.
+        """
+        with self.condition:
+            if offset < 0 or offset > self.end_offset():
+                return False
+            if offset <= self.start_offset() or offset == self.end_offset():
+                return True
+
+            self.flush()
+            for segment in self.segments:
+                if offset == segment.base_offset:
+                    return True
+                if offset < segment.end_offset():
+                    # A record starts right after the newline that ends the one before it
+                    return segment.mapped()[offset - segment.base_offset - 1] == ord('\n')
+            return False
+
+    # --- Consumer offsets ---
+
+    def load_offsets(self):
+        path = os.path.join(self.directory, OFFSETS_FILE)
+        if not os.path.exists(path):
+            return dict()
+        try:
+            with open(path, 'rb') as file:
+                return orjson.loads(file.read())
+        except Exception as e:
+            print("Error reading committed flight plan log offsets:", e)
+            return dict()
+
+    def committed_offset(self, consumer):
+        with self.condition:
+            return max(self.offsets.get(consumer, self.start_offset()), self.start_offset())
+
+    def commit(self, consumer, offset):
+        """
+        Saves the offset a consumer has finished reading up to. The file is replaced in one step, so a crash leaves either the old or the new offsets.
+        """
+        with self.condition:
+            self.offsets[consumer] = min(max(offset, 0), self.end_offset())
+
+            path = os.path.join(self.directory, OFFSETS_FILE)
+            with open(path + ".tmp", 'wb') as file:
+                file.write(orjson.dumps(self.offsets))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(path + ".tmp", path)
+
+            self.apply_retention()
+
+    # --- Retention ---
+
+    def apply_retention(self):
+        """
+        Deletes closed segments that every consumer has committed past and that are older than retention_seconds.
+        If the log is still bigger than retention_bytes, the oldest closed segments are deleted even if they weren't read.
+        """
+        committed = min(self.offsets.values()) if self.offsets else self.start_offset()
+        now = time.time()
+
+        while len(self.segments) > 1:
+            segment = self.segments[0]
+            total_bytes = sum(kept.size for kept in self.segments)
+            fully_read = segment.end_offset() <= committed
+            expired = now - os.path.getmtime(segment.path) >= self.retention_seconds
+
+            if fully_read and expired:
+                pass
+            elif total_bytes > self.retention_bytes:
+                if not fully_read:
+                    print(f"Flight plan log is over {self.retention_bytes} bytes, deleting {segment.path} before every consumer has read it")
+            else:
+                break
+
+            segment.close_map()
+            os.remove(segment.path)
+            self.segments.pop(0)
+            self.stats['segments_deleted'] += 1
+
+    def info(self):
+        with self.condition:
+            return dict(
+                self.stats,
+                start_offset=self.start_offset(),
+                end_offset=self.end_offset(),
+                segments=len(self.segments),
+                committed_offsets=dict(self.offsets),
+                fsync_policy=self.fsync_policy,
+            )
+
+    def close(self):
+        with self.condition:
+            self.sync()
+            self.file.close()
+            for segment in self.segments:
+                segment.close_map()
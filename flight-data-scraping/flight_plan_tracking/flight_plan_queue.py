@@ -0,0 +1,184 @@
+from collections import OrderedDict, deque
+from itertools import count
+import threading
+import time
+
+from common.flight_plan import FlightPlan
+
+OVERFLOW_POLICIES = ("drop_oldest", "reject_new", "block")
+
+
+class PendingFlight:
+    """
+    Everything queued for one flight ref, collapsed into the few flight plans that give the database manager the same end result.
+    """
+    __slots__ = ('flying_before_cancel', 'cancel', 'flying', 'plan')
+
+    def __init__(self):
+        # Last flying flight plan seen before the last cancellation, so the plane still gets pointed at this flight
+        self.flying_before_cancel = None
+        # Last cancellation, which throws away every update before it
+        self.cancel = None
+        # flight_ref, acid and model of the last flying update after the cancellation
+        self.flying = None
+        # Field by field merge of every update after the cancellation
+        self.plan = None
+
+    def add(self, flight_plan):
+        if flight_plan.status == "CANCELED":
+            if self.flying is not None:
+                self.flying_before_cancel = self.flying
+            self.cancel = flight_plan
+            self.flying = None
+            self.plan = None
+            return
+
+        if self.plan is None:
+            self.plan = flight_plan.copy()
+        else:
+            self.plan.merge(flight_plan)
+
+        if flight_plan.status == "FLYING":
+            # The database manager only takes the plane's model from flying flight plans, and keeps the old one if there is none
+            previous = self.flying or self.flying_before_cancel
+            model = flight_plan.model
+            if model is None and previous is not None:
+                model = previous.model
+            self.flying = FlightPlan(flight_ref=flight_plan.flight_ref, acid=flight_plan.acid, status="FLYING", model=model)
+
+    def flight_plans(self):
+        """
+        Returns the flight plans to send, in order.
+        """
+        flight_plans = []
+        if self.flying_before_cancel is not None:
+            flight_plans.append(self.flying_before_cancel)
+        if self.cancel is not None:
+            flight_plans.append(self.cancel)
+        if self.plan is not None:
+            if self.flying is not None:
+                if self.plan.status == "FLYING":
+                    self.plan.model = self.flying.model
+                else:
+                    # The flight landed (or was rescheduled) since it was flying, send the flying state first so the plane still points at it
+                    flight_plans.append(self.flying)
+            flight_plans.append(self.plan)
+        return flight_plans
+
+
+class FlightPlanQueue:
+    """
+    Queue of flight plans waiting for the database manager, keyed by flight ref.
+    A flight plan for a flight that is already queued is merged into it (fields that are None don't overwrite anything),
+    and a cancellation replaces the updates queued before it. The flight keeps its place in line.
+    At most max_size flights are queued. When it is full, overflow_policy decides what happens to a new flight:
+    'drop_oldest' drops the flight at the front, 'reject_new' drops the new flight and 'block' waits for space.
+    """
+    def __init__(self, max_size=10000, overflow_policy="drop_oldest"):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow_policy}', expected one of {OVERFLOW_POLICIES}")
+
+        self.max_size = max_size
+        self.overflow_policy = overflow_policy
+
+        # flight ref -> PendingFlight, oldest first
+        self.pending = OrderedDict()
+        # Flight plans taken off the front of pending, that a request didn't have room for yet
+        self.ready = deque()
+
+        # Flight plans that can't be merged (no flight ref or acid) each get their own key
+        self.unmerged_keys = count()
+
+        self.condition = threading.Condition()
+
+        self.counts = {
+            'received': 0,
+            'coalesced': 0,
+            'sent': 0,
+            'dropped': 0,
+            'rejected': 0,
+        }
+        self.max_depth = 0
+
+    def key(self, flight_plan):
+        if flight_plan.flight_ref is None or (flight_plan.acid is None and flight_plan.status != "CANCELED"):
+            # The database manager skips these, so merging them into another flight plan would change what gets written
+            return ("unmerged", next(self.unmerged_keys))
+        return flight_plan.flight_ref
+
+    def put(self, flight_plan):
+        """
+        Queues a flight plan. Returns False if it was rejected because the queue is full.
+        """
+        with self.condition:
+            self.counts['received'] += 1
+            key = self.key(flight_plan)
+
+            pending_flight = self.pending.get(key)
+            if pending_flight is not None:
+                self.counts['coalesced'] += 1
+                pending_flight.add(flight_plan)
+                return True
+
+            while len(self.pending) >= self.max_size:
+                if self.overflow_policy == "drop_oldest":
+                    self.pending.popitem(last=False)
+                    self.counts['dropped'] += 1
+                elif self.overflow_policy == "reject_new":
+                    self.counts['rejected'] += 1
+                    return False
+                else:
+                    self.condition.wait()
+
+            pending_flight = PendingFlight()
+            pending_flight.add(flight_plan)
+            self.pending[key] = pending_flight
+            self.max_depth = max(self.max_depth, len(self.pending))
+
+            self.condition.notify_all()
+            return True
+
+    def take(self, max_plans, timeout=0):
+        """
+        Takes up to max_plans flight plans off the front of the queue, waiting up to timeout seconds for the first one.
+        """
+        with self.condition:
+            if timeout > 0:
+                deadline = time.monotonic() + timeout
+                while not self.ready and not self.pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+            flight_plans = []
+            while len(flight_plans) < max_plans:
+                if not self.ready:
+                    if not self.pending:
+                        break
+                    _, pending_flight = self.pending.popitem(last=False)
+                    self.ready.extend(pending_flight.flight_plans())
+                    continue
+                flight_plans.append(self.ready.popleft())
+
+            self.counts['sent'] += len(flight_plans)
+
+            # Wake up a producer that is blocked on a full queue
+            self.condition.notify_all()
+            return flight_plans
+
+    def depth(self):
+        return len(self.pending) + len(self.ready)
+
+    def stats(self):
+        with self.condition:
+            received = self.counts['received']
+            return dict(
+                self.counts,
+                depth=self.depth(),
+                max_depth=self.max_depth,
+                max_size=self.max_size,
+                overflow_policy=self.overflow_policy,
+                # Share of queued flight plans that were merged into one that was already waiting
+                coalesce_ratio=self.counts['coalesced'] / received if received else 0.0,
+            )
@@ -1,27 +1,147 @@
-from flask import Flask, jsonify
-from queue import Queue, Empty
+from flask import Flask, Response, request
+from waitress import serve
+from dotenv import load_dotenv
 import logging
+import orjson
+import os
+
+from common.metrics import REGISTRY, CONTENT_TYPE
+from flight_plan_queue import FlightPlanQueue
+from flight_plan_log import FlightPlanLog
+from pipeline_metrics import PUBLISHED, QUEUE_DEPTH, LOG_LAG_BYTES
 
 # Silence Flask's request logs
 log = logging.getLogger('werkzeug')
 log.setLevel(logging.ERROR)
 
+load_dotenv()
+
+# Upper bounds for the batch endpoint, so a single request can not hold a server thread forever
+MAX_BATCH_SIZE = int(os.getenv('FLIGHT_PLANS_MAX_BATCH_SIZE', 1000))
+MAX_LONG_POLL_TIMEOUT = float(os.getenv('FLIGHT_PLANS_MAX_LONG_POLL_TIMEOUT', 30))
+
+# Max number of flights waiting in the queue, and what to do with a new flight when it is full ('drop_oldest', 'reject_new' or 'block')
+QUEUE_MAX = max(int(os.getenv('FLIGHT_PLAN_QUEUE_MAX', 10000)), 1)
+QUEUE_OVERFLOW_POLICY = os.getenv('FLIGHT_PLAN_QUEUE_OVERFLOW', 'drop_oldest')
+
+# 'queue' keeps waiting flight plans in memory, 'log' appends them to a log on disk that survives restarts
+FLIGHT_PLAN_STORE = os.getenv('FLIGHT_PLAN_STORE', 'queue')
+
+# Where the log is kept (mount a volume here), how big each segment file gets and when appends are forced to disk ('always', 'interval' or 'never')
+LOG_DIR = os.getenv('FLIGHT_PLAN_LOG_DIR', 'flight_plan_log')
+LOG_SEGMENT_BYTES = int(os.getenv('FLIGHT_PLAN_LOG_SEGMENT_BYTES', 64 * 1024 * 1024))
+LOG_FSYNC = os.getenv('FLIGHT_PLAN_LOG_FSYNC', 'interval')
+LOG_FSYNC_INTERVAL = float(os.getenv('FLIGHT_PLAN_LOG_FSYNC_INTERVAL', 1.0))
+# Segments are deleted once every consumer has read them and they are this old, or sooner once the log is bigger than the byte limit
+LOG_RETENTION_SECONDS = float(os.getenv('FLIGHT_PLAN_LOG_RETENTION_SECONDS', 7 * 24 * 3600))
+LOG_RETENTION_BYTES = int(os.getenv('FLIGHT_PLAN_LOG_RETENTION_BYTES', 1024 * 1024 * 1024))
+
+# The consumer whose committed offset is used when a request doesn't give one
+DEFAULT_CONSUMER = 'database_manager'
+
+# Number of worker threads for the WSGI server (each long poll holds one thread while it waits)
+SERVER_THREADS = int(os.getenv('FLIGHT_PLANS_API_THREADS', 8))
+
 app = Flask(__name__)
 
-queue = Queue()
+# Flight plans wait in the coalescing queue (merged per flight, and only serialized when they are sent), or in the log on disk
+queue = None
+flight_plan_log = None
+if FLIGHT_PLAN_STORE == 'log':
+    flight_plan_log = FlightPlanLog(LOG_DIR, LOG_SEGMENT_BYTES, LOG_FSYNC, LOG_FSYNC_INTERVAL, LOG_RETENTION_SECONDS, LOG_RETENTION_BYTES)
+else:
+    queue = FlightPlanQueue(QUEUE_MAX, QUEUE_OVERFLOW_POLICY)
+
+# Read when the metrics are scraped
+if flight_plan_log is not None:
+    LOG_LAG_BYTES.set_function(lambda: flight_plan_log.end_offset() - flight_plan_log.committed_offset(DEFAULT_CONSUMER))
+else:
+    QUEUE_DEPTH.set_function(queue.depth)
 
 def add_flight_plan(plan):
-    queue.put(plan)
+    PUBLISHED.inc()
+    if flight_plan_log is not None:
+        flight_plan_log.append(plan)
+        return True
+    return queue.put(plan)
+
+def serialize(plan):
+    return orjson.dumps(plan.to_dict())
+
+def json_response(body):
+    return Response(body, status=200, mimetype='application/json')
+
+def error_response(message):
+    return Response(orjson.dumps({'error': message}), status=400, mimetype='application/json')
 
 # API endpoint to get the next flight plan
 @app.route('/flight-plan', methods=['GET'])
 def get_next_flight_plan():
-    try:
-        flight_plan = queue.get_nowait()
-        return jsonify({"flight_plan": flight_plan}), 200
-    except Empty:
-        return jsonify({"flight_plan": None}), 200
+    if flight_plan_log is not None:
+        # Reads as its own consumer, so it doesn't move the database manager's offset
+        records, next_offset = flight_plan_log.read(flight_plan_log.committed_offset('flight-plan'), 1)
+        flight_plan_log.commit('flight-plan', next_offset)
+        return json_response(b'{"flight_plan":' + (records[0] if records else b'null') + b'}')
+
+    flight_plans = queue.take(1)
+    if flight_plans:
+        return json_response(b'{"flight_plan":' + serialize(flight_plans[0]) + b'}')
+    return json_response(b'{"flight_plan":null}')
+
+# API endpoint to get up to 'max' queued flight plans at once
+# If the queue is empty, wait up to 'timeout' seconds for the first flight plan to show up before returning an empty list
+@app.route('/flight-plans', methods=['GET'])
+def get_flight_plans():
+    max_plans = min(max(request.args.get('max', 100, type=int), 1), MAX_BATCH_SIZE)
+    timeout = min(max(request.args.get('timeout', 0, type=float), 0), MAX_LONG_POLL_TIMEOUT)
+
+    if flight_plan_log is not None:
+        # Read from 'offset', or from where 'consumer' last committed, and say where to read from next
+        consumer = request.args.get('consumer', DEFAULT_CONSUMER)
+        offset = request.args.get('offset', type=int)
+        if offset is None:
+            offset = flight_plan_log.committed_offset(consumer)
+        # An offset in the middle of a record would send the rest of its line as a flight plan
+        elif not flight_plan_log.is_record_start(offset):
+            return error_response(f"offset {offset} is not the start of a flight plan in the log")
+
+        records, next_offset = flight_plan_log.read(offset, max_plans, timeout)
+        return json_response(b'{"flight_plans":[' + b','.join(records) + b'],"next_offset":' + str(next_offset).encode() + b'}')
+
+    flight_plans = queue.take(max_plans, timeout)
+
+    return json_response(b'{"flight_plans":[' + b','.join(serialize(plan) for plan in flight_plans) + b']}')
+
+# API endpoint for a consumer to save the offset it has finished with (only when FLIGHT_PLAN_STORE is 'log')
+# Takes {"offset": N, "consumer": name}
+@app.route('/flight-plans/commit', methods=['POST'])
+def commit_offset():
+    if flight_plan_log is None:
+        return error_response("flight plans are not kept in a log")
+
+    body = request.get_json(silent=True) or dict()
+    offset = body.get('offset')
+    if not isinstance(offset, int):
+        return error_response("offset must be an integer")
+    # Reads that start from a committed offset have to start on a record too
+    if not flight_plan_log.is_record_start(offset):
+        return error_response(f"offset {offset} is not the start of a flight plan in the log")
+
+    flight_plan_log.commit(body.get('consumer', DEFAULT_CONSUMER), offset)
+    return json_response(b'{"committed":' + str(offset).encode() + b'}')
+
+# API endpoint for the queue metrics (depth, coalesce ratio, dropped and rejected flight plans), or the log's offsets and counts
+@app.route('/flight-plans/stats', methods=['GET'])
+def get_queue_stats():
+    if flight_plan_log is not None:
+        return json_response(orjson.dumps(flight_plan_log.info()))
+    return json_response(orjson.dumps(queue.stats()))
+
+# API endpoint for Prometheus: message counts per msgType, latency histograms of each stage, queue depth and database errors
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(REGISTRY.render(), status=200, content_type=CONTENT_TYPE)
 
-# Function to run the Flask app
+# Function to run the Flask app on a multi-threaded WSGI server
 def run_app():
-    app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
+    serve(app, host='0.0.0.0', port=5000, threads=SERVER_THREADS)
@@ -1,5 +1,6 @@
 import requests
 from dotenv import load_dotenv
+import asyncio
 import os
 import xmltodict
 import threading
@@ -7,9 +8,58 @@ import time
 
 
 from flightDataProcessor import FlightDataProcessor
+from flight_message_extractor import FlightMessageExtractor
+from message_header_filter import MessageHeaderFilter, DEFAULT_ACCEPTED_MSG_TYPES
 import flight_plans_api
 from fbo_assigner import Fbo_assigner
 from airport_code_normalizer import Airport_code_normalizer
+from aircraft_model_normalizer import Aircraft_model_normalizer
+from parsing_workers import ParsingWorkers
+from async_pipeline import AsyncPipeline
+from stale_message_filter import StaleMessageFilter
+from pipeline_metrics import PARSE_SECONDS, NORMALIZER_SECONDS, MODEL_NORMALIZER_SECONDS, FBO_ASSIGNER_SECONDS
+
+
+def fetch_message(session, api_url):
+    """
+    Gets the next JMS message, or None if there isn't one or the API couldn't be reached.
+    """
+    try:
+        response = session.get(api_url, timeout=1)
+        return response.json()['message']
+    except requests.exceptions.RequestException as e:
+        print("Error requesting from JMS API:", e)
+        return None
+
+
+def publish_flight_plan(flight_plan, staleMessageFilter, airport_code_normalizer, aircraft_model_normalizer, fboAssigner):
+    # Messages can arrive out of order, so leave out what a newer message already published for this flight
+    if staleMessageFilter is None:
+        flight_plans = [flight_plan]
+    else:
+        flight_plans = staleMessageFilter.filter(flight_plan)
+
+    for flight_plan in flight_plans:
+        enrich_and_publish(flight_plan, airport_code_normalizer, aircraft_model_normalizer, fboAssigner)
+
+
+def enrich_and_publish(flight_plan, airport_code_normalizer, aircraft_model_normalizer, fboAssigner):
+    # Sometimes, the airport code comes in as a 3 letter code (IATA), and sometimes it comes in as a 4 letter code (ICAO)
+    # So, attempt to convert all 3 letter codes to their 4 letter equivalent, if it exists
+    with NORMALIZER_SECONDS.time():
+        flight_plan = airport_code_normalizer.IATA_codes_to_ICAO_codes(flight_plan)
+
+    # The aircraft model comes in as a designator, a specification (i.e. C68A/L) or a name, so store it as the FAA designator in aircraft_types
+    if aircraft_model_normalizer is not None:
+        with MODEL_NORMALIZER_SECONDS.time():
+            flight_plan = aircraft_model_normalizer.normalize_model(flight_plan)
+
+    # Assign the flight plan a mock FBO (this function is a placeholder until the real FBO assignment data is incorporated)
+    with FBO_ASSIGNER_SECONDS.time():
+        flight_plan = fboAssigner.assign_fbo(flight_plan)
+
+    # Expose the objects to an api endpoint so it can be used by a database managing microservice
+    flight_plans_api.add_flight_plan(flight_plan)
 
 
 if __name__ == "__main__":
@@ -19,6 +69,37 @@ if __name__ == "__main__":
     API_URL = os.getenv('JMS_API')
     DEBUG = os.getenv('DEBUG')
 
+    # 'targeted' only builds the parts of each message the flight data processor reads, 'xmltodict' converts the whole message
+    XML_PARSER = os.getenv('XML_PARSER', 'targeted')
+
+    # Comma separated message types to process, every other message type is dropped before it is parsed
+    ACCEPTED_MSG_TYPES = os.getenv('ACCEPTED_MSG_TYPES')
+    ACCEPTED_MSG_TYPES = [msg_type.strip() for msg_type in ACCEPTED_MSG_TYPES.split(',')] if ACCEPTED_MSG_TYPES else DEFAULT_ACCEPTED_MSG_TYPES
+
+    # Number of worker processes that parse messages, sharded by flightRef. 0 parses every message in this process
+    PARSER_WORKERS = int(os.getenv('PARSER_WORKERS', 0))
+    PARSER_WORKER_BATCH_SIZE = int(os.getenv('PARSER_WORKER_BATCH_SIZE', 50))
+    # Longest time (seconds) a message waits for its batch to fill up before the batch is sent to its worker anyway
+    PARSER_WORKER_FLUSH_INTERVAL = float(os.getenv('PARSER_WORKER_FLUSH_INTERVAL', 0.05))
+
+    # 'loop' handles one message at a time in the loop below, 'async' runs fetch, parse, enrich and publish as asyncio stages with bounded queues between them
+    PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'loop')
+    PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 100))
+    # How long the async pipeline waits before asking an empty message API again, doubling from the min to the max while it stays empty
+    PIPELINE_MIN_POLL_INTERVAL = float(os.getenv('PIPELINE_MIN_POLL_INTERVAL', 0.05))
+    PIPELINE_MAX_POLL_INTERVAL = float(os.getenv('PIPELINE_MAX_POLL_INTERVAL', 2.0))
+
+    # If True, messages older than what was already published for their flight can't overwrite it (see stale_message_filter.py)
+    STALE_MESSAGE_FILTER = os.getenv('STALE_MESSAGE_FILTER', 'True') == "True"
+    STALE_MESSAGE_FILTER_MAX_FLIGHTS = int(os.getenv('STALE_MESSAGE_FILTER_MAX_FLIGHTS', 50000))
+    STALE_MESSAGE_FILTER_FINISHED_TTL = float(os.getenv('STALE_MESSAGE_FILTER_FINISHED_TTL', 3600))
+
+    # If True, resolve the aircraft models to the FAA designators in aircraft_types before they are stored
+    AIRCRAFT_MODEL_NORMALIZER = os.getenv('AIRCRAFT_MODEL_NORMALIZER', 'True') == "True"
+
+    # If True, the database manager's writer runs in this process and takes the flight plans straight off the queue, instead of over the api
+    EMBEDDED_DATABASE_MANAGER = os.getenv('EMBEDDED_DATABASE_MANAGER') == "True"
+
     # If debug is True, then use debugpy to connect this container to a local debugger 
     if DEBUG == "True":
         import debugpy
@@ -27,19 +108,69 @@ if __name__ == "__main__":
         debugpy.wait_for_client()  # Wait until the debugger is connected
         print("Debugger is attached.")
 
-    # Object that processes the flight data message into a flight plan dictionary based on the context of the message
+    # Pool of processes that parse messages in parallel, the flight plans come back here to be normalized, assigned and published in order
+    # (started before any database connection or thread is made, so the worker processes don't inherit them)
+    # The async pipeline parses in its own parse stage, so it doesn't use them
+    parsingWorkers = None
+    if PARSER_WORKERS > 0 and PIPELINE_MODE != 'async':
+        parsingWorkers = ParsingWorkers(PARSER_WORKERS, XML_PARSER, PARSER_WORKER_BATCH_SIZE, PARSER_WORKER_FLUSH_INTERVAL)
+
+    # Object that reads the message type from the root tag and drops message types that have no use, before they are parsed
+    messageHeaderFilter = MessageHeaderFilter(ACCEPTED_MSG_TYPES)
+
+    # Object that converts the XML message into a dictionary, keeping only what the flight data processor needs for the message type
+    flightMessageExtractor = FlightMessageExtractor()
+
+    # Object that processes the flight data message into a FlightPlan based on the context of the message
     flightDataProcessor = FlightDataProcessor()
 
+    # Object that keeps old messages from overwriting newer ones, before anything is looked up or assigned
+    staleMessageFilter = None
+    if STALE_MESSAGE_FILTER:
+        staleMessageFilter = StaleMessageFilter(STALE_MESSAGE_FILTER_MAX_FLIGHTS, STALE_MESSAGE_FILTER_FINISHED_TTL)
+
     # Object that assigns flight plans to mock FBOs as a placeholder until the real FBO assignment data is incorporated
     fboAssigner = Fbo_assigner()
 
     # Object that tries to turn all 3 letter airport codes (IATA) into 4 letter airport codes (ICAO), for continuity
     airport_code_normalizer = Airport_code_normalizer()
 
+    # Object that resolves the raw aircraft model strings to the FAA designator used by aircraft_types, so the fleet table joins on an exact key
+    aircraft_model_normalizer = Aircraft_model_normalizer() if AIRCRAFT_MODEL_NORMALIZER else None
+
+    if EMBEDDED_DATABASE_MANAGER:
+        if flight_plans_api.queue is None:
+            raise SystemExit("EMBEDDED_DATABASE_MANAGER needs FLIGHT_PLAN_STORE=queue, the embedded writer takes the flight plans from the in-memory queue")
+
+        # The database_manager directory has to be on the PYTHONPATH (it is in the docker image)
+        from embedded_writer import Embedded_writer
+        embeddedWriter = Embedded_writer(flight_plans_api.queue)
+        embeddedWriter.start()
+
     # Start Flask app in a separate thread so it can run concurrently with the while loop below
     flask_thread = threading.Thread(target=flight_plans_api.run_app, daemon=True)
     flask_thread.start()
 
+    if PIPELINE_MODE == 'async':
+        pipeline = AsyncPipeline(
+            API_URL, messageHeaderFilter, flightMessageExtractor, flightDataProcessor, airport_code_normalizer, fboAssigner,
+            staleMessageFilter=staleMessageFilter,
+            aircraft_model_normalizer=aircraft_model_normalizer,
+            xml_parser=XML_PARSER,
+            queue_size=PIPELINE_QUEUE_SIZE,
+            min_poll_interval=PIPELINE_MIN_POLL_INTERVAL,
+            max_poll_interval=PIPELINE_MAX_POLL_INTERVAL,
+        )
+        asyncio.run(pipeline.run())
+
+    if parsingWorkers is not None:
+        # Reuse one keep-alive HTTP connection, the API is asked again straight away as long as it has messages
+        session = requests.Session()
+        fetch = lambda: fetch_message(session, API_URL)
+        publish = lambda flight_plan: publish_flight_plan(flight_plan, staleMessageFilter, airport_code_normalizer, aircraft_model_normalizer, fboAssigner)
+        while True:
+            parsingWorkers.pump(fetch, messageHeaderFilter, publish)
+
     while True:
         # Get the next JMS message
         try:
@@ -49,25 +180,27 @@ if __name__ == "__main__":
         except requests.exceptions.RequestException as e:
             print("Error requesting from JMS API:", e)
         
-        if message:
-            # The message is XML
-            # Convert it all to json
-            message_json = xmltodict.parse(message)
+        # Read the clock once, every message handled in this pass compares its times against it
+        flightDataProcessor.set_current_time()
 
-            # Parses the message and returns a flight_plan dictionary
-            flight_plan = flightDataProcessor.process_message(message_json.get('fltdMessage'))
+        # Only the root tag is read for messages that would be thrown away anyway
+        header = messageHeaderFilter.accept(message) if message else None
 
-            if flight_plan is not None:
-                # Sometimes, the airport code comes in as a 3 letter code (IATA), and sometimes it comes in as a 4 letter code (ICAO)
-                # So, attempt to convert all 3 letter codes to their 4 letter equivalent, if it exists
-                flight_plan = airport_code_normalizer.IATA_codes_to_ICAO_codes(flight_plan)
+        if header:
+            with PARSE_SECONDS.time():
+                # The message is XML
+                # Convert it to json
+                if XML_PARSER == 'xmltodict':
+                    message_json = xmltodict.parse(message)
+                else:
+                    message_json = flightMessageExtractor.parse(message)
 
-                # Assign the flight plan a mock FBO (this function is a placeholder until the real FBO assignment data is incorporated)
-                flight_plan = fboAssigner.assign_fbo(flight_plan)
+                # Parses the message and returns a FlightPlan
+                flight_plan = flightDataProcessor.process_message(message_json.get('fltdMessage'))
+
+            if flight_plan is not None:
+                publish_flight_plan(flight_plan, staleMessageFilter, airport_code_normalizer, aircraft_model_normalizer, fboAssigner)
 
-                # Expose the objects to an api endpoint so it can be used by a database managing microservice
-                flight_plans_api.add_flight_plan(flight_plan)
-        
         # Sleep for a short period to avoid overwhelming the API
         time.sleep(0.2)
 
@@ -0,0 +1,104 @@
+from collections import Counter
+import re
+import time
+
+from pipeline_metrics import MESSAGES
+
+# The message types FlightDataProcessor gets a flight plan out of
+DEFAULT_ACCEPTED_MSG_TYPES = (
+    "flightPlanInformation",
+    "flightPlanAmendmentInformation",
+    "arrivalInformation",
+    "departureInformation",
+    "flightPlanCancellation",
+    "trackInformation",
+    "oceanicReport",
+    "FlightCreate",
+    "FlightModify",
+    "FlightScheduleActivate",
+    "FlightRoute",
+    "FlightTimes",
+)
+
+# The other message types of the flight data stream, which are dropped by default
+IGNORED_MSG_TYPES = (
+    "boundaryCrossingUpdate",
+    "FlightSectors",
+)
+
+# Counted in place of any message type the stream isn't known to send, so the msg_type label can't grow without bound
+OTHER_MSG_TYPE = "other"
+
+HEADER_ATTRIBUTES = ("msgType", "acid", "flightRef")
+
+ATTRIBUTE_PATTERN = re.compile(r'([\w:.-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+
+
+class MessageHeaderFilter:
+    """
+    Reads only the attributes of the root fltdMessage tag (msgType, acid, flightRef) and drops the message types that
+    are not needed, before any XML tree is built. Keeps a count of accepted and dropped messages per message type,
+    with the types that aren't known counted together as "other".
+    """
+    def __init__(self, accepted_msg_types=DEFAULT_ACCEPTED_MSG_TYPES, stats_interval=60.0):
+        self.accepted_msg_types = frozenset(accepted_msg_types)
+        self.known_msg_types = self.accepted_msg_types | frozenset(DEFAULT_ACCEPTED_MSG_TYPES) | frozenset(IGNORED_MSG_TYPES)
+        self.stats_interval = stats_interval
+
+        self.accepted = Counter()
+        self.dropped = Counter()
+        self.last_stats_print = time.monotonic()
+
+    @staticmethod
+    def read_header(message):
+        """
+        Returns {'msgType', 'acid', 'flightRef'} from the root tag of the message, or None if there is no root tag.
+        Attributes that are missing are None.
+        """
+        # Skip over the XML declaration, comments and whitespace to the root tag
+        start = message.find("<")
+        while start != -1 and message.startswith(("<?", "<!"), start):
+            start = message.find("<", start + 1)
+        if start == -1:
+            return None
+
+        end = message.find(">", start)
+        if end == -1:
+            return None
+
+        header = dict.fromkeys(HEADER_ATTRIBUTES)
+        for name, double_quoted, single_quoted in ATTRIBUTE_PATTERN.findall(message, start, end):
+            if name in header:
+                header[name] = double_quoted or single_quoted
+        return header
+
+    def accept(self, message):
+        """
+        Returns the message's header if its message type should be processed, otherwise None.
+        """
+        header = self.read_header(message)
+        msg_type = header.get("msgType") if header else None
+        label = msg_type if msg_type in self.known_msg_types else OTHER_MSG_TYPE
+
+        if msg_type in self.accepted_msg_types:
+            self.accepted[label] += 1
+            MESSAGES.labels(label, 'accepted').inc()
+        else:
+            self.dropped[label] += 1
+            MESSAGES.labels(label, 'dropped').inc()
+            header = None
+
+        if time.monotonic() - self.last_stats_print >= self.stats_interval:
+            self.print_stats()
+
+        return header
+
+    def stats(self):
+        return {'accepted': dict(self.accepted), 'dropped': dict(self.dropped)}
+
+    def print_stats(self):
+        self.last_stats_print = time.monotonic()
+
+        accepted = ", ".join(f"{msg_type} {count}" for msg_type, count in self.accepted.most_common())
+        dropped = ", ".join(f"{msg_type} {count}" for msg_type, count in self.dropped.most_common())
+        print(f"Messages accepted: {accepted or 'none'}. Messages dropped: {dropped or 'none'}")
@@ -0,0 +1,186 @@
+import multiprocessing
+from queue import Empty
+import time
+import zlib
+import xmltodict
+
+from flightDataProcessor import FlightDataProcessor
+from flight_message_extractor import FlightMessageExtractor
+from pipeline_metrics import PARSE_SECONDS, PARSE_ERRORS
+
+
+def shard_for(flight_ref, workers):
+    # crc32 instead of hash(), since hash() of a string changes between processes and runs
+    return zlib.crc32((flight_ref or "").encode('utf-8')) % workers
+
+
+def parse_messages(messages, xml_parser, flightMessageExtractor, flightDataProcessor, parse_times=None):
+    """
+    Parses a batch of XML messages into flight plans, in order. Messages that fail to parse are printed and skipped.
+    The time each message took goes into the parse latency histogram and the failures into the parse error counter,
+    or, if parse_times is given, the times are appended to it and the failures are left to the caller to count.
+    """
+    flight_plans = []
+    for message in messages:
+        start = time.perf_counter()
+        try:
+            if xml_parser == 'xmltodict':
+                message_json = xmltodict.parse(message)
+            else:
+                message_json = flightMessageExtractor.parse(message)
+
+            flight_plan = flightDataProcessor.process_message(message_json.get('fltdMessage'))
+        except Exception as e:
+            print("Error parsing flight message:", e)
+            if parse_times is None:
+                PARSE_ERRORS.inc()
+            continue
+
+        if parse_times is None:
+            PARSE_SECONDS.observe(time.perf_counter() - start)
+        else:
+            parse_times.append(time.perf_counter() - start)
+
+        if flight_plan is not None:
+            flight_plans.append(flight_plan)
+    return flight_plans
+
+
+def worker_main(input_queue, output_queue, xml_parser):
+    """
+    Runs in each worker process. Takes batches of messages until it gets None, and sends back
+    (message count, flight plans, parse times, parse errors) for each batch.
+    The parse times and errors go back to the main process, since the metrics are served from there.
+    """
+    flightMessageExtractor = FlightMessageExtractor()
+    flightDataProcessor = FlightDataProcessor()
+
+    while True:
+        messages = input_queue.get()
+        if messages is None:
+            break
+
+        # Read the clock once per batch
+        flightDataProcessor.set_current_time()
+        parse_times = []
+        flight_plans = parse_messages(messages, xml_parser, flightMessageExtractor, flightDataProcessor, parse_times)
+        # Every message that parsed has a time
+        output_queue.put((len(messages), flight_plans, parse_times, len(messages) - len(parse_times)))
+
+
+class ParsingWorkers:
+    """
+    Pool of worker processes that parse XML messages and run FlightDataProcessor.process_message on them.
+    Messages are sharded by a hash of their flightRef, so every message for one flight goes to the same worker and
+    comes back in the order it was sent. The flight plans from every worker come back on a single results queue,
+    to be enriched and published by one stage in the main process.
+    Messages are sent in batches of up to batch_size per worker, to keep the cost of passing them between processes down,
+    and a batch that isn't full is sent once its oldest message has waited flush_interval seconds.
+    """
+    def __init__(self, workers, xml_parser='targeted', batch_size=50, flush_interval=0.05):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.output_queue = multiprocessing.Queue()
+        self.input_queues = []
+        self.processes = []
+        for _ in range(workers):
+            input_queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=worker_main, args=(input_queue, self.output_queue, xml_parser), daemon=True)
+            process.start()
+            self.input_queues.append(input_queue)
+            self.processes.append(process)
+
+        # Messages waiting to be sent to each worker
+        self.batches = [[] for _ in range(workers)]
+        # Messages sent to the workers that have not come back yet
+        self.in_flight = 0
+        # When the oldest message that hasn't been sent was submitted
+        self.first_unsent_time = None
+
+    def submit(self, flight_ref, message):
+        if self.first_unsent_time is None:
+            self.first_unsent_time = time.monotonic()
+        shard = shard_for(flight_ref, self.workers)
+        batch = self.batches[shard]
+        batch.append(message)
+        if len(batch) >= self.batch_size:
+            self.send(shard)
+
+    def send(self, shard):
+        batch = self.batches[shard]
+        if batch:
+            self.input_queues[shard].put(batch)
+            self.in_flight += len(batch)
+            self.batches[shard] = []
+
+    def flush(self):
+        """
+        Sends every partly filled batch to its worker.
+        """
+        for shard in range(self.workers):
+            self.send(shard)
+        self.first_unsent_time = None
+
+    def maybe_flush(self):
+        """
+        Sends the partly filled batches if the oldest message in them has waited flush_interval seconds.
+        """
+        if self.first_unsent_time is not None and time.monotonic() - self.first_unsent_time >= self.flush_interval:
+            self.flush()
+
+    def pump(self, fetch_message, messageHeaderFilter, publish, idle_wait=0.2):
+        """
+        One pass of the main loop with parsing workers: fetches a message and hands it to its worker, sends the batches that are due,
+        and publishes the flight plans that have come back, in order.
+        While the message API has a backlog, the next pass asks it again straight away. When it is empty, everything unsent is sent
+        and the pass waits up to idle_wait seconds for flight plans to come back (or just sleeps if none are out), instead of a fixed sleep.
+        Returns True if a message was fetched.
+        """
+        message = fetch_message()
+        if message:
+            header = messageHeaderFilter.accept(message)
+            if header:
+                # All messages for one flight go to the same worker, so they stay in order
+                self.submit(header['flightRef'], message)
+            self.maybe_flush()
+        else:
+            self.flush()
+
+        if message or self.in_flight:
+            for flight_plan in self.results(timeout=0 if message else idle_wait):
+                publish(flight_plan)
+        else:
+            time.sleep(idle_wait)
+        return bool(message)
+
+    def results(self, timeout=0):
+        """
+        Returns the flight plans that have come back so far, waiting up to timeout seconds for the first batch.
+        """
+        flight_plans = []
+        try:
+            if timeout > 0 and self.in_flight:
+                self.receive(self.output_queue.get(timeout=timeout), flight_plans)
+            while self.in_flight:
+                self.receive(self.output_queue.get_nowait(), flight_plans)
+        except Empty:
+            pass
+        return flight_plans
+
+    def receive(self, result, flight_plans):
+        count, batch, parse_times, parse_errors = result
+        self.in_flight -= count
+        flight_plans.extend(batch)
+        for parse_time in parse_times:
+            PARSE_SECONDS.observe(parse_time)
+        if parse_errors:
+            PARSE_ERRORS.inc(parse_errors)
+
+    def close(self):
+        self.flush()
+        for input_queue in self.input_queues:
+            input_queue.put(None)
+        for process in self.processes:
+            process.join()
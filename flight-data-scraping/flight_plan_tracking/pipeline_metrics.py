@@ -0,0 +1,21 @@
+from common.metrics import REGISTRY
+
+# The metrics of the flight-plan-tracking service, served at GET /metrics by flight_plans_api
+
+MESSAGES = REGISTRY.counter('flight_messages_total', 'Messages from the message consumer, by msgType and whether they were accepted or dropped by the header filter', ('msg_type', 'result'))
+PARSE_ERRORS = REGISTRY.counter('flight_message_parse_errors_total', 'Messages that could not be parsed')
+STALE_MESSAGES = REGISTRY.counter('stale_flight_messages_total', 'Messages older than what was already published for their flight, by what was done with them', ('result',))
+TRACKED_FLIGHTS = REGISTRY.gauge('stale_message_filter_flights', 'Flights the stale message filter keeps the newest sourceTimeStamps of')
+
+PARSE_SECONDS = REGISTRY.histogram('flight_message_parse_seconds', 'Time to parse one message and turn it into a flight plan')
+NORMALIZER_SECONDS = REGISTRY.histogram('airport_code_normalizer_seconds', 'Time to convert the airport codes of one flight plan')
+MODEL_NORMALIZER_SECONDS = REGISTRY.histogram('aircraft_model_normalizer_seconds', 'Time to resolve the aircraft model of one flight plan to its designator')
+FBO_ASSIGNER_SECONDS = REGISTRY.histogram('fbo_assigner_seconds', 'Time to assign an FBO to one flight plan')
+
+STAGE_ERRORS = REGISTRY.counter('async_pipeline_stage_errors_total', 'Messages or flight plans an async pipeline stage failed on and skipped, by stage', ('stage',))
+
+PUBLISHED = REGISTRY.counter('flight_plans_published_total', 'Flight plans handed to the flight plans API')
+QUEUE_DEPTH = REGISTRY.gauge('flight_plan_queue_depth', 'Flight plans waiting in the in-memory queue for the database manager')
+LOG_LAG_BYTES = REGISTRY.gauge('flight_plan_log_lag_bytes', 'Bytes of the flight plan log the database manager has not committed yet')
+
+DATABASE_ERRORS = REGISTRY.counter('database_errors_total', 'Failed database connections and queries, by component', ('component',))
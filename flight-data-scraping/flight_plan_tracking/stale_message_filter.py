@@ -0,0 +1,313 @@
+from collections import OrderedDict
+import time
+
+from common.flight_plan import FlightPlan
+from pipeline_metrics import STALE_MESSAGES, TRACKED_FLIGHTS
+
+# The flight plan fields that come from the messages, each one tracked with the sourceTimeStamp it was last set by
+FIELDS = ('dep_arpt', 'arr_arpt', 'etd', 'eta', 'status', 'model')
+
+FLYING = "FLYING"
+ARRIVED = "ARRIVED"
+CANCELED = "CANCELED"
+
+
+class FlightState:
+    """
+    What has been published for one flight: the newest value of each field and the sourceTimeStamp it came from,
+    and when the flight's row was last deleted (cancelled, or replaced by the plane's next flight).
+    """
+    __slots__ = ('acid', 'values', 'times', 'newest', 'deleted_at')
+
+    def __init__(self, acid):
+        self.acid = acid
+        self.values = dict()
+        self.times = dict()
+        self.newest = None
+        self.deleted_at = None
+
+    def clear(self, deleted_at):
+        """
+        Forgets the fields set at or before deleted_at, the row they were in was deleted then. Returns the fields set after it.
+        """
+        kept = {field: value for field, value in self.values.items() if self.times[field] > deleted_at}
+        self.values = kept
+        self.times = {field: self.times[field] for field in kept}
+        self.deleted_at = deleted_at if self.deleted_at is None else max(self.deleted_at, deleted_at)
+        return kept
+
+    def has_row(self):
+        """
+        True if the flight has a row in flight_plans, i.e. a message was published for it since it was last deleted.
+        """
+        return bool(self.values) or (self.newest is not None and (self.deleted_at is None or self.newest > self.deleted_at))
+
+    def finished(self):
+        return self.values.get('status') == ARRIVED or (self.deleted_at is not None and not self.values)
+
+
+class StaleMessageFilter:
+    """
+    SWIM messages can arrive out of order. This keeps, for every flight, the sourceTimeStamp each field was last set by,
+    so a message that is older than what has already been published can't overwrite newer data:
+    its fields that a newer message already set are removed, and if none are left the message is dropped.
+    Fields no newer message has set are still filled in. Messages older than the flight's last cancellation are dropped.
+    A cancellation that arrives late deletes the flight and publishes again the fields that were set after it, and a late
+    FLYING message for a plane that has since started another flight is dropped, and the flight deleted as the newer flight replaced it.
+    The plane (netjets_fleet) is tracked apart from the flight's fields: a late FLYING message still points the plane at its flight,
+    and gives it its model, unless a newer message already did, even when the flight's row was deleted since,
+    so the database ends up the same as if the messages had arrived in order.
+
+    At most max_flights flights are tracked (the least recently updated are forgotten first), and flights that arrived
+    or were cancelled are forgotten finished_ttl seconds (of sourceTimeStamp time) after they finished.
+    Messages without a sourceTimeStamp are passed through as they are.
+    """
+    def __init__(self, max_flights=50000, finished_ttl=3600.0, stats_interval=60.0):
+        self.max_flights = max_flights
+        self.finished_ttl = finished_ttl
+        self.stats_interval = stats_interval
+
+        # flight ref -> FlightState, least recently updated first
+        self.flights = OrderedDict()
+        # flight ref -> sourceTimeStamp it finished at, oldest first
+        self.finished = OrderedDict()
+        # acid -> (sourceTimeStamp, flight ref) of the newest FLYING message published for the plane
+        self.flying = dict()
+        # acid -> sourceTimeStamp of the newest model published for the plane
+        self.models = dict()
+        # Newest sourceTimeStamp seen, the clock finished flights expire by
+        self.clock = None
+
+        self.counts = {
+            'passed': 0,
+            'trimmed': 0,
+            'dropped': 0,
+            'late_cancellations': 0,
+            'superseded': 0,
+        }
+        self.last_stats_print = time.monotonic()
+        TRACKED_FLIGHTS.set_function(lambda: len(self.flights))
+
+    def filter(self, flight_plan):
+        """
+        Returns the flight plans to publish for this message, in order: usually just the flight plan, a trimmed copy of it
+        or nothing, and for a late cancellation the cancellation followed by the fields that were set after it.
+        A late FLYING message is published as FLYING followed by the flight's newer status, to point the plane without changing the row.
+        """
+        source_time = flight_plan.source_time
+        flight_ref = flight_plan.flight_ref
+        if source_time is None or flight_ref is None:
+            self.counts['passed'] += 1
+            return [flight_plan]
+
+        if self.clock is None or source_time > self.clock:
+            self.clock = source_time
+            self.expire_finished()
+
+        state = self.flights.get(flight_ref)
+        if state is None:
+            state = FlightState(flight_plan.acid)
+            self.flights[flight_ref] = state
+            if len(self.flights) > self.max_flights:
+                self.forget(next(iter(self.flights)))
+        else:
+            self.flights.move_to_end(flight_ref)
+            if flight_plan.acid is not None:
+                state.acid = flight_plan.acid
+
+        if time.monotonic() - self.last_stats_print >= self.stats_interval:
+            self.print_stats()
+
+        acid = flight_plan.acid or state.acid
+        flying = self.flying.get(acid)
+        # The model goes to the plane, not the flight, so it is only sent if no newer message already gave the plane a model
+        model = flight_plan.model if flight_plan.status == FLYING and self.newer_model(acid, source_time) else None
+
+        # A plane that started a newer flight since this message was sent, would be pointed back to this flight.
+        # In order, the newer flight deleted this one's row, so it is deleted now
+        if flight_plan.status == FLYING and flying is not None and flying[1] != flight_ref and flying[0] > source_time:
+            self.counts['superseded'] += 1
+            STALE_MESSAGES.labels('superseded').inc()
+            published = self.delete(flight_ref, state, flying[0])
+            return published + self.give_model(acid, model, source_time) + self.drop()
+
+        # The flight's row was deleted after this message was sent, so whatever it says was deleted too.
+        # Only the plane pointing to the flight outlives a cancellation, so a FLYING message that is the plane's newest still points it there
+        if state.deleted_at is not None and source_time < state.deleted_at:
+            if flight_plan.status == FLYING and flight_plan.acid is not None and (flying is None or flying[0] < source_time):
+                self.counts['trimmed'] += 1
+                STALE_MESSAGES.labels('trimmed').inc()
+                return self.point_plane(flight_ref, state, acid, model, source_time)
+            return self.give_model(acid, model, source_time) + self.drop()
+
+        if flight_plan.status == CANCELED:
+            return self.cancel(flight_ref, state, flight_plan)
+
+        published = FlightPlan(flight_ref=flight_ref, acid=flight_plan.acid, fbo_id=flight_plan.fbo_id, source_time=source_time)
+        trimmed = False
+        for field in FIELDS:
+            value = getattr(flight_plan, field)
+            if value is None:
+                continue
+            written_time = state.times.get(field)
+            if written_time is not None and source_time < written_time:
+                trimmed = True
+                continue
+            setattr(published, field, value)
+            state.values[field] = value
+            state.times[field] = source_time
+        if published.model is not None and model is None:
+            trimmed = True
+            published.model = None
+
+        if state.newest is None or source_time > state.newest:
+            state.newest = source_time
+
+        # A newer status was published already, but in order this message would have pointed the plane at this flight (with its model),
+        # so that is sent after the fields that are still new
+        if (flight_plan.status == FLYING and published.status is None and flight_plan.acid is not None
+                and (flying is None or flying[1] != flight_ref or published.model is not None)):
+            fields = [published] if any(getattr(published, field) is not None for field in FIELDS if field != 'model') else []
+            self.counts['trimmed'] += 1
+            STALE_MESSAGES.labels('trimmed').inc()
+            return fields + self.point_plane(flight_ref, state, acid, published.model, source_time)
+
+        republished = []
+        if published.status == FLYING and acid is not None:
+            republished = self.plane_flying(acid, flight_ref, source_time, published.model)
+        self.update_finished(flight_ref, state)
+
+        if trimmed:
+            if all(getattr(published, field) is None for field in FIELDS):
+                return self.drop()
+            self.counts['trimmed'] += 1
+            STALE_MESSAGES.labels('trimmed').inc()
+            return [published] + republished
+
+        self.counts['passed'] += 1
+        return [flight_plan] + republished
+
+    def point_plane(self, flight_ref, state, acid, model, source_time):
+        """
+        Points the plane at the flight as of source_time, giving it the model unless it is None, without changing the flight's row.
+        The database manager only does that along with a FLYING status, so it is sent FLYING first,
+        then the row's status again, or a cancellation if the flight has no row.
+        """
+        flight_plans = [FlightPlan(flight_ref=flight_ref, acid=acid, status=FLYING, model=model, source_time=source_time)]
+        if not state.has_row():
+            flight_plans.append(FlightPlan(flight_ref=flight_ref, acid=state.acid or acid, status=CANCELED))
+        elif state.values.get('status') != FLYING:
+            flight_plans.append(FlightPlan(flight_ref=flight_ref, acid=state.acid or acid, status=state.values.get('status')))
+        self.update_finished(flight_ref, state)
+        return flight_plans + self.plane_flying(acid, flight_ref, source_time, model)
+
+    def give_model(self, acid, model, source_time):
+        """
+        For a FLYING message that no longer points the plane anywhere, but whose model is still the newest the plane was given:
+        Returns the flight plans that give the plane the model on the flight it points to now.
+        """
+        flying = self.flying.get(acid)
+        current = self.flights.get(flying[1]) if flying is not None else None
+        if model is None or current is None:
+            return []
+        return self.point_plane(flying[1], current, acid, model, source_time)
+
+    def cancel(self, flight_ref, state, flight_plan):
+        source_time = flight_plan.source_time
+        late = state.newest is not None and source_time < state.newest
+
+        state.clear(source_time)
+        if not late:
+            state.newest = source_time
+            self.update_finished(flight_ref, state)
+            self.counts['passed'] += 1
+            return [flight_plan]
+
+        self.counts['late_cancellations'] += 1
+        STALE_MESSAGES.labels('late_cancellation').inc()
+        # The row was deleted, then the fields set after the cancellation were written again
+        return [flight_plan] + self.republish(flight_ref, state)
+
+    def delete(self, flight_ref, state, deleted_at):
+        """
+        Deletes a flight as of deleted_at, after the fact. Returns the cancellation and the fields that were set after it, to publish.
+        """
+        had_row = state.has_row()
+        state.clear(deleted_at)
+        self.update_finished(flight_ref, state)
+        if not had_row:
+            return []
+        return [FlightPlan(flight_ref=flight_ref, acid=state.acid, status=CANCELED)] + self.republish(flight_ref, state)
+
+    def republish(self, flight_ref, state):
+        if not state.has_row():
+            return []
+        flight_plan = FlightPlan(flight_ref=flight_ref, acid=state.acid, **state.values)
+        # Only point the plane at this flight again if it still is the plane's newest flight, and only give it a model no newer message replaced
+        flying = self.flying.get(state.acid)
+        if flight_plan.status == FLYING and (flying is None or flying[1] != flight_ref):
+            flight_plan.status = None
+        if flight_plan.model is not None and (flight_plan.status != FLYING or not self.newer_model(state.acid, state.times['model'], True)):
+            flight_plan.model = None
+        return [flight_plan]
+
+    def newer_model(self, acid, source_time, inclusive=False):
+        model_time = self.models.get(acid)
+        return model_time is None or source_time > model_time or (inclusive and source_time == model_time)
+
+    def plane_flying(self, acid, flight_ref, source_time, model=None):
+        """
+        Records that the plane was pointed at this flight (and given the model, if it isn't None). Returns the fields of the flight
+        it pointed to before that were set after source_time, to publish again, since the database manager deletes that flight's whole row.
+        """
+        if model is not None and self.newer_model(acid, source_time):
+            self.models[acid] = source_time
+
+        flying = self.flying.get(acid)
+        if flying is not None and source_time < flying[0]:
+            return []
+        self.flying[acid] = (source_time, flight_ref)
+
+        if flying is None or flying[1] == flight_ref:
+            return []
+        previous = self.flights.get(flying[1])
+        if previous is None:
+            return []
+        previous.clear(source_time)
+        self.update_finished(flying[1], previous)
+        return self.republish(flying[1], previous)
+
+    def drop(self):
+        self.counts['dropped'] += 1
+        STALE_MESSAGES.labels('dropped').inc()
+        return []
+
+    # --- Expiry ---
+
+    def update_finished(self, flight_ref, state):
+        if state.finished():
+            self.finished[flight_ref] = state.newest if state.newest is not None else self.clock
+            self.finished.move_to_end(flight_ref)
+        else:
+            self.finished.pop(flight_ref, None)
+
+    def expire_finished(self):
+        while self.finished:
+            flight_ref, finished_at = next(iter(self.finished.items()))
+            if self.clock - finished_at < self.finished_ttl:
+                break
+            self.forget(flight_ref)
+
+    def forget(self, flight_ref):
+        self.flights.pop(flight_ref, None)
+        self.finished.pop(flight_ref, None)
+
+    def stats(self):
+        return dict(self.counts, tracked_flights=len(self.flights), finished_flights=len(self.finished))
+
+    def print_stats(self):
+        self.last_stats_print = time.monotonic()
+        print(
+            f"Stale message filter: {self.counts['passed']} passed, {self.counts['trimmed']} trimmed, {self.counts['dropped']} dropped, "
+            f"{self.counts['late_cancellations']} late cancellations, {self.counts['superseded']} superseded, {len(self.flights)} flights tracked"
+        )
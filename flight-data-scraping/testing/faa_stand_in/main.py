@@ -0,0 +1,183 @@
+"""
+Stand-in for the FAA aircraft characteristics database, to run the aircraft-metadata-scraper against.
+Serves fixtures/page.html with a "Last updated" date, and the workbook made from one of the fixtures/*.csv files
+as xlsx or as the older binary xls, at the same paths as the FAA website. Both answer conditional requests with 304 Not Modified like the FAA does.
+
+Usage: python main.py [--port 8090] [--date 2025-03-03] [--workbook aircraft_data_v1] [--format xlsx] [--no-validators]
+Point the scraper at it with AIRCRAFT_DATA_URL=http://localhost:<port>/airports/engineering/aircraft_char_database
+"""
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from flask import Flask, Response, jsonify, request
+from io import BytesIO
+from openpyxl import Workbook
+import argparse
+import csv
+import hashlib
+import logging
+import os
+import threading
+import xlwt
+
+app = Flask(__name__)
+
+# Suppress Flask request logs
+log = logging.getLogger('werkzeug')
+log.setLevel(logging.ERROR)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+PAGE_PATH = '/airports/engineering/aircraft_char_database'
+WORKBOOK_MIME_TYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'xls': 'application/vnd.ms-excel',
+}
+
+lock = threading.Lock()
+# What is being served: the page and workbook bytes, with the ETag and Last-Modified of each
+state = dict()
+# Responses sent, by path and status code
+counts = dict()
+# Workbook bytes by fixture name and format, made once so the same fixture is always the same bytes
+workbooks = dict()
+# Leave out the ETag and Last-Modified headers, so every request downloads everything
+no_validators = False
+
+
+def build_workbook(name, format='xlsx'):
+    """Turn fixtures/<name>.csv into the bytes of an xlsx or xls workbook."""
+    if (name, format) not in workbooks:
+        with open(os.path.join(FIXTURES, f'{name}.csv'), newline='') as f:
+            rows = [row if i == 0 else [number(value) for value in row] for i, row in enumerate(csv.reader(f))]
+        buffer = BytesIO()
+        if format == 'xls':
+            workbook = xlwt.Workbook()
+            sheet = workbook.add_sheet('Sheet1')
+            for i, row in enumerate(rows):
+                for j, value in enumerate(row):
+                    if value is not None:
+                        sheet.write(i, j, value)
+        else:
+            workbook = Workbook()
+            for row in rows:
+                workbook.active.append(row)
+        workbook.save(buffer)
+        workbooks[(name, format)] = buffer.getvalue()
+    return workbooks[(name, format)]
+
+
+def number(value):
+    if value == '':
+        return None
+    try:
+        return float(value) if '.' in value else int(value)
+    except ValueError:
+        return value
+
+
+def resource(content):
+    """The bytes served at a path and their validators. Last-Modified only moves when the bytes change."""
+    return {
+        'content': content,
+        'etag': '"' + hashlib.sha256(content).hexdigest()[:32] + '"',
+        'last_modified': datetime.now(timezone.utc).replace(microsecond=0),
+    }
+
+
+def set_fixture(date=None, workbook=None, format=None):
+    """Change the date on the page and/or the workbook that is served, or its format."""
+    with lock:
+        if date is not None:
+            page_date = datetime.strptime(date, '%Y-%m-%d').strftime('%A, %B %-d, %Y')
+            with open(os.path.join(FIXTURES, 'page.html')) as f:
+                page = f.read().replace('{date}', page_date).encode()
+            if 'page' not in state or state['page']['content'] != page:
+                state['page'] = resource(page)
+            state['date'] = date
+        if workbook is not None or format is not None:
+            workbook = workbook or state['workbook_name']
+            format = format or state.get('format', 'xlsx')
+            content = build_workbook(workbook, format)
+            if 'workbook' not in state or state['workbook']['content'] != content:
+                state['workbook'] = resource(content)
+            state['workbook_name'] = workbook
+            state['format'] = format
+
+
+def not_modified(served):
+    """True if the request's If-None-Match or If-Modified-Since header says the client already has these bytes."""
+    if no_validators:
+        return False
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return served['etag'] in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since is not None:
+        try:
+            return served['last_modified'] <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def serve(name, mimetype):
+    with lock:
+        served = state[name]
+    if not_modified(served):
+        response = Response(status=304)
+    else:
+        response = Response(served['content'], mimetype=mimetype)
+    if not no_validators:
+        response.headers['ETag'] = served['etag']
+        response.headers['Last-Modified'] = format_datetime(served['last_modified'], usegmt=True)
+
+    with lock:
+        key = f'{request.path} {response.status_code}'
+        counts[key] = counts.get(key, 0) + 1
+    return response
+
+
+@app.route(PAGE_PATH, methods=['GET'])
+def page():
+    return serve('page', 'text/html')
+
+
+@app.route(f'{PAGE_PATH}/aircraft_data', methods=['GET'])
+def workbook():
+    with lock:
+        format = state['format']
+    return serve('workbook', WORKBOOK_MIME_TYPES[format])
+
+
+@app.route('/fixture', methods=['POST'])
+def change_fixture():
+    """Change what is served with a JSON body like {"date": "2025-04-01", "workbook": "aircraft_data_v2", "format": "xls"}."""
+    body = request.get_json()
+    set_fixture(body.get('date'), body.get('workbook'), body.get('format'))
+    return status()
+
+
+@app.route('/stats', methods=['GET'])
+def status():
+    """What is being served, and how many 200 and 304 responses each path has sent."""
+    with lock:
+        return jsonify({'date': state['date'], 'workbook': state['workbook_name'], 'format': state['format'], 'responses': dict(counts)})
+
+
+def main():
+    global no_validators
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8090, help='port to serve on')
+    parser.add_argument('--date', default=datetime.now(timezone.utc).strftime('%Y-%m-%d'), help='"Last updated" date on the page, as YYYY-MM-DD')
+    parser.add_argument('--workbook', default='aircraft_data_v1', help='fixture the workbook is made from (fixtures/<name>.csv)')
+    parser.add_argument('--format', choices=sorted(WORKBOOK_MIME_TYPES), default='xlsx', help='serve the workbook as xlsx or as the older binary xls')
+    parser.add_argument('--no-validators', action='store_true', help="don't send ETag or Last-Modified, or answer 304")
+    args = parser.parse_args()
+
+    no_validators = args.no_validators
+    set_fixture(args.date, args.workbook, args.format)
+    print(f"Serving the aircraft data from {args.workbook} as {args.format}, last updated {args.date} at http://localhost:{args.port}{PAGE_PATH}")
+    app.run(host='0.0.0.0', port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
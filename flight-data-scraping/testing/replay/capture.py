@@ -0,0 +1,31 @@
+import gzip
+import orjson
+
+
+def write_capture(path):
+    """
+    Opens a capture file for writing. Each line is {"received": epoch seconds, "message": raw XML}, and the file is gzip compressed.
+    """
+    return gzip.open(path, 'wb')
+
+
+def write_message(file, received, message):
+    file.write(orjson.dumps({'received': received, 'message': message}) + b'\n')
+
+
+def read_capture(path):
+    """
+    Returns the (received, message) pairs of a capture file, in the order they were recorded.
+    A recording that was cut off mid-line still returns every complete message before it.
+    """
+    messages = []
+    with gzip.open(path, 'rb') as file:
+        try:
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break
+                record = orjson.loads(line)
+                messages.append((record['received'], record['message']))
+        except EOFError:
+            pass
+    return messages
@@ -0,0 +1,387 @@
+"""
+Generates synthetic fltdMessage XML for a fleet of NetJets (QS) tails flying between a set of airports, to test the
+pipeline at a scale and variety the hand-written test messages can't reach.
+Every tail flies one flight after another: the flight is created and filed, maybe delayed, re-filed after a cancellation
+or diverted, departs, sends track (or oceanic) reports while it flies, and arrives, then the tail turns around for its next flight.
+Together the flights send every message type FlightDataProcessor.process_message handles, through each of its branches,
+plus the boundaryCrossingUpdate and FlightSectors messages it ignores.
+
+Messages come out in sourceTimeStamp order and are streamed, so only the state of each tail is kept in memory.
+They are written to a capture file that replayer.py can serve (the recorded times are the sourceTimeStamps), or posted
+to the test message consumer.
+
+Usage: python generator.py --count 1000000 --output synthetic.ndjson.gz
+       python generator.py --count 10000 --url http://localhost:5000/messages --rate 200
+"""
+import argparse
+from datetime import datetime, timezone
+import heapq
+import itertools
+import random
+import time
+import requests
+
+from capture import write_capture, write_message
+
+DEFAULT_AIRPORTS = (
+    "KTEB", "KHPN", "KPBI", "KFLL", "KOPF", "KBED", "KMMU", "KMDW", "KDAL", "KAPA", "KASE", "KEGE",
+    "KSDL", "KLAS", "KVNY", "KSNA", "KJAC", "KBCT", "KCMH", "KTTN", "MYNN", "TXKF",
+)
+
+# Airports that are reached over the ocean, so flights to them send oceanicReport instead of only trackInformation
+DEFAULT_OCEANIC_AIRPORTS = ("MYNN", "TXKF")
+
+# (aircraftModel, aircraftSpecification) of the fleet
+MODELS = (("C68A", "C68A/L"), ("E55P", "E55P/L"), ("CL35", "CL35/L"), ("C700", "C700/L"), ("GLF6", "GLF6/L"), ("C56X", "C56X/L"))
+
+# Chances of the things that don't happen on every flight
+DELAY_CHANCE = 0.25
+CANCEL_CHANCE = 0.05
+DIVERSION_CHANCE = 0.03
+IATA_CHANCE = 0.2
+
+TRACK_INTERVAL = 300
+
+
+def zulu(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def iata(airport):
+    # US airports sometimes come through with their 3 letter (IATA) code
+    return airport[1:] if airport.startswith("K") else airport
+
+
+def root(msg_type, source_time, flight, body, arr_arpt=True):
+    # Some messages leave the arriving airport out of the root tag
+    arr_arpt_attribute = f'arrArpt="{flight["arr_arpt"]}" ' if arr_arpt else ''
+    return (
+        f'<fltdMessage acid="{flight["acid"]}" airline="EJA" {arr_arpt_attribute}cdmPart="false" depArpt="{flight["dep_arpt"]}" '
+        f'fdTrigger="FD_TRIGGER" flightRef="{flight["flight_ref"]}" major="EJA" msgType="{msg_type}" sensitivity="A" '
+        f'sourceFacility="KZNY" sourceTimeStamp="{zulu(source_time)}">{body}</fltdMessage>'
+    )
+
+
+def qualified_aircraft_id(flight):
+    return (
+        f'<qualifiedAircraftId aircraftCategory="JET" userCategory="GENERAL_AVIATION"><aircraftId>EJA{flight["acid"][1:-2]}</aircraftId>'
+        f'<gufi>KN0{flight["flight_ref"]}</gufi><departurePoint><airport>{flight["dep_arpt"]}</airport></departurePoint>'
+        f'<arrivalPoint><airport>{flight["arr_arpt"]}</airport></arrivalPoint></qualifiedAircraftId>'
+    )
+
+
+def route_data(flight, tag="ncsmRouteData"):
+    return (
+        f'<{tag}><eta etaType="ESTIMATED" timeValue="{zulu(flight["eta"])}"/><etd etdType="PROPOSED" timeValue="{zulu(flight["etd"])}"/>'
+        f'<rvsmData currentCompliance="true" equipped="true" futureCompliance="true"/></{tag}>'
+    )
+
+
+def airline_data(flight, rng):
+    model, specification = flight["model"]
+    # Some messages only give the aircraft specification
+    model_tag = f'<aircraftModel>{model}</aircraftModel>' if rng.random() < 0.8 else ''
+    return (
+        f'<airlineData><flightStatusAndSpec><flightStatus>SCHEDULED</flightStatus>{model_tag}'
+        f'<aircraftSpecification>{specification}</aircraftSpecification></flightStatusAndSpec>'
+        f'<etd etdType="SCHEDULED" timeValue="{zulu(flight["etd"])}"/><eta etaType="SCHEDULED" timeValue="{zulu(flight["eta"])}"/></airlineData>'
+    )
+
+
+def position():
+    return '<speed>447</speed><reportedAltitude><assignedAltitude><simpleAltitude>410C</simpleAltitude></assignedAltitude></reportedAltitude>'
+
+
+class MessageBuilder:
+    """
+    Builds the XML of each message type for a flight.
+    """
+    def __init__(self, rng):
+        self.rng = rng
+
+    def flight_create(self, t, flight):
+        return root("FlightCreate", t, flight, f'<ncsmFlightCreate>{qualified_aircraft_id(flight)}{airline_data(flight, self.rng)}</ncsmFlightCreate>')
+
+    def flight_modify(self, t, flight):
+        return root("FlightModify", t, flight, f'<ncsmFlightModify>{qualified_aircraft_id(flight)}{airline_data(flight, self.rng)}</ncsmFlightModify>')
+
+    def flight_plan_information(self, t, flight):
+        body = (f'<flightPlanInformation>{qualified_aircraft_id(flight)}<flightAircraftSpecs>{flight["model"][0]}</flightAircraftSpecs>'
+                f'{route_data(flight)}</flightPlanInformation>')
+        return root("flightPlanInformation", t, flight, body, arr_arpt=self.rng.random() < 0.7)
+
+    def flight_schedule_activate(self, t, flight):
+        return root("FlightScheduleActivate", t, flight, f'<ncsmFlightScheduleActivate>{qualified_aircraft_id(flight)}{route_data(flight)}</ncsmFlightScheduleActivate>')
+
+    def flight_route(self, t, flight):
+        return root("FlightRoute", t, flight, f'<ncsmFlightRoute>{qualified_aircraft_id(flight)}{route_data(flight)}</ncsmFlightRoute>')
+
+    def flight_times(self, t, flight):
+        body = (f'<ncsmFlightTimes>{qualified_aircraft_id(flight)}<etd etdType="ESTIMATED" timeValue="{zulu(flight["etd"])}"/>'
+                f'<eta etaType="ESTIMATED" timeValue="{zulu(flight["eta"])}"/></ncsmFlightTimes>')
+        return root("FlightTimes", t, flight, body)
+
+    def flight_sectors(self, t, flight):
+        return root("FlightSectors", t, flight, f'<ncsmFlightSectors>{qualified_aircraft_id(flight)}<sectorData sector="ZNY10"/></ncsmFlightSectors>')
+
+    def flight_plan_cancellation(self, t, flight):
+        return root("flightPlanCancellation", t, flight, f'<flightPlanCancellation>{qualified_aircraft_id(flight)}</flightPlanCancellation>')
+
+    def amendment(self, t, flight, canceled_flight_ref=None):
+        diversion = ''
+        if canceled_flight_ref is not None:
+            diversion = (f'<ncsmDiversionCancelData><canceledFlightReference flightRefType="CANCELED">{canceled_flight_ref}</canceledFlightReference>'
+                         f'<diversionIndicator>DIVERSION</diversionIndicator></ncsmDiversionCancelData>')
+        body = f'<flightPlanAmendmentInformation>{qualified_aircraft_id(flight)}<amendmentData><newSpeed>450</newSpeed></amendmentData>{route_data(flight)}{diversion}</flightPlanAmendmentInformation>'
+        # Amendments sometimes give the arriving airport as an IATA code
+        if self.rng.random() < IATA_CHANCE:
+            flight = dict(flight, arr_arpt=iata(flight["arr_arpt"]))
+        return root("flightPlanAmendmentInformation", t, flight, body)
+
+    def departure(self, t, flight):
+        body = (f'<departureInformation>{qualified_aircraft_id(flight)}<flightAircraftSpecs>{flight["model"][0]}</flightAircraftSpecs>'
+                f'<timeOfDeparture estimated="false">{zulu(flight["etd"])}</timeOfDeparture>'
+                f'<ncsmFlightTimeData><etd etdType="ACTUAL" timeValue="{zulu(flight["etd"])}"/><eta etaType="ESTIMATED" timeValue="{zulu(flight["eta"])}"/></ncsmFlightTimeData>'
+                f'</departureInformation>')
+        return root("departureInformation", t, flight, body)
+
+    def track(self, t, flight):
+        # Track data comes as ncsmTrackData or ncsmRouteData, and often without the arriving airport in the root tag
+        tag = "ncsmTrackData" if self.rng.random() < 0.7 else "ncsmRouteData"
+        return root("trackInformation", t, flight, f'<trackInformation>{qualified_aircraft_id(flight)}{position()}{route_data(flight, tag)}</trackInformation>',
+                    arr_arpt=self.rng.random() < 0.5)
+
+    def oceanic(self, t, flight):
+        return root("oceanicReport", t, flight, f'<oceanicReport>{qualified_aircraft_id(flight)}{position()}{route_data(flight, "ncsmTrackData")}</oceanicReport>')
+
+    def boundary_crossing(self, t, flight):
+        return root("boundaryCrossingUpdate", t, flight, f'<boundaryCrossingUpdate>{qualified_aircraft_id(flight)}{position()}</boundaryCrossingUpdate>')
+
+    def arrival(self, t, flight):
+        time_data = ''
+        # The arrival time is sometimes only in timeOfArrival
+        if self.rng.random() < 0.8:
+            time_data = f'<ncsmFlightTimeData><etd etdType="ACTUAL" timeValue="{zulu(flight["etd"])}"/><eta etaType="ACTUAL" timeValue="{zulu(flight["eta"])}"/></ncsmFlightTimeData>'
+        body = f'<arrivalInformation>{qualified_aircraft_id(flight)}<timeOfArrival estimated="false">{zulu(flight["eta"])}</timeOfArrival>{time_data}</arrivalInformation>'
+        return root("arrivalInformation", t, flight, body)
+
+
+class FleetGenerator:
+    """
+    Simulates the flights of every tail. Each tail is a generator of (sourceTimeStamp, message) in time order, and they are
+    merged into one stream, so memory only grows with the number of tails, not the number of messages.
+    """
+    def __init__(self, tails, airports, oceanic_airports, start_time, seed=None):
+        self.tails = tails
+        self.airports = list(airports)
+        self.oceanic_airports = frozenset(oceanic_airports)
+        self.start_time = start_time
+        self.rng = random.Random(seed)
+        self.builder = MessageBuilder(self.rng)
+        self.flight_refs = itertools.count(95000000 + self.rng.randrange(1000000))
+
+    def new_flight(self, acid, model, dep_arpt, etd):
+        arr_arpt = self.rng.choice([airport for airport in self.airports if airport != dep_arpt])
+        return {
+            "flight_ref": str(next(self.flight_refs)),
+            "acid": acid,
+            "model": model,
+            "dep_arpt": dep_arpt,
+            "arr_arpt": arr_arpt,
+            "etd": etd,
+            "eta": etd + self.rng.randrange(45 * 60, 5 * 3600, 60),
+        }
+
+    def flight_messages(self, flight, not_before):
+        """
+        Returns the (time, message) pairs of one flight in time order, from being created (no sooner than not_before) to arriving,
+        and the flight that arrived (a diversion or a re-filed flight plan has a different flightRef and airport).
+        """
+        rng = self.rng
+        build = self.builder
+        messages = []
+
+        def send(t, message):
+            messages.append((t, message))
+
+        t = max(flight["etd"] - rng.randrange(2 * 3600, 8 * 3600), not_before)
+        send(t, build.flight_create(t, flight))
+        t += rng.randrange(600, 3600)
+        send(t, build.flight_sectors(t, flight))
+        t = max(t, flight["etd"] - 2 * 3600) + rng.randrange(60, 1800)
+        send(t, build.flight_plan_information(t, flight))
+        t += rng.randrange(60, 600)
+        send(t, build.flight_schedule_activate(t, flight))
+        t += rng.randrange(60, 600)
+        send(t, build.flight_route(t, flight))
+
+        if rng.random() < CANCEL_CHANCE:
+            # The flight plan is cancelled and filed again under a new flightRef
+            t += rng.randrange(60, 600)
+            send(t, build.flight_plan_cancellation(t, flight))
+            flight = dict(flight, flight_ref=str(next(self.flight_refs)))
+            t += rng.randrange(60, 600)
+            send(t, build.flight_plan_information(t, flight))
+
+        if rng.random() < DELAY_CHANCE:
+            delay = rng.randrange(10 * 60, 90 * 60, 60)
+            flight = dict(flight, etd=flight["etd"] + delay, eta=flight["eta"] + delay)
+            t += rng.randrange(60, 600)
+            send(t, build.flight_times(t, flight))
+
+        # Before departure, FlightModify comes out as SCHEDULED
+        t = max(t + 60, flight["etd"] - rng.randrange(300, 1800))
+        send(t, build.flight_modify(t, flight))
+
+        t = max(t + 60, flight["etd"])
+        flight = dict(flight, etd=t, eta=max(flight["eta"], t + 45 * 60))
+        send(t, build.departure(t, flight))
+
+        # After departure, FlightModify comes out as FLYING
+        send(t + 60, build.flight_modify(t + 60, flight))
+
+        # Flights coming in from outside the US are sometimes only created once they are in the air
+        if rng.random() < 0.05:
+            send(t + 120, build.flight_create(t + 120, flight))
+
+        oceanic = flight["arr_arpt"] in self.oceanic_airports
+        diverted = False
+        t += TRACK_INTERVAL
+        while t < flight["eta"]:
+            if oceanic and t > (flight["etd"] + flight["eta"]) / 2:
+                send(t, build.oceanic(t, flight))
+            else:
+                send(t, build.track(t, flight))
+            if rng.random() < 0.1:
+                send(t + 1, build.boundary_crossing(t + 1, flight))
+
+            if not diverted and rng.random() < DIVERSION_CHANCE * TRACK_INTERVAL / 3600:
+                # The flight diverts to another airport, under a new flightRef that cancels the old one
+                diverted = True
+                canceled_flight_ref = flight["flight_ref"]
+                arr_arpt = rng.choice([airport for airport in self.airports if airport not in (flight["dep_arpt"], flight["arr_arpt"])])
+                flight = dict(flight, flight_ref=str(next(self.flight_refs)), arr_arpt=arr_arpt, eta=t + rng.randrange(20 * 60, 90 * 60, 60))
+                oceanic = arr_arpt in self.oceanic_airports
+                send(t + 2, build.amendment(t + 2, flight, canceled_flight_ref))
+            elif rng.random() < 0.02:
+                send(t + 2, build.amendment(t + 2, flight))
+
+            t += TRACK_INTERVAL
+
+        t = flight["eta"]
+        send(t, build.arrival(t, flight))
+
+        # After landing, FlightModify leaves the status alone
+        if rng.random() < 0.3:
+            send(t + 600, build.flight_modify(t + 600, flight))
+
+        # A message sent just after a track report can land after the arrival
+        messages.sort(key=lambda item: item[0])
+        return messages, flight
+
+    def tail_messages(self, acid, until):
+        """
+        Yields (time, message) for every flight of one tail, one after the other, until the simulated time passes until.
+        """
+        model = self.rng.choice(MODELS)
+        airport = self.rng.choice(self.airports)
+        # Spread the first departures out, so the tails don't all start together
+        etd = self.start_time + self.rng.randrange(2 * 3600, 26 * 3600, 60)
+        not_before = 0
+
+        while etd < until:
+            flight = self.new_flight(acid, model, airport, etd)
+            messages, flight = self.flight_messages(flight, not_before)
+            yield from messages
+            not_before = messages[-1][0]
+
+            airport = flight["arr_arpt"]
+            # Turn around on the ground before the next flight
+            etd = flight["eta"] + self.rng.randrange(3600, 24 * 3600, 60)
+
+    def messages(self, hours):
+        """
+        Yields (time, message) for the whole fleet in time order, for the given number of simulated hours.
+        Messages from before start_time (the lead up to the first flights) are left out.
+        """
+        until = self.start_time + hours * 3600
+        tails = [self.tail_messages(f"N{number}QS", until) for number in self.rng.sample(range(100, 1000), self.tails)]
+        for t, message in heapq.merge(*tails, key=lambda item: item[0]):
+            if t >= until:
+                break
+            if t >= self.start_time:
+                yield t, message
+
+
+def post_messages(url, messages, rate=None, batch_size=100, max_backlog=10000):
+    """
+    Posts the messages to the test message consumer in batches, at up to rate messages per second.
+    Waits while more than max_backlog messages are queued there, so the consumer doesn't hold the whole run in memory.
+    """
+    session = requests.Session()
+    start = time.monotonic()
+    sent = 0
+    batch = []
+    for _, message in messages:
+        batch.append(message)
+        if len(batch) < batch_size:
+            continue
+
+        queued = session.post(url, json=batch, timeout=30).json()["queued"]
+        sent += len(batch)
+        batch = []
+
+        if rate:
+            ahead = sent / rate - (time.monotonic() - start)
+            if ahead > 0:
+                time.sleep(ahead)
+        while queued > max_backlog:
+            time.sleep(0.5)
+            queued = session.post(url, json=[], timeout=30).json()["queued"]
+
+    if batch:
+        session.post(url, json=batch, timeout=30)
+        sent += len(batch)
+    return sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tails', type=int, default=200, help='number of QS tails in the fleet (up to 900)')
+    parser.add_argument('--airports', default=",".join(DEFAULT_AIRPORTS), help='comma separated ICAO codes the fleet flies between')
+    parser.add_argument('--oceanic-airports', default=",".join(DEFAULT_OCEANIC_AIRPORTS), help='comma separated airports reached over the ocean')
+    parser.add_argument('--hours', type=float, default=24 * 365, help='simulated hours to generate')
+    parser.add_argument('--count', type=int, default=None, help='stop after this many messages')
+    parser.add_argument('--start', default=None, help='simulated start time as YYYY-MM-DDTHH:MM:SSZ (defaults to now)')
+    parser.add_argument('--seed', type=int, default=None, help='random seed, to generate the same messages again')
+    parser.add_argument('--output', default=None, help='capture file to write (gzip NDJSON, readable by replayer.py)')
+    parser.add_argument('--url', default=None, help="post the messages to the test message consumer's POST /messages instead")
+    parser.add_argument('--rate', type=float, default=None, help='messages per second to post (defaults to as fast as possible)')
+    args = parser.parse_args()
+
+    if bool(args.output) == bool(args.url):
+        parser.error("give one of --output or --url")
+
+    start_time = int(time.time())
+    if args.start:
+        start_time = int(datetime.strptime(args.start, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp())
+
+    airports = [airport.strip() for airport in args.airports.split(",") if airport.strip()]
+    oceanic_airports = [airport.strip() for airport in args.oceanic_airports.split(",") if airport.strip()]
+    generator = FleetGenerator(min(args.tails, 900), airports, oceanic_airports, start_time, args.seed)
+    messages = itertools.islice(generator.messages(args.hours), args.count)
+
+    began = time.monotonic()
+    if args.output:
+        count = 0
+        with write_capture(args.output) as file:
+            for t, message in messages:
+                write_message(file, t, message)
+                count += 1
+    else:
+        count = post_messages(args.url, messages, args.rate)
+    print(f"Generated {count} messages in {time.monotonic() - began:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Checks that the database ends up the same whatever order the messages arrive in.
+The messages (a capture file, or a synthetic fleet from generator.py) are run through flight-plan-tracking's parsing and
+stale message filter twice: once in sourceTimeStamp order, and once with every message held back by a random delay of up
+to --max-delay seconds, as they can arrive from SWIM. The flight plans of each run are applied to an in-memory copy of the
+flight_plans and netjets_fleet tables, the way the database-manager writes them, and the two copies are compared.
+The same is done without the filter, to show what it prevents.
+
+Each message is parsed with its own sourceTimeStamp as the current time, so both runs see the same flight plans.
+
+Usage: python order_check.py [--capture capture.ndjson.gz] [--tails 50] [--hours 72] [--max-delay 600] [--seed 1]
+Exits with 1 if the filtered runs end up different.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'flight_plan_tracking'))
+
+from capture import read_capture
+from generator import FleetGenerator, DEFAULT_AIRPORTS, DEFAULT_OCEANIC_AIRPORTS
+from flightDataProcessor import FlightDataProcessor
+from flight_message_extractor import FlightMessageExtractor
+from message_header_filter import MessageHeaderFilter
+from stale_message_filter import StaleMessageFilter
+
+# The flight_plans columns, by flight plan field
+COLUMNS = ('acid', 'dep_arpt', 'arr_arpt', 'etd', 'eta', 'status')
+
+
+def parse_messages(messages):
+    """
+    Returns (sourceTimeStamp, FlightPlan) for every message that has a flight plan, in the order given.
+    """
+    header_filter = MessageHeaderFilter(stats_interval=float('inf'))
+    extractor = FlightMessageExtractor()
+    processor = FlightDataProcessor()
+
+    flight_plans = []
+    for t, message in messages:
+        if not header_filter.accept(message):
+            continue
+        processor.set_current_time(int(t))
+        flight_plan = processor.process_message(extractor.parse(message).get('fltdMessage'))
+        if flight_plan is not None:
+            flight_plans.append((t, flight_plan))
+    return flight_plans
+
+
+def delayed(flight_plans, max_delay, seed):
+    """
+    Returns the flight plans in the order they arrive when each message is held back by up to max_delay seconds.
+    """
+    rng = random.Random(seed)
+    arrivals = [(t + rng.uniform(0, max_delay), i) for i, (t, _) in enumerate(flight_plans)]
+    arrivals.sort()
+    return [flight_plans[i] for _, i in arrivals]
+
+
+class Tables:
+    """
+    The flight_plans and netjets_fleet rows, changed the way the database manager changes them for each flight plan.
+    """
+    def __init__(self):
+        self.flight_plans = dict()
+        self.fleet = dict()
+
+    def apply(self, flight_plan):
+        flight_ref = flight_plan.flight_ref
+        if flight_plan.status == "CANCELED":
+            self.flight_plans.pop(flight_ref, None)
+            return
+        if flight_ref is None or flight_plan.acid is None:
+            return
+
+        row = self.flight_plans.setdefault(flight_ref, dict())
+        for column in COLUMNS:
+            value = getattr(flight_plan, column)
+            if value is not None:
+                row[column] = value
+
+        if flight_plan.status == "FLYING":
+            current = self.fleet.get(flight_plan.acid)
+            if current is not None and current[0] != flight_ref:
+                self.flight_plans.pop(current[0], None)
+            model = flight_plan.model if flight_plan.model is not None else (current[1] if current else None)
+            self.fleet[flight_plan.acid] = (flight_ref, model)
+
+
+def run(flight_plans, use_filter):
+    tables = Tables()
+    stale_message_filter = StaleMessageFilter(stats_interval=float('inf')) if use_filter else None
+    for _, flight_plan in flight_plans:
+        # Each run gets its own copy, the filter and the tables keep references to what they are given
+        flight_plan = flight_plan.copy()
+        published = stale_message_filter.filter(flight_plan) if use_filter else [flight_plan]
+        for flight_plan in published:
+            tables.apply(flight_plan)
+    return tables, stale_message_filter
+
+
+def differences(expected, actual):
+    """
+    Returns the flight refs and acids whose rows differ between two runs.
+    """
+    flight_refs = [flight_ref for flight_ref in expected.flight_plans.keys() | actual.flight_plans.keys()
+                   if expected.flight_plans.get(flight_ref) != actual.flight_plans.get(flight_ref)]
+    acids = [acid for acid in expected.fleet.keys() | actual.fleet.keys() if expected.fleet.get(acid) != actual.fleet.get(acid)]
+    return sorted(flight_refs), sorted(acids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--capture', default=None, help='capture file to check (defaults to a synthetic fleet)')
+    parser.add_argument('--tails', type=int, default=50, help='tails in the synthetic fleet')
+    parser.add_argument('--hours', type=float, default=72, help='simulated hours of the synthetic fleet')
+    parser.add_argument('--max-delay', type=float, default=600, help='longest a message is held back, in seconds')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the fleet and the delays')
+    args = parser.parse_args()
+
+    if args.capture:
+        messages = list(read_capture(args.capture))
+    else:
+        start_time = int(time.time()) // 3600 * 3600
+        generator = FleetGenerator(args.tails, DEFAULT_AIRPORTS, DEFAULT_OCEANIC_AIRPORTS, start_time, args.seed)
+        messages = list(generator.messages(args.hours))
+
+    # Sorted by sourceTimeStamp, keeping the recorded order of messages sent in the same second
+    flight_plans = parse_messages(messages)
+    flight_plans.sort(key=lambda item: item[0])
+    shuffled = delayed(flight_plans, args.max_delay, args.seed)
+    moved = sum(1 for a, b in zip(flight_plans, shuffled) if a is not b)
+    print(f"{len(flight_plans)} flight plans from {len(messages)} messages, {moved} arrive out of place with delays of up to {args.max_delay:g} s")
+
+    expected, _ = run(flight_plans, use_filter=True)
+    actual, stale_message_filter = run(shuffled, use_filter=True)
+    flight_refs, acids = differences(expected, actual)
+
+    unfiltered_expected, _ = run(flight_plans, use_filter=False)
+    unfiltered_actual, _ = run(shuffled, use_filter=False)
+    unfiltered_flight_refs, unfiltered_acids = differences(unfiltered_expected, unfiltered_actual)
+
+    print(f"Without the filter: {len(unfiltered_flight_refs)} flight plans and {len(unfiltered_acids)} fleet rows end up different")
+    print(f"With the filter: {len(flight_refs)} flight plans and {len(acids)} fleet rows end up different")
+    print("Filter:", stale_message_filter.stats())
+
+    # The filter must not change anything when the messages do arrive in order
+    in_order_flight_refs, in_order_acids = differences(unfiltered_expected, expected)
+    if in_order_flight_refs or in_order_acids:
+        print(f"The filter changed {len(in_order_flight_refs)} flight plans and {len(in_order_acids)} fleet rows of the in order run")
+
+    for flight_ref in flight_refs[:10]:
+        print(f"  {flight_ref}: in order {expected.flight_plans.get(flight_ref)}, delayed {actual.flight_plans.get(flight_ref)}")
+    for acid in acids[:10]:
+        print(f"  {acid}: in order {expected.fleet.get(acid)}, delayed {actual.fleet.get(acid)}")
+
+    if flight_refs or acids or in_order_flight_refs or in_order_acids:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Records the raw fltdMessage XML served by the message consumer API into a gzip compressed NDJSON capture file,
+with the time each message was received, so it can be served again by replayer.py.
+The message consumer hands each message out once, so run this instead of flight-plan-tracking, not next to it.
+
+Usage: python recorder.py capture.ndjson.gz [--url URL] [--duration SECONDS] [--count N]
+"""
+import argparse
+import os
+import time
+import requests
+from dotenv import load_dotenv
+
+from capture import write_capture, write_message
+
+
+def record(url, path, duration=None, count=None, poll_interval=0.2):
+    session = requests.Session()
+    recorded = 0
+    start = time.monotonic()
+
+    with write_capture(path) as file:
+        try:
+            while (duration is None or time.monotonic() - start < duration) and (count is None or recorded < count):
+                try:
+                    message = session.get(url, timeout=5).json()['message']
+                except requests.exceptions.RequestException as e:
+                    print("Error requesting from JMS API:", e)
+                    time.sleep(1)
+                    continue
+
+                if not message:
+                    # Nothing waiting, don't ask again right away
+                    time.sleep(poll_interval)
+                    continue
+
+                write_message(file, time.time(), message)
+                recorded += 1
+                if recorded % 1000 == 0:
+                    print(f"Recorded {recorded} messages")
+        except KeyboardInterrupt:
+            pass
+
+    elapsed = time.monotonic() - start
+    print(f"Recorded {recorded} messages in {elapsed:.0f} s to {path}")
+    return recorded
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('capture', help='capture file to write')
+    parser.add_argument('--url', default=os.getenv('JMS_API', 'http://localhost:8080/messages/consume'), help='message consumer API (defaults to JMS_API)')
+    parser.add_argument('--duration', type=float, default=None, help='seconds to record for (defaults to until Ctrl-C)')
+    parser.add_argument('--count', type=int, default=None, help='stop after this many messages')
+    args = parser.parse_args()
+
+    record(args.url, args.capture, args.duration, args.count)
+
+
+if __name__ == "__main__":
+    main()
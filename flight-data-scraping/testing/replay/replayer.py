@@ -0,0 +1,252 @@
+"""
+Serves a capture file recorded by recorder.py through the same GET /messages/consume contract as the message consumer,
+so flight-plan-tracking can be pointed at it (JMS_API) to replay a busy period offline.
+--speed 1 keeps the gaps between messages as they were recorded, --speed 10 replays ten times faster and --speed 0 serves
+every message as soon as it is asked for.
+
+Once every message has been served and the database has stopped changing, a report is printed (and written to --report):
+the sustained messages/sec, the p50/p99 pipeline latency and the row counts of the database.
+The latency comes from the database-manager's flight_plan_freshness_lag_seconds histogram. Since that measures from each
+message's sourceTimeStamp, the sourceTimeStamps are rewritten to the time each message is served (which keeps their order),
+unless --keep-timestamps is given. sourceTimeStamps only have whole seconds, so the latency is only good to about a second.
+
+Usage: python replayer.py capture.ndjson.gz [--speed 1] [--port 8080] [--metrics-url URL] [--report report.json]
+"""
+import argparse
+from datetime import datetime, timezone
+import logging
+import os
+import re
+import threading
+import time
+import mysql.connector
+import orjson
+import requests
+from dotenv import load_dotenv
+from flask import Flask, jsonify
+
+from capture import read_capture
+
+FRESHNESS_METRIC = 'flight_plan_freshness_lag_seconds'
+
+SOURCE_TIME_STAMP = re.compile(r'(sourceTimeStamp\s*=\s*")[^"]*(")')
+
+# Tables whose row counts are reported after a replay
+REPORT_TABLES = ('flight_plans', 'netjets_fleet')
+
+
+class Replay:
+    """
+    Hands out the messages of a capture in order, each one no sooner than its recorded gap after the first one (divided by speed).
+    The clock starts with the first request, so the pipeline can start up first.
+    """
+    def __init__(self, messages, speed=1.0, restamp=True):
+        self.messages = messages
+        self.speed = speed
+        self.restamp = restamp
+
+        self.lock = threading.Lock()
+        self.position = 0
+        self.start = None
+        self.first_served = None
+        self.last_served = None
+
+    def due(self, now):
+        if self.speed <= 0:
+            return True
+        recorded_gap = self.messages[self.position][0] - self.messages[0][0]
+        return now - self.start >= recorded_gap / self.speed
+
+    def next_message(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.start is None:
+                self.start = now
+            if self.position >= len(self.messages) or not self.due(now):
+                return None
+
+            message = self.messages[self.position][1]
+            self.position += 1
+            if self.first_served is None:
+                self.first_served = now
+            self.last_served = now
+
+        if self.restamp:
+            served_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+            message = SOURCE_TIME_STAMP.sub(r'\g<1>' + served_at + r'\g<2>', message, count=1)
+        return message
+
+    def done(self):
+        with self.lock:
+            return self.position >= len(self.messages)
+
+    def messages_per_second(self):
+        with self.lock:
+            if self.first_served is None or self.last_served == self.first_served:
+                return None
+            return (self.position - 1) / (self.last_served - self.first_served)
+
+
+def create_app(replay):
+    app = Flask(__name__)
+
+    # Suppress Flask request logs
+    log = logging.getLogger('werkzeug')
+    log.setLevel(logging.ERROR)
+
+    @app.route('/messages/consume', methods=['GET'])
+    def get_message():
+        return jsonify({"message": replay.next_message()})
+
+    @app.route('/replay/stats', methods=['GET'])
+    def get_stats():
+        return jsonify({"served": replay.position, "total": len(replay.messages), "messages_per_second": replay.messages_per_second()})
+
+    return app
+
+
+def read_histogram(metrics_url, name):
+    """
+    Returns the cumulative (upper bound, count) buckets of a histogram scraped from a Prometheus /metrics endpoint, or None if it can't be read.
+    Buckets with labels other than le are added together.
+    """
+    try:
+        text = requests.get(metrics_url, timeout=5).text
+    except requests.exceptions.RequestException as e:
+        print("Error requesting metrics:", e)
+        return None
+
+    buckets = dict()
+    pattern = re.compile(r'^' + re.escape(name) + r'_bucket\{(.*)\} (\S+)$')
+    for line in text.splitlines():
+        match = pattern.match(line)
+        if match:
+            bound = re.search(r'le="([^"]+)"', match.group(1)).group(1)
+            bound = float('inf') if bound == '+Inf' else float(bound)
+            buckets[bound] = buckets.get(bound, 0) + float(match.group(2))
+    return sorted(buckets.items()) or None
+
+
+def histogram_difference(after, before):
+    if before is None:
+        return after
+    counts = dict(before)
+    return [(bound, count - counts.get(bound, 0)) for bound, count in after]
+
+
+def histogram_quantile(buckets, quantile):
+    """
+    Estimates a quantile from cumulative buckets, interpolating within the bucket it falls in (like Prometheus' histogram_quantile).
+    """
+    if not buckets or buckets[-1][1] <= 0:
+        return None
+    rank = quantile * buckets[-1][1]
+    lower_bound, lower_count = 0.0, 0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float('inf'):
+                return lower_bound
+            if count == lower_count:
+                return bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+        lower_bound, lower_count = bound, count
+    return lower_bound
+
+
+def table_row_counts():
+    """
+    Returns the number of rows in each of the REPORT_TABLES, or None if the database can't be reached.
+    """
+    try:
+        connection = mysql.connector.connect(
+            host=os.getenv('DB_HOST'),
+            user=os.getenv('DB_USER'),
+            password=os.getenv('DB_PASSWORD'),
+            database=os.getenv('DB_NAME')
+        )
+        cursor = connection.cursor()
+        counts = dict()
+        for table in REPORT_TABLES:
+            cursor.execute(f"SELECT COUNT(*) FROM {table};")
+            counts[table] = cursor.fetchone()[0]
+        cursor.close()
+        connection.close()
+        return counts
+    except mysql.connector.Error as e:
+        print("Error counting database rows:", e)
+        return None
+
+
+def wait_until_settled(metrics_url, settle_seconds, max_wait):
+    """
+    Waits until the database row counts and the number of committed flight plans have stayed the same for settle_seconds.
+    """
+    deadline = time.monotonic() + max_wait
+    last_state = None
+    last_change = time.monotonic()
+    while time.monotonic() < deadline:
+        freshness = read_histogram(metrics_url, FRESHNESS_METRIC)
+        state = (table_row_counts(), freshness[-1][1] if freshness else None)
+        if state != last_state:
+            last_state = state
+            last_change = time.monotonic()
+        elif time.monotonic() - last_change >= settle_seconds:
+            return
+        time.sleep(1)
+    print(f"Database was still changing after {max_wait:.0f} s, reporting anyway")
+
+
+def run_report(replay, metrics_url, settle_seconds, max_wait, report_path=None):
+    freshness_before = read_histogram(metrics_url, FRESHNESS_METRIC)
+
+    while not replay.done():
+        time.sleep(1)
+    wait_until_settled(metrics_url, settle_seconds, max_wait)
+
+    freshness = histogram_difference(read_histogram(metrics_url, FRESHNESS_METRIC), freshness_before)
+    report = {
+        'messages': len(replay.messages),
+        'speed': replay.speed,
+        'messages_per_second': replay.messages_per_second(),
+        'latency_p50_seconds': histogram_quantile(freshness, 0.5),
+        'latency_p99_seconds': histogram_quantile(freshness, 0.99),
+        'flight_plans_committed': freshness[-1][1] if freshness else None,
+        'row_counts': table_row_counts(),
+    }
+
+    print("Replay report: " + ", ".join(f"{name} {value}" for name, value in report.items()))
+    if report_path:
+        with open(report_path, 'wb') as file:
+            file.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+    return report
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('capture', help='capture file written by recorder.py')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed, 0 serves every message as fast as it is asked for')
+    parser.add_argument('--port', type=int, default=8080, help='port to serve /messages/consume on')
+    parser.add_argument('--keep-timestamps', action='store_true', help="serve the messages exactly as recorded (the latency can't be measured)")
+    parser.add_argument('--metrics-url', default=os.getenv('DATABASE_MANAGER_METRICS_URL', 'http://localhost:9100/metrics'), help="the database-manager's /metrics endpoint")
+    parser.add_argument('--settle-seconds', type=float, default=10.0, help='how long the database must stay the same after the last message before reporting')
+    parser.add_argument('--max-wait', type=float, default=300.0, help='longest wait for the database to settle after the last message')
+    parser.add_argument('--report', default=None, help='also write the report to this JSON file')
+    args = parser.parse_args()
+
+    messages = read_capture(args.capture)
+    if not messages:
+        print(f"No messages in {args.capture}")
+        return
+    print(f"Replaying {len(messages)} messages from {args.capture} at {'max' if args.speed <= 0 else str(args.speed) + 'x'} speed")
+
+    replay = Replay(messages, args.speed, restamp=not args.keep_timestamps)
+    app = create_app(replay)
+    threading.Thread(target=lambda: app.run(host='0.0.0.0', port=args.port, threaded=True), daemon=True).start()
+
+    run_report(replay, args.metrics_url, args.settle_seconds, args.max_wait, args.report)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,9 +16,39 @@ CREATE TABLE netjets_fleet (
   plane_type varchar(6) DEFAULT NULL,
   flightRef varchar(10) NOT NULL,
   PRIMARY KEY (acid),
-  UNIQUE KEY flightRef (flightRef)
+  UNIQUE KEY flightRef (flightRef),
+  KEY plane_type_idx (plane_type)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
+CREATE TABLE aircraft_types (
+  type varchar(10) DEFAULT NULL,
+  parkingArea double DEFAULT NULL,
+  size varchar(10) DEFAULT NULL,
+  KEY type_idx (type)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+CREATE TABLE last_updated (
+  type varchar(20) NOT NULL,
+  date varchar(10) DEFAULT NULL,
+  PRIMARY KEY (type)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- A few of the FAA designators in the NetJets fleet, so aircraft types can be looked up against the test database
+INSERT INTO aircraft_types (type, parkingArea) VALUES
+('E55P',2678),
+('C56X',2956),
+('C68A',4507),
+('C700',5421),
+('CL35',4740),
+('CL60',4398),
+('GLEX',9344),
+('GLF4',6948),
+('GLF6',9940);
+
+INSERT INTO last_updated VALUES ('AircraftData','2000-01-01');
+-- Epoch seconds of the last change to airport_data, set by the web app's airport import
+INSERT INTO last_updated VALUES ('AirportData','0');
+
 CREATE TABLE airport_parking (
   Airport_Code varchar(10) DEFAULT NULL,
   FBO_Name varchar(255) DEFAULT NULL,
@@ -31,6 +61,16 @@ CREATE TABLE airport_parking (
   KEY idx_airport_fbo (Airport_Code,FBO_Name)
 ) ENGINE=InnoDB AUTO_INCREMENT=51 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
+-- Planes, parked planes and parking area at each FBO (fbo_id 0 is the whole airport), kept by the database-manager
+CREATE TABLE fbo_occupancy (
+  airport varchar(10) NOT NULL,
+  fbo_id int NOT NULL,
+  planes int NOT NULL DEFAULT 0,
+  parked_planes int NOT NULL DEFAULT 0,
+  parking_area decimal(15,2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (airport,fbo_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
 CREATE TABLE `airport_data` (
   `id` int DEFAULT NULL,
   `ident` varchar(10) NOT NULL,
@@ -1,7 +1,9 @@
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request
 from collections import deque
 from datetime import datetime, timezone
 import logging
+import os
+import re
 
 app = Flask(__name__)
 
@@ -11,6 +13,9 @@ log.setLevel(logging.ERROR)
 
 message_queue = deque()
 
+# Matches the namespace prefix of a start or end tag (i.e. '<fdm:' or '</fdm:')
+TAG_PREFIX = re.compile(r'<(/?)[\w.-]+:')
+
 @app.route('/messages/consume', methods=['GET'])
 def get_message():
     """Retrieve and remove the first message from the queue."""
@@ -18,9 +23,20 @@ def get_message():
         return jsonify({"message": message_queue.popleft()})
     return jsonify({"message": None})
 
+@app.route('/messages', methods=['POST'])
+def add_messages():
+    """Queue up a JSON list of messages (used by the load generator), and return how many are waiting."""
+    for message in request.get_json():
+        store_message(message)
+    return jsonify({"queued": len(message_queue)})
+
+def strip_namespaces(message):
+    """Drop the namespace prefixes from the tags (i.e. <fdm:fltdMessage> --> <fltdMessage>), like the message consumer's DatabaseOutput does."""
+    return TAG_PREFIX.sub(r'<\1', message)
+
 def store_message(message):
     """Store a message in the queue."""
-    message_queue.append(message)
+    message_queue.append(strip_namespaces(message))
 
 if __name__ == '__main__':
     current_time = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
@@ -90,4 +106,5 @@ if __name__ == '__main__':
     for message in messages:
         store_message(message)
 
-    app.run(debug=True, host='0.0.0.0')
+    # The port can be changed, so this can stand in for the message consumer next to other services running locally
+    app.run(debug=True, host='0.0.0.0', port=int(os.getenv('TEST_MESSAGE_CONSUMER_PORT', 5000)))
@@ -0,0 +1,99 @@
+from contextlib import contextmanager
+import os
+import sys
+
+import pytest
+
+# The services import their own modules by name, and the shared ones from common. The benchmarks' sample messages are used too.
+# Later paths come first, so flight_plan_tracking's main is the one found by that name
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'aircraft_metadata_scraper'), os.path.join(ROOT, 'flight_plan_tracking'), os.path.join(ROOT, 'database_manager'), os.path.join(ROOT, 'benchmarks')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+class FakeCursor:
+    def __init__(self, database, rows=()):
+        self.database = database
+        self.rows = list(rows)
+
+    def execute(self, sql, params=()):
+        self.rows = self.database.rows(sql, params)
+
+    def executemany(self, sql, seq_params):
+        for params in seq_params:
+            self.execute(sql, params)
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, database):
+        self.database = database
+
+    def cursor(self):
+        return FakeCursor(self.database)
+
+    def prepared(self, sql, params=()):
+        cursor = FakeCursor(self.database)
+        cursor.execute(sql, params)
+        return cursor
+
+    def commit(self):
+        self.database.commits += 1
+
+    def rollback(self):
+        self.database.rollbacks += 1
+
+
+class FakeDatabase:
+    """
+    Stands in for common.db.Database, answering each query with the rows set for its SQL in 'results'.
+    Statements can be made to fail with fail(), and every checkout to fail while 'unavailable' is set to an exception.
+    """
+    def __init__(self, results=None):
+        self.results = dict(results or dict())
+        self.queries = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.unavailable = None
+        # [matches(sql, params), error, times left (None for always)]
+        self.failures = []
+
+    def fail(self, matches, error, times=None):
+        self.failures.append([matches, error, times])
+
+    def rows(self, sql, params=()):
+        self.queries.append((sql, params))
+        for failure in self.failures:
+            matches, error, times = failure
+            if times != 0 and matches(sql, params):
+                if times is not None:
+                    failure[2] -= 1
+                raise error
+        return self.results.get(sql, [])
+
+    @contextmanager
+    def connection(self):
+        if self.unavailable is not None:
+            raise self.unavailable
+        yield FakeConnection(self)
+
+    def fetch_all(self, sql, params=(), prepared=False):
+        return self.rows(sql, params)
+
+    def fetch_one(self, sql, params=(), prepared=False):
+        rows = self.rows(sql, params)
+        return rows[0] if rows else None
+
+
+@pytest.fixture
+def fake_database():
+    return FakeDatabase
@@ -0,0 +1,143 @@
+import csv
+import importlib.util
+import os
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+import scraper
+from conftest import ROOT
+
+STAND_IN = os.path.join(ROOT, 'testing', 'faa_stand_in')
+
+
+def load_stand_in():
+    # Loaded from its file, since its main.py would clash with the services' main modules
+    spec = importlib.util.spec_from_file_location('faa_stand_in', os.path.join(STAND_IN, 'main.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+stand_in = load_stand_in()
+
+
+def fixture_rows(name):
+    with open(os.path.join(STAND_IN, 'fixtures', f'{name}.csv'), newline='') as f:
+        rows = [(row['FAA_Designator'] or None, float(row['Parking_area_ft2']) if row['Parking_area_ft2'] else None) for row in csv.DictReader(f)]
+    # Empty rows are skipped, like the scraper does
+    return [row for row in rows if row != (None, None)]
+
+
+class FakeAircraftDatabase:
+    """
+    Stands in for the functions of database.py that the scraper calls.
+    """
+    def __init__(self, date):
+        self.date = date
+        self.loads = []
+
+    def get_last_updated(self, type):
+        assert type == 'AircraftData'
+        return self.date
+
+    def insert_aircraft_data(self, rows, date):
+        self.loads.append(rows)
+        self.date = date.isoformat()
+
+    def update_date(self, date):
+        self.date = date.isoformat()
+
+
+@pytest.fixture
+def faa(monkeypatch, tmp_path):
+    """
+    Runs the FAA stand-in on a free port, with the scraper pointed at it and its cache in tmp_path.
+    """
+    stand_in.state.clear()
+    stand_in.counts.clear()
+    stand_in.set_fixture('2025-03-03', 'aircraft_data_v1', 'xlsx')
+
+    server = make_server('127.0.0.1', 0, stand_in.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    cache_dir = str(tmp_path / 'cache')
+    monkeypatch.setattr(scraper, 'AIRCRAFT_DATA_URL', f'http://127.0.0.1:{server.server_port}{stand_in.PAGE_PATH}')
+    monkeypatch.setattr(scraper, 'CACHE_DIR', cache_dir)
+    monkeypatch.setattr(scraper, 'WORKBOOK_PATH', os.path.join(cache_dir, 'aircraft_data'))
+    monkeypatch.setattr(scraper, 'CACHE_INFO_PATH', os.path.join(cache_dir, 'aircraft_data.json'))
+    yield stand_in
+    server.shutdown()
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeAircraftDatabase('2025-01-01')
+    monkeypatch.setattr(scraper, 'get_last_updated', database.get_last_updated)
+    monkeypatch.setattr(scraper, 'insert_aircraft_data', database.insert_aircraft_data)
+    monkeypatch.setattr(scraper, 'update_date', database.update_date)
+    return database
+
+
+def responses(faa, path, status):
+    return faa.counts.get(f'{faa.PAGE_PATH}{path} {status}', 0)
+
+
+@pytest.mark.parametrize('format', ['xlsx', 'xls'])
+def test_both_workbook_formats_are_loaded(faa, database, format):
+    faa.set_fixture(format=format)
+
+    scraper.scrape_aircraft_data()
+
+    assert database.loads == [fixture_rows('aircraft_data_v1')]
+    assert database.date == '2025-03-03'
+    assert os.path.exists(os.path.join(scraper.CACHE_DIR, f'aircraft_data.{format}'))
+
+
+def test_workbook_format_comes_from_the_first_bytes(tmp_path):
+    path = tmp_path / 'aircraft_data.xlsx'
+    path.write_bytes(stand_in.build_workbook('aircraft_data_v1', 'xls'))
+    assert scraper.workbook_format(path) == 'xls'
+
+    path.write_bytes(b'<html>Not found</html>')
+    with pytest.raises(ValueError):
+        scraper.read_workbook(path)
+
+
+def test_nothing_is_downloaded_when_the_page_is_not_modified(faa, database):
+    scraper.scrape_aircraft_data()
+    scraper.scrape_aircraft_data()
+
+    assert responses(faa, '', 304) == 1
+    assert responses(faa, '/aircraft_data', 200) == 1
+    assert len(database.loads) == 1
+
+
+def test_page_not_modified_still_loads_when_the_database_is_older(faa, database):
+    scraper.scrape_aircraft_data()
+    # i.e. the database was restored from before the load
+    database.date = '2025-01-01'
+
+    scraper.scrape_aircraft_data()
+
+    # The page's date comes from the cache, and the workbook is downloaded again without validators
+    assert responses(faa, '', 304) == 1
+    assert responses(faa, '/aircraft_data', 200) == 2
+    assert len(database.loads) == 2
+    assert database.date == '2025-03-03'
+
+
+def test_new_date_with_the_same_workbook_only_updates_the_date(faa, database):
+    faa.no_validators = True
+    try:
+        scraper.scrape_aircraft_data()
+        faa.set_fixture('2025-04-01')
+        scraper.scrape_aircraft_data()
+    finally:
+        faa.no_validators = False
+
+    assert len(database.loads) == 1
+    assert responses(faa, '/aircraft_data', 200) == 2
+    assert database.date == '2025-04-01'
@@ -0,0 +1,132 @@
+import pytest
+
+import aircraft_model_normalizer
+from aircraft_model_normalizer import Aircraft_model_normalizer, MAX_UNRESOLVED_MODELS
+from common.flight_plan import FlightPlan
+
+DESIGNATORS = [('C68A',), ('B744',), ('E55P',), ('C56X ',)]
+
+
+@pytest.fixture
+def make_normalizer(monkeypatch, fake_database, tmp_path):
+    def make_normalizer(designators=DESIGNATORS, aliases="alias,designator\nPhenom 300,E55P\nCitation XLS+,C56X\n", **settings):
+        aliases_file = tmp_path / 'aliases.csv'
+        aliases_file.write_text(aliases)
+        monkeypatch.setenv('AIRCRAFT_MODEL_ALIASES_FILE', str(aliases_file))
+        monkeypatch.setenv('AIRCRAFT_MODEL_INDEX_CHECK_INTERVAL', '3600')
+        monkeypatch.setenv('AIRCRAFT_MODEL_INDEX_TTL', '600')
+        for name, value in settings.items():
+            monkeypatch.setenv(name, str(value))
+        database = fake_database({
+            aircraft_model_normalizer.INDEX_VERSION_SQL: [('2025-03-01',)],
+            aircraft_model_normalizer.DESIGNATORS_SQL: list(designators),
+        })
+        return Aircraft_model_normalizer(database)
+    return make_normalizer
+
+
+def index_loads(normalizer):
+    return sum(sql == aircraft_model_normalizer.DESIGNATORS_SQL for sql, _ in normalizer.database.queries)
+
+
+@pytest.mark.parametrize('model, designator', [
+    ('C68A', 'C68A'),
+    (' c68a ', 'C68A'),
+    ('C56X', 'C56X'),
+    # Aliases are matched without case or separators
+    ('Phenom 300', 'E55P'),
+    ('PHENOM-300', 'E55P'),
+    ('citation xls+', 'C56X'),
+    # The designator of a specification is the part between the slashes
+    ('C68A/L', 'C68A'),
+    ('H/B744/L', 'B744'),
+    ('M/Phenom 300/G', 'E55P'),
+    ('GLF6', None),
+    ('H/ZZZZ/L', None),
+    ('', None),
+])
+def test_resolve(make_normalizer, model, designator):
+    assert make_normalizer().resolve(model) == designator
+
+
+def test_models_are_normalized_and_counted(make_normalizer):
+    normalizer = make_normalizer()
+
+    flight_plan = normalizer.normalize_model(FlightPlan(model='H/B744/L'))
+    unresolved = normalizer.normalize_model(FlightPlan(model='GLF6'))
+    normalizer.normalize_model(FlightPlan(model='GLF6'))
+
+    # Strings that don't resolve are kept as they came in
+    assert (flight_plan.model, unresolved.model) == ('B744', 'GLF6')
+    assert normalizer.stats() == {
+        'hits': 1, 'misses': 2, 'designators': 4, 'aliases': 2, 'cached_models': 2, 'unresolved_models': {'GLF6': 2},
+    }
+
+
+def test_cache_is_cleared_when_it_is_full(make_normalizer):
+    normalizer = make_normalizer(AIRCRAFT_MODEL_CACHE_SIZE=2)
+
+    for model in ('C68A', 'C68A/L', 'H/B744/L'):
+        normalizer.lookup_designator(model)
+
+    assert normalizer.cache == {'H/B744/L': 'B744'}
+
+
+def test_unresolved_models_are_trimmed_to_the_most_common(make_normalizer):
+    normalizer = make_normalizer()
+    normalizer.lookup_designator('COMMON')
+    normalizer.lookup_designator('COMMON')
+
+    for i in range(2 * MAX_UNRESOLVED_MODELS):
+        normalizer.lookup_designator(f'X{i}')
+
+    # Trimmed once there were more than twice as many as are kept
+    assert len(normalizer.unresolved_models) == MAX_UNRESOLVED_MODELS
+    assert normalizer.unresolved_models['COMMON'] == 2
+    assert normalizer.misses == 2 * MAX_UNRESOLVED_MODELS + 2
+
+
+def test_reload_swaps_the_index_and_starts_a_new_cache(make_normalizer):
+    normalizer = make_normalizer()
+    assert normalizer.lookup_designator('GLF6') is None
+
+    normalizer.refresh_index()
+    assert index_loads(normalizer) == 1
+
+    normalizer.database.results[aircraft_model_normalizer.INDEX_VERSION_SQL] = [('2025-04-01',)]
+    normalizer.database.results[aircraft_model_normalizer.DESIGNATORS_SQL] = DESIGNATORS + [('GLF6',)]
+    normalizer.refresh_index()
+
+    assert index_loads(normalizer) == 2
+    # The cached miss is gone, so the model resolves against the new designators
+    assert normalizer.cache == dict()
+    assert normalizer.lookup_designator('GLF6') == 'GLF6'
+
+
+def test_editing_the_alias_file_reloads_the_index(make_normalizer):
+    normalizer = make_normalizer()
+    with open(normalizer.aliases_file, 'a') as f:
+        f.write("Gulfstream G650,GLF6\n")
+    normalizer.index_version = (normalizer.index_version[0], normalizer.index_version[1] - 1)
+
+    normalizer.refresh_index()
+
+    assert index_loads(normalizer) == 2
+    assert normalizer.aliases['GULFSTREAMG650'] == 'GLF6'
+
+
+def test_index_is_reloaded_once_it_is_older_than_the_ttl(make_normalizer):
+    normalizer = make_normalizer()
+
+    normalizer.index_loaded_time -= 601
+    normalizer.refresh_index()
+
+    assert index_loads(normalizer) == 2
+
+
+def test_models_are_left_alone_until_the_index_is_loaded(make_normalizer):
+    normalizer = make_normalizer()
+    normalizer.designators = None
+
+    assert normalizer.normalize_model(FlightPlan(model='C68A/L')).model == 'C68A/L'
+    assert normalizer.misses == 0
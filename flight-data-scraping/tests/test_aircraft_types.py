@@ -0,0 +1,137 @@
+from datetime import date
+from decimal import Decimal
+
+import mysql.connector
+import pytest
+
+import database
+from database import AIRCRAFT_TYPES_SQL, STAGING_TABLE, TYPE_INDEX_SQL, UPDATE_DATE_SQL, apply_changes, diff_aircraft_types
+
+LIVE_ROWS_SQL = AIRCRAFT_TYPES_SQL.format(table="aircraft_types")
+LIVE_INDEX_SQL = TYPE_INDEX_SQL.format(table="aircraft_types")
+STAGING_INDEX_SQL = TYPE_INDEX_SQL.format(table=STAGING_TABLE)
+
+CURRENT_ROWS = [('C68A', 4507.0), ('C56X', 2956.0), ('E55P', 2678.0), ('F2TH', 4204.0), ('F2TH', 4654.0)]
+
+
+@pytest.fixture
+def fake_db(monkeypatch, fake_database):
+    """
+    The database insert_aircraft_data writes to, with aircraft_types holding CURRENT_ROWS and an index on type.
+    """
+    fake_db = fake_database({
+        LIVE_ROWS_SQL: list(CURRENT_ROWS),
+        LIVE_INDEX_SQL: [('aircraft_types', 1, 'type_idx', 1, 'type')],
+        STAGING_INDEX_SQL: [(STAGING_TABLE, 1, 'type_idx', 1, 'type')],
+    })
+    monkeypatch.setattr(database, 'shared_database', lambda: fake_db)
+    return fake_db
+
+
+def statements(fake_db):
+    return [sql for sql, _ in fake_db.queries]
+
+
+def written_tables(fake_db):
+    """
+    The tables the updates, deletes and inserts of aircraft types went to.
+    """
+    tables = set()
+    for sql in statements(fake_db):
+        for prefix in ("UPDATE ", "DELETE FROM ", "INSERT INTO "):
+            if sql.startswith(prefix) and "last_updated" not in sql:
+                tables.add(sql[len(prefix):].split(" ")[0])
+    return tables
+
+
+def test_diff_only_returns_the_designators_that_changed():
+    current = [('C68A', Decimal('4507')), ('F2TH', 4654.0), ('F2TH', 4204.0), ('C56X', 2956.0), (None, None)]
+    new = [('C68A', 4507), ('F2TH', 4204), ('F2TH', 4654), ('C56X', 3000), ('CL35', 4740)]
+
+    # The order of a designator's rows doesn't matter, and a Decimal from the database equals the same number
+    assert diff_aircraft_types(current, new) == {
+        'C56X': ([2956.0], [3000]),
+        'CL35': ([], [4740]),
+        None: ([None], []),
+    }
+
+
+def test_apply_changes_updates_single_rows_and_replaces_the_rest(fake_database):
+    fake_db = fake_database()
+    with fake_db.connection() as connection:
+        counts = apply_changes(connection.cursor(), "aircraft_types", {
+            'C56X': ([2956.0], [3000.0]),
+            'F2TH': ([4204.0, 4654.0], [4300.0]),
+            'CL35': ([], [4740.0]),
+            None: ([None], []),
+        })
+
+    assert counts == (1, 2, 2)
+    assert fake_db.queries == [
+        ("UPDATE aircraft_types SET parkingArea = %s WHERE type = %s;", (3000.0, 'C56X')),
+        ("DELETE FROM aircraft_types WHERE type IS NULL;", ()),
+        ("DELETE FROM aircraft_types WHERE type = %s;", ('F2TH',)),
+        ("INSERT INTO aircraft_types (type, parkingArea) VALUES (%s, %s);", ('F2TH', 4300.0)),
+        ("INSERT INTO aircraft_types (type, parkingArea) VALUES (%s, %s);", ('CL35', 4740.0)),
+    ]
+
+
+def test_small_change_is_made_to_the_live_table(fake_db):
+    rows = [('C68A', 4507), ('C56X', 3000), ('E55P', 2678), ('F2TH', 4204), ('F2TH', 4654)]
+
+    database.insert_aircraft_data(rows, date(2025, 4, 1))
+
+    assert written_tables(fake_db) == {'aircraft_types'}
+    assert not any(sql.startswith("RENAME TABLE") for sql in statements(fake_db))
+    assert fake_db.queries[-1] == (UPDATE_DATE_SQL, (date(2025, 4, 1),))
+    assert fake_db.commits == 1
+
+
+def test_large_change_is_made_to_a_copy_that_is_swapped_in(fake_db):
+    rows = [('C68A', 4600), ('C56X', 3000), ('E55P', 2700), ('F2TH', 4300)]
+
+    database.insert_aircraft_data(rows, date(2025, 4, 1))
+
+    sql = statements(fake_db)
+    assert written_tables(fake_db) == {STAGING_TABLE}
+    assert sql.index(f"CREATE TABLE {STAGING_TABLE} LIKE aircraft_types;") < sql.index(f"INSERT INTO {STAGING_TABLE} SELECT * FROM aircraft_types;")
+    rename = sql.index(f"RENAME TABLE aircraft_types TO {database.OLD_TABLE}, {STAGING_TABLE} TO aircraft_types;")
+    assert sql.index(UPDATE_DATE_SQL) > rename
+    assert sql[-2:] == ["SET SESSION lock_wait_timeout = DEFAULT;", UPDATE_DATE_SQL]
+
+
+def test_swap_that_times_out_changes_the_live_table_instead(fake_db):
+    lock_wait_timeout = mysql.connector.errors.DatabaseError(msg="Lock wait timeout exceeded", errno=1205)
+    fake_db.fail(lambda sql, params: sql.startswith("RENAME TABLE"), lock_wait_timeout)
+    rows = [('C68A', 4600), ('C56X', 3000), ('E55P', 2700), ('F2TH', 4300)]
+
+    database.insert_aircraft_data(rows, date(2025, 4, 1))
+
+    sql = statements(fake_db)
+    assert written_tables(fake_db) == {STAGING_TABLE, 'aircraft_types'}
+    # The staging table is dropped after the failed rename, and the changes are made to the live table
+    after_rename = sql[[statement.startswith("RENAME TABLE") for statement in sql].index(True):]
+    assert f"DROP TABLE IF EXISTS {STAGING_TABLE};" in after_rename
+    assert "UPDATE aircraft_types SET parkingArea = %s WHERE type = %s;" in sql
+    assert fake_db.queries[-1] == (UPDATE_DATE_SQL, (date(2025, 4, 1),))
+
+
+def test_table_without_a_type_index_is_swapped_once_even_without_changes(fake_db):
+    # A table made by pandas' to_sql, with a TEXT type and no index
+    fake_db.results[LIVE_INDEX_SQL] = []
+    fake_db.results[STAGING_INDEX_SQL] = []
+
+    database.insert_aircraft_data(CURRENT_ROWS, date(2025, 4, 1))
+
+    sql = statements(fake_db)
+    assert "ALTER TABLE aircraft_types_staging MODIFY type varchar(10) DEFAULT NULL, ADD INDEX type_idx (type);" in sql
+    assert any(statement.startswith("RENAME TABLE") for statement in sql)
+    assert written_tables(fake_db) == {STAGING_TABLE}
+
+    # Once it has the index, a run without changes leaves the table alone
+    fake_db.queries.clear()
+    fake_db.results[LIVE_INDEX_SQL] = [('aircraft_types', 1, 'type_idx', 1, 'type')]
+    database.insert_aircraft_data(CURRENT_ROWS, date(2025, 4, 2))
+
+    assert written_tables(fake_db) == set()
+    assert not any(statement.startswith("RENAME TABLE") for statement in statements(fake_db))
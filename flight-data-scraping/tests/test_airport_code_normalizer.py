@@ -0,0 +1,82 @@
+import pytest
+
+import airport_code_normalizer
+from airport_code_normalizer import Airport_code_normalizer
+from common.flight_plan import FlightPlan
+
+INDEX = [('teb', 'KTEB'), ('HPN', 'KHPN'), ('PBI', 'KPBI')]
+
+
+@pytest.fixture
+def make_normalizer(monkeypatch, fake_database):
+    def make_normalizer(index=INDEX, version='1700000000'):
+        monkeypatch.setenv('AIRPORT_INDEX_CHECK_INTERVAL', '3600')
+        monkeypatch.setenv('AIRPORT_INDEX_TTL', '600')
+        database = fake_database({
+            airport_code_normalizer.INDEX_VERSION_SQL: [(version,)] if version is not None else [],
+            airport_code_normalizer.INDEX_SQL: list(index),
+        })
+        return Airport_code_normalizer(database)
+    return make_normalizer
+
+
+def index_loads(normalizer):
+    return sum(sql == airport_code_normalizer.INDEX_SQL for sql, _ in normalizer.database.queries)
+
+
+def test_iata_codes_are_converted_from_the_index(make_normalizer):
+    normalizer = make_normalizer()
+
+    flight_plan = normalizer.IATA_codes_to_ICAO_codes(FlightPlan(dep_arpt='teb', arr_arpt='PBI'))
+
+    assert (flight_plan.dep_arpt, flight_plan.arr_arpt) == ('KTEB', 'KPBI')
+    # Only the index was read, not one query per code
+    assert index_loads(normalizer) == 1
+    assert not any(sql == airport_code_normalizer.ICAO_CODE_SQL for sql, _ in normalizer.database.queries)
+
+
+def test_hits_and_misses_are_counted(make_normalizer):
+    normalizer = make_normalizer()
+
+    flight_plan = normalizer.IATA_codes_to_ICAO_codes(FlightPlan(dep_arpt='XYZ', arr_arpt='HPN'))
+    normalizer.IATA_codes_to_ICAO_codes(FlightPlan(dep_arpt='XYZ', arr_arpt='KTEB'))
+    normalizer.IATA_codes_to_ICAO_codes(FlightPlan(dep_arpt='HPN', status='CANCELED'))
+
+    # Unknown codes and 4 letter codes are left as they are, and cancellations aren't looked at
+    assert (flight_plan.dep_arpt, flight_plan.arr_arpt) == ('XYZ', 'KHPN')
+    assert normalizer.stats() == {'hits': 1, 'misses': 2, 'index_size': 3, 'missing_codes': {'XYZ': 2}}
+
+
+def test_index_is_reloaded_when_the_airport_data_version_changes(make_normalizer):
+    normalizer = make_normalizer()
+
+    normalizer.refresh_index()
+    assert index_loads(normalizer) == 1
+
+    normalizer.database.results[airport_code_normalizer.INDEX_VERSION_SQL] = [('1700000100',)]
+    normalizer.database.results[airport_code_normalizer.INDEX_SQL] = INDEX + [('ASE', 'KASE')]
+    normalizer.refresh_index()
+
+    assert index_loads(normalizer) == 2
+    assert normalizer.lookup_icao_code('ASE') == 'KASE'
+
+
+def test_index_is_reloaded_once_it_is_older_than_the_ttl(make_normalizer):
+    # Without the last_updated row, only the TTL reloads the index
+    normalizer = make_normalizer(version=None)
+    normalizer.refresh_index()
+    assert index_loads(normalizer) == 1
+
+    normalizer.index_loaded_time -= 601
+    normalizer.refresh_index()
+
+    assert index_loads(normalizer) == 2
+
+
+def test_database_is_asked_directly_until_the_index_is_loaded(make_normalizer):
+    normalizer = make_normalizer()
+    normalizer.iata_to_icao = None
+    normalizer.database.results[airport_code_normalizer.ICAO_CODE_SQL] = [('KASE',)]
+
+    assert normalizer.lookup_icao_code('ASE') == 'KASE'
+    assert normalizer.database.queries[-1] == (airport_code_normalizer.ICAO_CODE_SQL, ('ASE',))
@@ -0,0 +1,100 @@
+import asyncio
+
+import requests
+
+import flight_plans_api
+from async_pipeline import AsyncPipeline
+from flight_message_extractor import FlightMessageExtractor
+from flightDataProcessor import FlightDataProcessor
+from message_header_filter import MessageHeaderFilter
+from pipeline_metrics import STAGE_ERRORS
+from sample_messages import SAMPLE_MESSAGES
+from stale_message_filter import StaleMessageFilter
+
+
+class PassThrough:
+    def IATA_codes_to_ICAO_codes(self, flight_plan):
+        return flight_plan
+
+    def assign_fbo(self, flight_plan):
+        if flight_plan.acid == "BROKEN":
+            raise RuntimeError("no parking data")
+        return flight_plan
+
+
+class FakeMessageApi:
+    """
+    Hands out the responses in order, then nothing. A response that is an exception is raised instead.
+    """
+    def __init__(self, responses):
+        self.responses = list(responses)
+
+    def fetch_message(self):
+        if not self.responses:
+            return None
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def run_pipeline(responses, expected, monkeypatch):
+    published = []
+    monkeypatch.setattr(flight_plans_api, 'add_flight_plan', published.append)
+    pipeline = AsyncPipeline("http://message-api", MessageHeaderFilter(), FlightMessageExtractor(), FlightDataProcessor(), PassThrough(), PassThrough(),
+                             staleMessageFilter=StaleMessageFilter(), queue_size=2, min_poll_interval=0.001, max_poll_interval=0.01)
+    pipeline.fetch_message = FakeMessageApi(responses).fetch_message
+
+    async def main():
+        task = asyncio.ensure_future(pipeline.run())
+        for _ in range(500):
+            if len(published) >= expected or task.done():
+                break
+            await asyncio.sleep(0.01)
+        # Give a stage that shouldn't publish any more the chance to
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return task
+
+    task = asyncio.run(main())
+    return pipeline, published, task
+
+
+def test_messages_go_through_every_stage_in_order(monkeypatch):
+    messages = [SAMPLE_MESSAGES[msg_type] for msg_type in ('flightPlanInformation', 'departureInformation', 'trackInformation', 'arrivalInformation')]
+    # Dropped by the header filter
+    messages.insert(1, SAMPLE_MESSAGES['boundaryCrossingUpdate'])
+
+    pipeline, published, task = run_pipeline(messages, 4, monkeypatch)
+
+    assert task.cancelled()
+    assert [flight_plan.status for flight_plan in published] == ['SCHEDULED', 'FLYING', 'FLYING', 'ARRIVED']
+    assert pipeline.counts['messages_fetched'] == 5
+    assert pipeline.counts['flight_plans_published'] == 4
+
+
+def test_bad_responses_and_items_are_skipped_without_stopping_the_pipeline(monkeypatch):
+    fetch_errors = STAGE_ERRORS.labels('fetch').value
+    enrich_errors = STAGE_ERRORS.labels('enrich').value
+    responses = [
+        requests.exceptions.ConnectionError("connection refused"),
+        ValueError("Expecting value: line 1 column 1 (char 0)"),
+        KeyError('message'),
+        "not xml at all",
+        # Fails in the FBO assigner
+        SAMPLE_MESSAGES['departureInformation'].replace('acid="N123QS"', 'acid="BROKEN"'),
+        SAMPLE_MESSAGES['arrivalInformation'],
+    ]
+
+    pipeline, published, task = run_pipeline(responses, 1, monkeypatch)
+
+    # Only the pipeline's own cancellation ended it
+    assert task.cancelled()
+    assert [flight_plan.status for flight_plan in published] == ['ARRIVED']
+    assert pipeline.counts['request_errors'] == 1
+    assert STAGE_ERRORS.labels('fetch').value - fetch_errors == 2
+    assert STAGE_ERRORS.labels('enrich').value - enrich_errors == 1
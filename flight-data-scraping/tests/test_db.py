@@ -0,0 +1,179 @@
+import threading
+import time
+
+import mysql.connector
+import pytest
+
+from common import db
+from common.db import Database, DatabaseUnavailable
+
+
+class FakeRawConnection:
+    """
+    Stands in for a mysql.connector connection.
+    """
+    def __init__(self, number):
+        self.number = number
+        self.alive = True
+        self.closed = False
+        self.rollbacks = 0
+
+    def ping(self, reconnect=False):
+        if not self.alive:
+            raise mysql.connector.errors.InterfaceError(msg="Lost connection to MySQL server")
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnector:
+    """
+    Replaces mysql.connector.connect, handing out numbered connections, or failing while 'down' is set.
+    """
+    def __init__(self):
+        self.connections = []
+        self.down = False
+
+    def connect(self, **connect_args):
+        if self.down:
+            raise mysql.connector.errors.InterfaceError(msg="Can't connect to MySQL server")
+        connection = FakeRawConnection(len(self.connections) + 1)
+        self.connections.append(connection)
+        return connection
+
+
+@pytest.fixture
+def connector(monkeypatch):
+    connector = FakeConnector()
+    monkeypatch.setattr(db.mysql.connector, 'connect', connector.connect)
+    return connector
+
+
+def make_database(**settings):
+    settings.setdefault('pool_size', 2)
+    settings.setdefault('checkout_timeout', 0.05)
+    return Database('localhost', 'user', 'password', 'test', **settings)
+
+
+def test_connections_are_reused(connector):
+    database = make_database()
+
+    with database.connection() as first:
+        pass
+    with database.connection() as second:
+        pass
+
+    assert second is first
+    assert len(connector.connections) == 1
+
+
+def test_checkout_blocks_when_every_connection_is_in_use(connector):
+    database = make_database(pool_size=1, checkout_timeout=0.05)
+
+    with database.connection():
+        start = time.monotonic()
+        with pytest.raises(DatabaseUnavailable):
+            database.checkout()
+        assert time.monotonic() - start >= 0.05
+
+    assert database.stats['checkout_timeouts'] == 1
+    assert len(connector.connections) == 1
+
+
+def test_checkout_waits_for_a_connection_to_come_back(connector):
+    database = make_database(pool_size=1, checkout_timeout=5)
+    first = database.checkout()
+    releaser = threading.Timer(0.05, database.release, (first,))
+    releaser.start()
+
+    second = database.checkout()
+
+    releaser.join()
+    assert second is first
+    assert database.info()['open_connections'] == 1
+
+
+def test_unhealthy_idle_connection_is_replaced_on_checkout(connector):
+    database = make_database(health_check_interval=0)
+    with database.connection() as first:
+        pass
+    first.raw.alive = False
+
+    with database.connection() as second:
+        pass
+
+    assert second is not first
+    assert first.raw.closed
+    assert database.stats['connections_discarded'] == 1
+    assert database.info()['open_connections'] == 1
+
+
+def test_failed_connects_back_off_and_fail_fast(connector):
+    database = make_database(min_backoff=10, max_backoff=30)
+    connector.down = True
+
+    with pytest.raises(DatabaseUnavailable):
+        database.checkout()
+    # Until the backoff is over, checkouts fail without trying to connect
+    connector.down = False
+    with pytest.raises(DatabaseUnavailable, match="retrying in"):
+        database.checkout()
+
+    assert database.stats['connect_failures'] == 1
+    assert not database.available()
+    assert 0 < database.seconds_until_retry() <= 10
+    # The slots taken for the failed attempts are given back
+    assert database.info()['open_connections'] == 0
+
+
+def test_backoff_doubles_up_to_the_max(connector):
+    database = make_database(min_backoff=1, max_backoff=3)
+    connector.down = True
+
+    backoffs = []
+    for _ in range(4):
+        # Let the next attempt through straight away
+        database.retry_at = 0.0
+        with pytest.raises(DatabaseUnavailable):
+            database.checkout()
+        backoffs.append(round(database.seconds_until_retry()))
+
+    assert backoffs == [1, 2, 3, 3]
+
+    connector.down = False
+    database.retry_at = 0.0
+    with database.connection():
+        pass
+    assert database.failures == 0
+    assert database.available()
+
+
+def test_connection_is_rolled_back_and_returned_after_an_error(connector):
+    database = make_database()
+
+    with pytest.raises(ValueError):
+        with database.connection() as connection:
+            raise ValueError("bad row")
+
+    assert connection.raw.rollbacks == 1
+    assert not connection.raw.closed
+    assert list(database.idle) == [connection]
+
+
+def test_connection_is_thrown_away_after_a_connection_error(connector):
+    database = make_database()
+
+    with pytest.raises(mysql.connector.errors.OperationalError):
+        with database.connection() as connection:
+            raise mysql.connector.errors.OperationalError(msg="MySQL server has gone away")
+
+    assert connection.raw.closed
+    assert not database.idle
+    assert database.info()['open_connections'] == 0
+    assert database.stats['connections_discarded'] == 1
@@ -0,0 +1,203 @@
+import pytest
+
+import fbo_assigner
+from common.flight_plan import FlightPlan
+from fbo_assigner import Fbo_assigner
+
+# FBO 1 and 2 at KTEB (1 has the higher priority), FBO 3 at KHPN
+PARKING = [
+    (1, 'KTEB', 2, 10000, 1),
+    (2, 'KTEB', 1, 5000, 2),
+    (3, 'KHPN', 1, 5000, 1),
+]
+
+
+@pytest.fixture
+def make_assigner(monkeypatch, fake_database):
+    def make_assigner(plan_fbos=(), fleet=(), mode='slots', parking_areas=()):
+        monkeypatch.setenv('FBO_ASSIGNMENT_MODE', mode)
+        monkeypatch.setenv('FBO_RECONCILE_INTERVAL', '3600')
+        monkeypatch.setenv('FBO_PARKING_AREA_FACTOR', '1')
+        monkeypatch.setenv('FBO_DEFAULT_PARKING_AREA', '3000')
+        database = fake_database({
+            fbo_assigner.PARKING_SQL: PARKING,
+            fbo_assigner.PLAN_FBOS_SQL: list(plan_fbos),
+            fbo_assigner.FLEET_SQL: list(fleet),
+            fbo_assigner.AIRCRAFT_DATA_DATE_SQL: [('2024-01-01',)],
+            fbo_assigner.PARKING_AREAS_SQL: list(parking_areas),
+        })
+        return Fbo_assigner(database)
+    return make_assigner
+
+
+def occupancy(assigner):
+    return {fbo_id: fbo[3] for fbo_id, fbo in assigner.fbos.items()}
+
+
+def flying(flight_ref, acid, model=None, arr_arpt='KTEB'):
+    return FlightPlan(flight_ref=flight_ref, acid=acid, status='FLYING', model=model, arr_arpt=arr_arpt)
+
+
+def test_reconcile_counts_planes_pointing_to_assigned_flight_plans(make_assigner):
+    assigner = make_assigner(
+        plan_fbos=[('R1', 1), ('R2', 1), ('R3', 3), ('R4', None), ('R5', 2)],
+        # R5 has an FBO but no plane points to it
+        fleet=[('N1QS', 'R1', 'C68A'), ('N2QS', 'R2', None), ('N3QS', 'R3', None), ('N4QS', 'R4', None)],
+    )
+    assert occupancy(assigner) == {1: 2, 2: 0, 3: 1}
+    assert assigner.open_fbos['KTEB'] == [(2, 2)]
+    assert not assigner.open_fbos.get('KHPN')
+
+
+def test_assigns_the_highest_priority_fbo_with_open_space(make_assigner):
+    assigner = make_assigner()
+
+    first = assigner.assign_fbo(flying('R1', 'N1QS'))
+    second = assigner.assign_fbo(flying('R2', 'N2QS'))
+    third = assigner.assign_fbo(flying('R3', 'N3QS'))
+    fourth = assigner.assign_fbo(flying('R4', 'N4QS'))
+
+    assert [first.fbo_id, second.fbo_id, third.fbo_id, fourth.fbo_id] == [1, 1, 2, None]
+    assert occupancy(assigner) == {1: 2, 2: 1, 3: 0}
+    assert assigner.open_fbos['KTEB'] == []
+
+
+def test_an_assigned_flight_plan_keeps_its_fbo(make_assigner):
+    assigner = make_assigner()
+    assigner.assign_fbo(flying('R1', 'N1QS'))
+
+    update = assigner.assign_fbo(FlightPlan(flight_ref='R1', acid='N1QS', status='ARRIVED', arr_arpt='KTEB'))
+
+    assert update.fbo_id is None
+    assert occupancy(assigner)[1] == 1
+
+
+def test_cancellation_frees_the_space(make_assigner):
+    assigner = make_assigner(plan_fbos=[('R1', 2)], fleet=[('N1QS', 'R1', None)])
+    assert assigner.open_fbos['KTEB'] == [(1, 1)]
+
+    assigner.assign_fbo(FlightPlan(flight_ref='R1', status='CANCELED'))
+
+    assert occupancy(assigner)[2] == 0
+    assert assigner.open_fbos['KTEB'] == [(1, 1), (2, 2)]
+    assert assigner.assign_fbo(flying('R2', 'N2QS')).fbo_id == 1
+
+
+def test_plane_moving_to_a_new_flight_leaves_its_old_fbo(make_assigner):
+    assigner = make_assigner(plan_fbos=[('R1', 3)], fleet=[('N1QS', 'R1', None)])
+
+    new_flight = assigner.assign_fbo(flying('R2', 'N1QS'))
+
+    # The database manager deletes the flight plan the plane pointed to before
+    assert new_flight.fbo_id == 1
+    assert 'R1' not in assigner.plan_fbos
+    assert occupancy(assigner) == {1: 1, 2: 0, 3: 0}
+    assert assigner.open_fbos['KHPN'] == [(1, 3)]
+
+
+def test_scheduled_flight_plan_takes_no_space_until_a_plane_points_to_it(make_assigner):
+    assigner = make_assigner()
+
+    scheduled = assigner.assign_fbo(FlightPlan(flight_ref='R1', acid='N1QS', status='SCHEDULED', arr_arpt='KTEB'))
+    assert scheduled.fbo_id == 1
+    assert occupancy(assigner)[1] == 0
+
+    assigner.assign_fbo(flying('R1', 'N1QS'))
+    assert occupancy(assigner)[1] == 1
+
+
+def test_reconcile_keeps_flight_plans_that_are_not_in_the_database_yet(make_assigner):
+    assigner = make_assigner()
+    assigner.assign_fbo(flying('R1', 'N1QS'))
+
+    assigner.reconcile()
+
+    # The plane isn't in netjets_fleet yet, so it only counts again once the database manager has written it
+    assert assigner.plan_fbos == {'R1': 1}
+    assert assigner.assign_fbo(flying('R1', 'N1QS')).fbo_id is None
+
+
+def test_consistency_check_reports_differences(make_assigner):
+    assigner = make_assigner(plan_fbos=[('R1', 1)], fleet=[('N1QS', 'R1', None)])
+    assigner.database.results[fbo_assigner.OCCUPANCY_SQL] = [(1, 1), (3, 2)]
+
+    assert assigner.check_consistency() == {3: (0, 2)}
+
+
+# --- Area mode ---
+
+PARKING_AREAS = [('C68A', 4500), ('GLEX', 9000), (' e55p', 2700)]
+
+
+def test_area_mode_counts_the_parking_area_of_each_plane(make_assigner):
+    assigner = make_assigner(
+        plan_fbos=[('R1', 1), ('R2', 1), ('R3', 3)],
+        # N2QS has no model and N3QS a model that isn't in aircraft_types, both take the default area
+        fleet=[('N1QS', 'R1', 'C68A'), ('N2QS', 'R2', None), ('N3QS', 'R3', 'ZZZZ')],
+        mode='area', parking_areas=PARKING_AREAS,
+    )
+
+    assert occupancy(assigner) == {1: 7500, 2: 0, 3: 3000}
+    assert assigner.parking_area('E55P') == 2700
+    assert assigner.unknown_models == {'ZZZZ'}
+
+
+def test_area_mode_assigns_the_first_fbo_with_enough_area_left(make_assigner):
+    assigner = make_assigner(plan_fbos=[('R1', 1)], fleet=[('N1QS', 'R1', 'C68A')], mode='area', parking_areas=PARKING_AREAS)
+
+    # FBO 1 has 5500 ft2 left and FBO 2 5000 ft2
+    small = assigner.assign_fbo(flying('R2', 'N2QS', model='E55P'))
+    large = assigner.assign_fbo(flying('R3', 'N3QS', model='GLEX'))
+    medium = assigner.assign_fbo(flying('R4', 'N4QS', model='C68A'))
+
+    assert [small.fbo_id, large.fbo_id, medium.fbo_id] == [1, None, 2]
+    assert occupancy(assigner) == {1: 7200, 2: 4500, 3: 0}
+    # Both still have area left, just not enough for another large plane
+    assert assigner.open_fbos['KTEB'] == [(1, 1), (2, 2)]
+
+
+def test_area_mode_uses_the_plane_model_from_the_fleet(make_assigner):
+    assigner = make_assigner(plan_fbos=[('R1', 3)], fleet=[('N1QS', 'R1', 'GLEX')], mode='area', parking_areas=PARKING_AREAS)
+
+    # The flight plan has no model, but the plane in netjets_fleet is too large for what is left at KTEB
+    assigner.assign_fbo(flying('R2', 'N2QS', model='C68A'))
+    assigner.assign_fbo(flying('R3', 'N3QS', model='C68A'))
+    moved = assigner.assign_fbo(flying('R4', 'N1QS'))
+
+    assert moved.fbo_id is None
+    assert occupancy(assigner) == {1: 9000, 2: 0, 3: 0}
+
+
+def test_area_mode_moves_the_area_when_the_plane_model_changes(make_assigner):
+    assigner = make_assigner(plan_fbos=[('R1', 1)], fleet=[('N1QS', 'R1', None)], mode='area', parking_areas=PARKING_AREAS)
+    assert occupancy(assigner)[1] == 3000
+
+    assigner.assign_fbo(flying('R1', 'N1QS', model='GLEX'))
+
+    assert occupancy(assigner)[1] == 9000
+    assert assigner.open_fbos['KTEB'] == [(1, 1), (2, 2)]
+
+
+def test_area_mode_capacity_falls_back_to_total_space_of_default_planes(make_assigner):
+    assigner = make_assigner(mode='area', parking_areas=PARKING_AREAS)
+
+    assert assigner.capacity(2, 10000) == 10000
+    assert assigner.capacity(2, None) == 6000
+    assert assigner.capacity(None, None) is None
+
+
+def test_area_mode_reloads_parking_areas_only_when_the_aircraft_data_changes(make_assigner):
+    assigner = make_assigner(mode='area', parking_areas=PARKING_AREAS)
+
+    def loads():
+        return sum(sql == fbo_assigner.PARKING_AREAS_SQL for sql, _ in assigner.database.queries)
+
+    assigner.reconcile()
+    assert loads() == 1
+
+    assigner.database.results[fbo_assigner.AIRCRAFT_DATA_DATE_SQL] = [('2024-02-01',)]
+    assigner.database.results[fbo_assigner.PARKING_AREAS_SQL] = [('C68A', 4800)]
+    assigner.reconcile()
+
+    assert loads() == 2
+    assert assigner.parking_area('C68A') == 4800
@@ -0,0 +1,143 @@
+from decimal import Decimal
+
+import pytest
+
+import fbo_occupancy
+from common.db import DatabaseUnavailable
+from fbo_occupancy import AIRPORT_TOTAL, Fbo_occupancy, contributions_statement, counters_upsert_statement, totals
+
+EVERY_PLANE_SQL = contributions_statement()
+LOCKED = [(1,)]
+
+
+@pytest.fixture
+def occupancy_database(fake_database):
+    return fake_database({
+        fbo_occupancy.LOCK_SQL: LOCKED,
+        fbo_occupancy.TABLE_EXISTS_SQL: [('fbo_occupancy',)],
+        fbo_occupancy.AIRCRAFT_DATA_DATE_SQL: [('2025-03-03',)],
+    })
+
+
+def upserts(database):
+    """
+    The (airport, fbo_id, planes, parked_planes, parking_area) rows added to the counters, in order.
+    """
+    rows = []
+    for sql, params in database.queries:
+        if sql.startswith("INSERT INTO fbo_occupancy"):
+            rows.extend(tuple(params[i:i + 5]) for i in range(0, len(params), 5))
+    return rows
+
+
+def run(database, method, *args, **kwargs):
+    with database.connection() as connection:
+        return method(connection.cursor(), *args, **kwargs)
+
+
+def test_contributions_are_filtered_by_flight_refs_or_acids():
+    assert EVERY_PLANE_SQL == fbo_occupancy.CONTRIBUTIONS_SQL.format(where="")
+    assert "WHERE netjets_fleet.flightRef IN (%s, %s) OR netjets_fleet.acid IN (%s)" in contributions_statement(2, 1)
+    assert "WHERE netjets_fleet.acid IN (%s, %s)" in contributions_statement(0, 2)
+
+
+def test_totals_add_every_fbo_to_its_airport():
+    counters = totals([
+        ('KTEB', 1, 2, 1, Decimal('9000.00')),
+        ('KTEB', 2, 1, None, None),
+        ('KHPN', 3, 1, 1, 4507),
+    ])
+
+    assert counters == {
+        ('KTEB', 1): [2, 1, Decimal('9000.00')],
+        ('KTEB', 2): [1, 0, Decimal(0)],
+        ('KTEB', AIRPORT_TOTAL): [3, 1, Decimal('9000.00')],
+        ('KHPN', 3): [1, 1, Decimal(4507)],
+        ('KHPN', AIRPORT_TOTAL): [1, 1, Decimal(4507)],
+    }
+
+
+def test_apply_adds_only_the_counters_that_changed(fake_database):
+    database = fake_database()
+    # A plane left FBO 1 for FBO 2, and another at FBO 2 arrived
+    before = totals([('KTEB', 1, 1, 0, 4507), ('KTEB', 2, 1, 0, 2678)])
+    after = totals([('KTEB', 2, 2, 1, 7185)])
+
+    changed = run(database, Fbo_occupancy().apply, before, after)
+
+    assert changed == 3
+    assert sorted(upserts(database)) == [
+        ('KTEB', AIRPORT_TOTAL, 0, 1, Decimal(0)),
+        ('KTEB', 1, -1, 0, Decimal(-4507)),
+        ('KTEB', 2, 1, 1, Decimal(4507)),
+    ]
+    assert database.queries[0][0] == counters_upsert_statement(3)
+
+
+def test_apply_writes_nothing_when_the_counts_are_the_same(fake_database):
+    database = fake_database()
+    counts = totals([('KTEB', 1, 1, 0, 4507)])
+
+    assert run(database, Fbo_occupancy().apply, counts, dict(counts)) == 0
+    assert database.queries == []
+
+
+def test_rebuild_replaces_the_counters_in_chunks(fake_database):
+    database = fake_database({EVERY_PLANE_SQL: [('KTEB', 1, 2, 1, 9000), ('KTEB', 2, 1, 0, 3000), ('KHPN', 3, 1, 1, 4507)]})
+
+    count = run(database, Fbo_occupancy().rebuild, chunk_size=2)
+
+    assert count == 5
+    statements = [sql for sql, _ in database.queries]
+    assert statements == [EVERY_PLANE_SQL, fbo_occupancy.DELETE_COUNTERS_SQL, counters_upsert_statement(2), counters_upsert_statement(2), counters_upsert_statement(1)]
+    assert ('KTEB', AIRPORT_TOTAL, 3, 1, Decimal(12000)) in upserts(database)
+
+
+def test_counters_are_rebuilt_after_a_start_and_when_the_aircraft_data_changes(occupancy_database):
+    occupancy = Fbo_occupancy(refresh_interval=0)
+
+    assert run(occupancy_database, occupancy.prepare) is True
+    # Until the rebuild is committed, every transaction does it again
+    assert run(occupancy_database, occupancy.prepare) is True
+    occupancy.rebuild_committed()
+    assert run(occupancy_database, occupancy.prepare) is False
+
+    occupancy_database.results[fbo_occupancy.AIRCRAFT_DATA_DATE_SQL] = [('2025-04-01',)]
+    assert run(occupancy_database, occupancy.prepare) is True
+
+
+def test_missing_table_is_created(occupancy_database):
+    occupancy_database.results[fbo_occupancy.TABLE_EXISTS_SQL] = []
+    occupancy = Fbo_occupancy()
+
+    run(occupancy_database, occupancy.prepare)
+
+    assert (fbo_occupancy.CREATE_SQL, ()) in occupancy_database.queries
+
+
+def test_lock_timeout_is_a_connection_error(occupancy_database):
+    occupancy_database.results[fbo_occupancy.LOCK_SQL] = [(0,)]
+    occupancy = Fbo_occupancy()
+
+    with pytest.raises(DatabaseUnavailable):
+        run(occupancy_database, occupancy.prepare)
+    assert occupancy.locked is False
+
+
+def test_check_reports_the_counters_that_differ(fake_database, capsys):
+    database = fake_database({
+        fbo_occupancy.COUNTERS_SQL: [('KTEB', 1, 2, 1, Decimal('9000.00')), ('KTEB', AIRPORT_TOTAL, 2, 1, Decimal('9000.00')), ('KHPN', 3, 1, 0, Decimal(0))],
+        EVERY_PLANE_SQL: [('KTEB', 1, 2, 1, 9000), ('KHPN', 3, 1, 1, 0)],
+    })
+    occupancy = Fbo_occupancy()
+
+    assert run(database, occupancy.differences) == {
+        ('KHPN', 3): ((1, 0, Decimal(0)), (1, 1, Decimal(0))),
+        ('KHPN', AIRPORT_TOTAL): ((0, 0, Decimal(0)), (1, 1, Decimal(0))),
+    }
+    assert fbo_occupancy.check(database, occupancy) is False
+    assert "('KHPN', 3)" in capsys.readouterr().out
+
+    database.results[fbo_occupancy.COUNTERS_SQL].append(('KHPN', AIRPORT_TOTAL, 1, 1, Decimal(0)))
+    database.results[fbo_occupancy.COUNTERS_SQL][2] = ('KHPN', 3, 1, 1, Decimal(0))
+    assert fbo_occupancy.check(database, occupancy) is True
@@ -0,0 +1,91 @@
+import pytest
+
+from fleet_cache import FLEET_SQL, Fleet_cache
+
+
+class FleetCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+
+    def execute(self, sql, params=()):
+        self.executed.append(sql)
+
+    def fetchall(self):
+        return list(self.rows)
+
+
+@pytest.fixture
+def cache():
+    cache = Fleet_cache()
+    cache.load(FleetCursor([('N1QS', 'R1', 'C68A'), ('N2QS', 'R2', None)]))
+    return cache
+
+
+def test_load_mirrors_the_table(cache):
+    assert cache.fleet == {'N1QS': ['R1', 'C68A'], 'N2QS': ['R2', None]}
+    assert cache.acid_by_ref == {'R1': 'N1QS', 'R2': 'N2QS'}
+    assert cache.flight_ref('N1QS') == 'R1'
+    assert cache.flight_ref('N9QS') is None
+    assert cache.size() == 2
+
+
+def test_unchanged(cache):
+    assert cache.unchanged('N1QS', 'R1', None)
+    assert cache.unchanged('N1QS', 'R1', 'C68A')
+    assert not cache.unchanged('N1QS', 'R1', 'E55P')
+    assert not cache.unchanged('N1QS', 'R3', None)
+    assert not cache.unchanged('N9QS', 'R9', None)
+
+
+def test_apply_adds_a_new_plane(cache):
+    cache.apply('N3QS', 'R3', 'E55P')
+
+    assert cache.fleet['N3QS'] == ['R3', 'E55P']
+    assert cache.acid_by_ref['R3'] == 'N3QS'
+    assert cache.unchanged('N3QS', 'R3', 'E55P')
+
+
+def test_apply_moves_a_plane_to_a_new_flight_and_keeps_its_model(cache):
+    cache.apply('N1QS', 'R5', None)
+
+    assert cache.fleet['N1QS'] == ['R5', 'C68A']
+    assert 'R1' not in cache.acid_by_ref
+    assert cache.acid_by_ref['R5'] == 'N1QS'
+
+
+def test_apply_updates_the_model(cache):
+    cache.apply('N2QS', 'R2', 'GLEX')
+
+    assert cache.fleet['N2QS'] == ['R2', 'GLEX']
+
+
+def test_apply_of_a_flight_ref_another_plane_has_reloads_the_table(cache):
+    # The upsert would update N2QS's row through the unique flightRef, so the copy can't follow it
+    cache.apply('N1QS', 'R2', None)
+
+    assert cache.fleet is None
+    cursor = FleetCursor([('N1QS', 'R2', 'C68A')])
+    cache.ensure_loaded(cursor)
+    assert cursor.executed == [FLEET_SQL]
+    assert cache.fleet == {'N1QS': ['R2', 'C68A']}
+
+
+def test_apply_before_loading_does_nothing():
+    cache = Fleet_cache()
+    cache.apply('N1QS', 'R1', 'C68A')
+
+    assert cache.fleet is None
+    assert cache.size() == 0
+
+
+def test_ensure_loaded_reloads_after_the_refresh_interval():
+    cache = Fleet_cache(refresh_interval=3600)
+    cursor = FleetCursor([('N1QS', 'R1', None)])
+    cache.ensure_loaded(cursor)
+    cache.ensure_loaded(cursor)
+    assert len(cursor.executed) == 1
+
+    cache.refresh_interval = 0
+    cache.ensure_loaded(cursor)
+    assert len(cursor.executed) == 2
@@ -0,0 +1,82 @@
+import pytest
+import xmltodict
+
+from common.flight_plan import zulu_to_epoch
+from flightDataProcessor import FlightDataProcessor
+from flight_message_extractor import FlightMessageExtractor, MESSAGE_PATHS
+from sample_messages import SAMPLE_MESSAGES, root
+
+# Before the sample flights depart, while they are in the air, and after they have landed
+CURRENT_TIMES = ("2025-03-25T00:00:00Z", "2025-03-25T13:00:00Z", "2025-03-26T00:00:00Z")
+
+
+@pytest.fixture
+def extractor():
+    return FlightMessageExtractor()
+
+
+@pytest.mark.parametrize("current_time", CURRENT_TIMES)
+@pytest.mark.parametrize("msg_type", sorted(SAMPLE_MESSAGES))
+def test_same_flight_plan_as_the_xmltodict_parse(extractor, msg_type, current_time):
+    message = SAMPLE_MESSAGES[msg_type]
+    processor = FlightDataProcessor()
+    processor.set_current_time(zulu_to_epoch(current_time))
+
+    expected = processor.process_message(xmltodict.parse(message).get('fltdMessage'))
+    actual = processor.process_message(extractor.parse(message).get('fltdMessage'))
+
+    assert actual == expected
+
+
+@pytest.mark.parametrize("msg_type", sorted(SAMPLE_MESSAGES))
+def test_root_attributes_are_kept(extractor, msg_type):
+    message = SAMPLE_MESSAGES[msg_type]
+    expected = {key: value for key, value in xmltodict.parse(message)['fltdMessage'].items() if key.startswith('@')}
+    actual = {key: value for key, value in extractor.parse(message)['fltdMessage'].items() if key.startswith('@')}
+    assert actual == expected
+
+
+@pytest.mark.parametrize("msg_type", sorted(MESSAGE_PATHS))
+def test_kept_paths_match_the_xmltodict_parse(extractor, msg_type):
+    message = SAMPLE_MESSAGES[msg_type]
+    full = xmltodict.parse(message)['fltdMessage']
+    targeted = extractor.parse(message)['fltdMessage']
+
+    for path in MESSAGE_PATHS[msg_type]:
+        expected, actual = full, targeted
+        for name in path.split('/'):
+            expected = expected.get(name) if isinstance(expected, dict) else None
+            actual = actual.get(name) if isinstance(actual, dict) else None
+        assert actual == expected, path
+
+
+def test_elements_off_the_paths_are_not_built(extractor):
+    flight_plan_information = extractor.parse(SAMPLE_MESSAGES["flightPlanInformation"])['fltdMessage']['flightPlanInformation']
+
+    assert 'speed' not in flight_plan_information
+    assert 'flightPlanRemarks' not in flight_plan_information
+    assert flight_plan_information['flightAircraftSpecs'] == 'C68A'
+
+
+def test_repeated_elements_become_a_list(extractor):
+    message = root("FlightTimes", '''
+  <ncsmFlightTimes>
+    <eta etaType="ESTIMATED" timeValue="2025-03-25T15:10:00Z"/>
+    <eta etaType="ACTUAL" timeValue="2025-03-25T15:20:00Z"/>
+  </ncsmFlightTimes>''')
+
+    assert extractor.parse(message) == xmltodict.parse(message)
+
+
+def test_unknown_message_type_is_parsed_in_full(extractor):
+    message = root("somethingNew", '''
+  <somethingNew>
+    <speed>440</speed>
+  </somethingNew>''')
+
+    assert extractor.parse(message) == xmltodict.parse(message)
+
+
+def test_bytes_and_str_give_the_same_result(extractor):
+    message = SAMPLE_MESSAGES["departureInformation"]
+    assert extractor.parse(message.encode('utf-8')) == extractor.parse(message)
@@ -0,0 +1,93 @@
+import calendar
+import random
+import time
+
+import pytest
+
+from common.flight_plan import FlightPlan, epoch_to_mysql_datetime, zulu_to_epoch
+
+
+def strptime_epoch(zulu_time):
+    try:
+        return calendar.timegm(time.strptime(zulu_time, "%Y-%m-%dT%H:%M:%SZ"))
+    except (TypeError, ValueError):
+        return None
+
+
+def test_zulu_to_epoch_matches_strptime_on_random_times():
+    generator = random.Random(7)
+    for _ in range(20000):
+        epoch = generator.randrange(-2208988800, 7258118400)
+        zulu_time = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(epoch))
+        assert zulu_to_epoch(zulu_time) == strptime_epoch(zulu_time) == epoch, zulu_time
+
+
+@pytest.mark.parametrize("zulu_time", [
+    "1970-01-01T00:00:00Z",
+    "1969-12-31T23:59:59Z",
+    "2000-02-29T12:00:00Z",
+    "2024-02-29T23:59:59Z",
+    "2025-03-25T12:07:00Z",
+    "2100-03-01T00:00:00Z",
+    "0001-01-01T00:00:00Z",
+    "9999-12-31T23:59:59Z",
+])
+def test_zulu_to_epoch_matches_strptime_on_edge_dates(zulu_time):
+    assert zulu_to_epoch(zulu_time) == strptime_epoch(zulu_time)
+
+
+@pytest.mark.parametrize("zulu_time", [
+    None,
+    "",
+    "2025-03-25T12:07:00",
+    "2025-03-25 12:07:00Z",
+    "2025-03-25T12:07:00.000Z",
+    "2025-13-01T00:00:00Z",
+    "2025-00-10T00:00:00Z",
+    "2025-02-29T00:00:00Z",
+    "2100-02-29T00:00:00Z",
+    "2025-04-31T00:00:00Z",
+    "2025-03-00T00:00:00Z",
+    "2025-03-25T24:00:00Z",
+    "2025-03-25T12:60:00Z",
+    "0000-01-01T00:00:00Z",
+    "2025-03-25T12:-4:56Z",
+    "+025-03-25T12:34:56Z",
+    "2_25-03-25T12:34:56Z",
+    "2025-+3-25T12:34:56Z",
+    "2025-03-25T1a:34:56Z",
+])
+def test_zulu_to_epoch_rejects_what_strptime_rejects(zulu_time):
+    assert strptime_epoch(zulu_time) is None
+    assert zulu_to_epoch(zulu_time) is None
+
+
+@pytest.mark.parametrize("zulu_time", [
+    # strptime takes leap seconds and a space padded day, neither is in the FAA's format or a valid MySQL DATETIME
+    "2016-12-31T23:59:60Z",
+    "2025-03- 5T12:34:56Z",
+])
+def test_zulu_to_epoch_is_stricter_than_strptime(zulu_time):
+    assert zulu_to_epoch(zulu_time) is None
+
+
+def test_epoch_to_mysql_datetime():
+    assert epoch_to_mysql_datetime(zulu_to_epoch("2025-03-25T12:07:00Z")) == "2025-03-25 12:07:00"
+    assert epoch_to_mysql_datetime(None) is None
+
+
+def test_merge_only_copies_fields_that_are_set():
+    flight_plan = FlightPlan(flight_ref="R1", acid="N1QS", status="SCHEDULED", etd=100, eta=200)
+    flight_plan.merge(FlightPlan(flight_ref="R1", status="FLYING", eta=250))
+
+    assert flight_plan == FlightPlan(flight_ref="R1", acid="N1QS", status="FLYING", etd=100, eta=250)
+
+
+def test_dict_round_trip_leaves_out_unset_fields():
+    flight_plan = FlightPlan(flight_ref="R1", acid="N1QS", arr_arpt="KTEB", eta=200, fbo_id=3)
+
+    fields = flight_plan.to_dict()
+
+    assert fields == {"flight_ref": "R1", "acid": "N1QS", "arr_arpt": "KTEB", "eta": 200, "fbo_id": 3}
+    assert FlightPlan.from_dict(dict(fields, unknown="ignored")) == flight_plan
+    assert flight_plan.copy() == flight_plan and flight_plan.copy() is not flight_plan
@@ -0,0 +1,207 @@
+import os
+import threading
+
+import orjson
+import pytest
+
+from common.flight_plan import FlightPlan
+from flight_plan_log import FlightPlanLog
+
+
+def flight_plan(number):
+    return FlightPlan(flight_ref=f"R{number:04}", acid="N1QS", status="SCHEDULED", eta=1742904000 + number)
+
+
+def flight_refs(records):
+    return [orjson.loads(record)['flight_ref'] for record in records]
+
+
+@pytest.fixture
+def make_log(tmp_path):
+    logs = []
+
+    def make_log(**settings):
+        settings.setdefault('fsync_policy', 'never')
+        log = FlightPlanLog(str(tmp_path / "log"), **settings)
+        logs.append(log)
+        return log
+    yield make_log
+
+    for log in logs:
+        if not log.file.closed:
+            log.close()
+
+
+def segment_files(log):
+    return sorted(name for name in os.listdir(log.directory) if name.endswith('.log'))
+
+
+def test_offsets_are_byte_positions_of_the_records(make_log):
+    log = make_log()
+    offsets = [log.append(flight_plan(number)) for number in range(3)]
+    record_size = len(orjson.dumps(flight_plan(0).to_dict())) + 1
+
+    assert offsets == [0, record_size, 2 * record_size]
+    assert log.end_offset() == 3 * record_size
+
+    records, next_offset = log.read(offsets[1], 10)
+    assert flight_refs(records) == ["R0001", "R0002"]
+    assert next_offset == log.end_offset()
+    assert FlightPlan.from_dict(orjson.loads(records[0])) == flight_plan(1)
+
+
+def test_read_stops_at_max_records_and_says_where_to_go_on(make_log):
+    log = make_log()
+    offsets = [log.append(flight_plan(number)) for number in range(5)]
+
+    records, next_offset = log.read(0, 2)
+    assert flight_refs(records) == ["R0000", "R0001"]
+    assert next_offset == offsets[2]
+
+    records, next_offset = log.read(next_offset, 10)
+    assert flight_refs(records) == ["R0002", "R0003", "R0004"]
+    assert log.read(next_offset, 10) == ([], next_offset)
+
+
+def test_reads_span_segments(make_log):
+    log = make_log(segment_bytes=200)
+    for number in range(10):
+        log.append(flight_plan(number))
+
+    assert len(segment_files(log)) > 2
+    records, _ = log.read(0, 100)
+    assert flight_refs(records) == [f"R{number:04}" for number in range(10)]
+
+
+def test_committed_offsets_survive_a_restart(make_log):
+    log = make_log()
+    offsets = [log.append(flight_plan(number)) for number in range(3)]
+    log.commit("database-manager", offsets[2])
+    log.close()
+
+    reopened = make_log()
+
+    assert reopened.committed_offset("database-manager") == offsets[2]
+    # A consumer that never committed starts at the beginning
+    assert reopened.committed_offset("other") == 0
+    records, _ = reopened.read(reopened.committed_offset("database-manager"), 10)
+    assert flight_refs(records) == ["R0002"]
+    assert reopened.append(flight_plan(3)) == offsets[2] + (offsets[1] - offsets[0])
+
+
+def test_commit_is_clamped_to_the_log(make_log):
+    log = make_log()
+    log.append(flight_plan(0))
+
+    log.commit("database-manager", 10 ** 9)
+    assert log.committed_offset("database-manager") == log.end_offset()
+    log.commit("database-manager", -5)
+    assert log.committed_offset("database-manager") == 0
+
+
+def test_partly_written_record_is_dropped_on_restart(make_log):
+    log = make_log()
+    log.append(flight_plan(0))
+    end = log.end_offset()
+    log.close()
+    with open(os.path.join(log.directory, segment_files(log)[-1]), 'ab') as file:
+        file.write(b'{"flight_ref":"R00')
+
+    reopened = make_log()
+
+    assert reopened.end_offset() == end
+    assert reopened.append(flight_plan(1)) == end
+    records, _ = reopened.read(0, 10)
+    assert flight_refs(records) == ["R0000", "R0001"]
+
+
+def test_read_waits_for_a_record(make_log):
+    log = make_log()
+
+    assert log.read(0, 10, timeout=0.05) == ([], 0)
+
+    threading.Timer(0.05, log.append, args=(flight_plan(0),)).start()
+    records, _ = log.read(0, 10, timeout=5)
+    assert flight_refs(records) == ["R0000"]
+
+
+def test_retention_deletes_segments_every_consumer_has_read(make_log):
+    log = make_log(segment_bytes=200, retention_seconds=0)
+    offsets = [log.append(flight_plan(number)) for number in range(10)]
+    log.commit("database-manager", offsets[0])
+    log.commit("flight-plan", log.end_offset())
+    segments = len(log.segments)
+
+    # Nothing is deleted before the slowest consumer has read past it
+    log.commit("database-manager", offsets[0])
+    assert len(log.segments) == segments
+
+    log.commit("database-manager", offsets[5])
+
+    assert log.start_offset() <= offsets[5]
+    assert log.start_offset() > 0
+    assert len(segment_files(log)) == len(log.segments) < segments
+    records, _ = log.read(log.committed_offset("database-manager"), 100)
+    assert flight_refs(records) == [f"R{number:04}" for number in range(5, 10)]
+
+
+def test_retention_keeps_recent_segments(make_log):
+    log = make_log(segment_bytes=200, retention_seconds=3600)
+    for number in range(10):
+        log.append(flight_plan(number))
+    segments = len(log.segments)
+
+    log.commit("database-manager", log.end_offset())
+
+    assert len(log.segments) == segments
+
+
+def test_retention_bytes_deletes_unread_segments(make_log, capsys):
+    log = make_log(segment_bytes=200, retention_seconds=3600, retention_bytes=400)
+    for number in range(20):
+        log.append(flight_plan(number))
+
+    assert sum(segment.size for segment in log.segments[1:]) <= 400
+    assert log.stats['segments_deleted'] > 0
+    assert "before every consumer has read it" in capsys.readouterr().out
+    # An offset from before the oldest segment that is left starts from it
+    assert log.committed_offset("database-manager") == log.start_offset()
+    records, _ = log.read(0, 100)
+    assert flight_refs(records)[-1] == "R0019"
+    assert flight_refs(records)[0] != "R0000"
+
+
+def test_active_segment_is_never_deleted(make_log):
+    log = make_log(segment_bytes=10 ** 6, retention_seconds=0, retention_bytes=1)
+    log.append(flight_plan(0))
+    log.commit("database-manager", log.end_offset())
+
+    assert len(log.segments) == 1
+    assert flight_refs(log.read(0, 10)[0]) == ["R0000"]
+
+
+def test_unknown_fsync_policy(tmp_path):
+    with pytest.raises(ValueError):
+        FlightPlanLog(str(tmp_path), fsync_policy="sometimes")
+
+
+def test_only_record_starts_are_valid_offsets(make_log):
+    log = make_log(segment_bytes=1)
+    offsets = [log.append(flight_plan(number)) for number in range(3)]
+
+    # Every record has its own segment, so the later ones start at a segment's base offset
+    assert all(log.is_record_start(offset) for offset in offsets)
+    assert log.is_record_start(log.end_offset())
+    assert not log.is_record_start(offsets[1] + 1)
+    assert not log.is_record_start(offsets[2] - 1)
+    assert not log.is_record_start(log.end_offset() + 1)
+    assert not log.is_record_start(-1)
+
+
+def test_offset_in_the_middle_of_a_segment_is_not_a_record_start(make_log):
+    log = make_log()
+    offsets = [log.append(flight_plan(number)) for number in range(3)]
+
+    assert [log.is_record_start(offset) for offset in range(log.end_offset() + 1)].count(True) == len(offsets) + 1
+    assert log.is_record_start(offsets[2])
+    assert not log.is_record_start(offsets[2] - 1)
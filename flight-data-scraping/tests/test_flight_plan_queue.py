@@ -0,0 +1,147 @@
+import threading
+import time
+
+import pytest
+
+from common.flight_plan import FlightPlan
+from flight_plan_queue import FlightPlanQueue
+
+
+def test_updates_to_one_flight_are_merged_in_place():
+    queue = FlightPlanQueue()
+    queue.put(FlightPlan(flight_ref="R1", acid="N1QS", status="SCHEDULED", etd=100, eta=200, arr_arpt="KTEB"))
+    queue.put(FlightPlan(flight_ref="R2", acid="N2QS", status="SCHEDULED"))
+    queue.put(FlightPlan(flight_ref="R1", acid="N1QS", eta=250))
+
+    assert queue.take(10) == [
+        FlightPlan(flight_ref="R1", acid="N1QS", status="SCHEDULED", etd=100, eta=250, arr_arpt="KTEB"),
+        FlightPlan(flight_ref="R2", acid="N2QS", status="SCHEDULED"),
+    ]
+    assert queue.stats()['coalesced'] == 1
+
+
+def test_cancellation_replaces_the_updates_before_it():
+    queue = FlightPlanQueue()
+    queue.put(FlightPlan(flight_ref="R1", acid="N1QS", status="SCHEDULED", eta=200))
+    queue.put(FlightPlan(flight_ref="R1", status="CANCELED"))
+    queue.put(FlightPlan(flight_ref="R1", acid="N1QS", status="SCHEDULED", etd=300))
+
+    assert queue.take(10) == [
+        FlightPlan(flight_ref="R1", status="CANCELED"),
+        FlightPlan(flight_ref="R1", acid="N1QS", status="SCHEDULED", etd=300),
+    ]
+
+
+def test_flying_before_a_cancellation_still_points_the_plane_at_the_flight():
+    queue = FlightPlanQueue()
+    queue.put(FlightPlan(flight_ref="R1", acid="N1QS", status="FLYING", model="C68A"))
+    queue.put(FlightPlan(flight_ref="R1", status="CANCELED"))
+
+    assert queue.take(10) == [
+        FlightPlan(flight_ref="R1", acid="N1QS", status="FLYING", model="C68A"),
+        FlightPlan(flight_ref="R1", status="CANCELED"),
+    ]
+
+
+def test_landing_after_flying_sends_the_flying_state_first():
+    queue = FlightPlanQueue()
+    queue.put(FlightPlan(flight_ref="R1", acid="N1QS", status="FLYING", model="C68A", eta=200))
+    queue.put(FlightPlan(flight_ref="R1", acid="N1QS", status="ARRIVED", eta=210))
+
+    assert queue.take(10) == [
+        FlightPlan(flight_ref="R1", acid="N1QS", status="FLYING", model="C68A"),
+        FlightPlan(flight_ref="R1", acid="N1QS", status="ARRIVED", model="C68A", eta=210),
+    ]
+
+
+def test_flying_keeps_the_model_of_an_earlier_flying_update():
+    queue = FlightPlanQueue()
+    queue.put(FlightPlan(flight_ref="R1", acid="N1QS", status="FLYING", model="C68A"))
+    queue.put(FlightPlan(flight_ref="R1", acid="N1QS", status="FLYING", eta=300))
+
+    assert queue.take(10) == [FlightPlan(flight_ref="R1", acid="N1QS", status="FLYING", model="C68A", eta=300)]
+
+
+def test_flight_plans_without_a_flight_ref_or_acid_are_not_merged():
+    queue = FlightPlanQueue()
+    queue.put(FlightPlan(acid="N1QS", status="SCHEDULED"))
+    queue.put(FlightPlan(acid="N1QS", status="FLYING"))
+    queue.put(FlightPlan(flight_ref="R1", status="SCHEDULED"))
+    queue.put(FlightPlan(flight_ref="R1", status="FLYING"))
+
+    assert len(queue.take(10)) == 4
+    assert queue.stats()['coalesced'] == 0
+
+
+def test_a_merged_flight_keeps_its_place_in_line():
+    queue = FlightPlanQueue()
+    for flight_ref in ("R1", "R2", "R3"):
+        queue.put(FlightPlan(flight_ref=flight_ref, acid="N1QS", status="SCHEDULED"))
+    queue.put(FlightPlan(flight_ref="R1", acid="N1QS", eta=100))
+
+    assert [flight_plan.flight_ref for flight_plan in queue.take(10)] == ["R1", "R2", "R3"]
+
+
+def test_take_holds_back_what_did_not_fit():
+    queue = FlightPlanQueue()
+    queue.put(FlightPlan(flight_ref="R1", acid="N1QS", status="FLYING"))
+    queue.put(FlightPlan(flight_ref="R1", status="CANCELED"))
+    queue.put(FlightPlan(flight_ref="R2", acid="N2QS", status="SCHEDULED"))
+
+    first = queue.take(1)
+    assert queue.depth() == 2
+    rest = queue.take(10)
+
+    assert [(flight_plan.flight_ref, flight_plan.status) for flight_plan in first + rest] == [("R1", "FLYING"), ("R1", "CANCELED"), ("R2", "SCHEDULED")]
+    assert queue.depth() == 0
+
+
+def test_drop_oldest_drops_the_flight_at_the_front():
+    queue = FlightPlanQueue(max_size=2, overflow_policy="drop_oldest")
+    for flight_ref in ("R1", "R2", "R3"):
+        assert queue.put(FlightPlan(flight_ref=flight_ref, acid="N1QS", status="SCHEDULED"))
+    # An update to a queued flight never overflows
+    assert queue.put(FlightPlan(flight_ref="R3", acid="N1QS", eta=100))
+
+    assert [flight_plan.flight_ref for flight_plan in queue.take(10)] == ["R2", "R3"]
+    assert queue.stats()['dropped'] == 1
+
+
+def test_reject_new_keeps_the_queued_flights():
+    queue = FlightPlanQueue(max_size=2, overflow_policy="reject_new")
+    results = [queue.put(FlightPlan(flight_ref=flight_ref, acid="N1QS", status="SCHEDULED")) for flight_ref in ("R1", "R2", "R3")]
+
+    assert results == [True, True, False]
+    assert [flight_plan.flight_ref for flight_plan in queue.take(10)] == ["R1", "R2"]
+    assert queue.stats()['rejected'] == 1
+
+
+def test_block_waits_for_space():
+    queue = FlightPlanQueue(max_size=1, overflow_policy="block")
+    queue.put(FlightPlan(flight_ref="R1", acid="N1QS", status="SCHEDULED"))
+
+    thread = threading.Thread(target=queue.put, args=(FlightPlan(flight_ref="R2", acid="N2QS", status="SCHEDULED"),))
+    thread.start()
+    thread.join(0.1)
+    assert thread.is_alive()
+
+    assert [flight_plan.flight_ref for flight_plan in queue.take(1)] == ["R1"]
+    thread.join(1)
+    assert not thread.is_alive()
+    assert [flight_plan.flight_ref for flight_plan in queue.take(1)] == ["R2"]
+
+
+def test_take_waits_up_to_the_timeout_for_the_first_flight_plan():
+    queue = FlightPlanQueue()
+
+    start = time.monotonic()
+    assert queue.take(10, timeout=0.05) == []
+    assert time.monotonic() - start >= 0.05
+
+    threading.Timer(0.05, queue.put, args=(FlightPlan(flight_ref="R1", acid="N1QS", status="SCHEDULED"),)).start()
+    assert [flight_plan.flight_ref for flight_plan in queue.take(10, timeout=5)] == ["R1"]
+
+
+def test_unknown_overflow_policy():
+    with pytest.raises(ValueError):
+        FlightPlanQueue(overflow_policy="drop_newest")
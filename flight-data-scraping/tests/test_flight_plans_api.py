@@ -0,0 +1,58 @@
+import orjson
+import pytest
+
+import flight_plans_api
+from common.flight_plan import FlightPlan
+from flight_plan_log import FlightPlanLog
+
+
+@pytest.fixture
+def log_client(monkeypatch, tmp_path):
+    """
+    The API's test client, with flight plans kept in a log holding three flight plans.
+    """
+    log = FlightPlanLog(str(tmp_path / "log"), fsync_policy='never')
+    for number in range(3):
+        log.append(FlightPlan(flight_ref=f"R{number}", acid="N1QS", status="SCHEDULED"))
+    monkeypatch.setattr(flight_plans_api, 'flight_plan_log', log)
+    yield flight_plans_api.app.test_client(), log
+    log.close()
+
+
+def flight_refs(response):
+    return [flight_plan['flight_ref'] for flight_plan in orjson.loads(response.data)['flight_plans']]
+
+
+def test_batch_reads_from_a_record_offset(log_client):
+    client, log = log_client
+    first = client.get('/flight-plans', query_string={'max': 1})
+    offset = orjson.loads(first.data)['next_offset']
+
+    response = client.get('/flight-plans', query_string={'offset': offset})
+
+    assert flight_refs(first) == ['R0']
+    assert flight_refs(response) == ['R1', 'R2']
+    assert orjson.loads(response.data)['next_offset'] == log.end_offset()
+
+
+@pytest.mark.parametrize('shift', [1, -1])
+def test_offset_in_the_middle_of_a_record_is_rejected(log_client, shift):
+    client, log = log_client
+    _, offset = log.read(0, 1)
+
+    response = client.get('/flight-plans', query_string={'offset': offset + shift})
+
+    assert response.status_code == 400
+    assert b'not the start of a flight plan' in response.data
+
+
+def test_commit_of_an_offset_in_the_middle_of_a_record_is_rejected(log_client):
+    client, log = log_client
+    _, offset = log.read(0, 1)
+
+    assert client.post('/flight-plans/commit', json={'offset': offset + 1}).status_code == 400
+    assert client.post('/flight-plans/commit', json={'offset': log.end_offset() + 1}).status_code == 400
+    assert log.committed_offset(flight_plans_api.DEFAULT_CONSUMER) == 0
+
+    assert client.post('/flight-plans/commit', json={'offset': offset}).status_code == 200
+    assert flight_refs(client.get('/flight-plans')) == ['R1', 'R2']
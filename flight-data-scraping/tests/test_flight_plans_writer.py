@@ -0,0 +1,189 @@
+import json
+
+import mysql.connector
+import pytest
+
+from common.db import DatabaseUnavailable
+from common.flight_plan import FlightPlan
+from fleet_cache import FLEET_SQL
+from flight_plans_writer import Flight_plans_writer
+
+
+@pytest.fixture
+def make_writer(fake_database, tmp_path):
+    def make_writer(fleet=(), **settings):
+        database = fake_database({FLEET_SQL: list(fleet)})
+        settings.setdefault('retry_backoff', 0)
+        settings.setdefault('dead_letter_file', str(tmp_path / 'dead_letter.ndjson'))
+        return Flight_plans_writer(database, **settings)
+    return make_writer
+
+
+def written(writer, statement):
+    """
+    The parameters of every statement starting with these words, in the order they ran.
+    """
+    return [params for sql, params in writer.database.queries if sql.startswith(statement)]
+
+
+def deleted(writer):
+    return [flight_ref for params in written(writer, "DELETE FROM flight_plans") for flight_ref in params]
+
+
+def upserted(writer):
+    # Every upsert row starts with (flightRef, acid, ...), so the flight refs are found by their place in the statement
+    refs = []
+    for sql, params in writer.database.queries:
+        if sql.startswith("INSERT INTO flight_plans"):
+            row_size = len(params) // sql.count("(%s")
+            refs.extend(params[i] for i in range(0, len(params), row_size))
+    return refs
+
+
+def fleet_rows(writer):
+    rows = []
+    for sql, params in writer.database.queries:
+        if sql.startswith("INSERT INTO netjets_fleet"):
+            row_size = 3 if "plane_type" in sql else 2
+            for i in range(0, len(params), row_size):
+                row = params[i:i + row_size]
+                rows.append((row[0], row[-1], row[1] if row_size == 3 else None))
+    return rows
+
+
+def plan(flight_ref, status, acid='N1QS', model=None, eta=None):
+    return FlightPlan(flight_ref=flight_ref, acid=acid, status=status, model=model, eta=eta)
+
+
+def deadlock():
+    return mysql.connector.errors.DatabaseError(msg="Deadlock found when trying to get lock", errno=1213)
+
+
+def test_upsert_then_delete_only_deletes(make_writer):
+    writer = make_writer()
+    writer.add(plan('R1', 'SCHEDULED'))
+    writer.add(plan('R1', 'CANCELED'))
+
+    assert writer.flush() is True
+
+    assert deleted(writer) == ['R1']
+    assert upserted(writer) == []
+
+
+def test_delete_then_upsert_writes_the_row_again_after_the_delete(make_writer):
+    writer = make_writer()
+    writer.add(plan('R1', 'CANCELED'))
+    writer.add(plan('R1', 'SCHEDULED'))
+
+    writer.flush()
+
+    statements = [sql.split(" ")[0] for sql, _ in writer.database.queries]
+    assert deleted(writer) == ['R1']
+    assert upserted(writer) == ['R1']
+    assert statements.index("DELETE") < statements.index("INSERT")
+
+
+def test_flying_plane_deletes_the_flight_plan_it_pointed_to(make_writer):
+    writer = make_writer(fleet=[('N1QS', 'R0', 'C68A')])
+    # The update of R0 is replaced by the delete of R0 once the plane takes off on R1
+    writer.add(plan('R0', 'ARRIVED'))
+    writer.add(plan('R1', 'FLYING'))
+
+    writer.flush()
+
+    assert deleted(writer) == ['R0']
+    assert upserted(writer) == ['R1']
+    assert fleet_rows(writer) == [('N1QS', 'R1', None)]
+    assert writer.fleet_cache.flight_ref('N1QS') == 'R1'
+
+
+def test_fleet_op_deletes_a_flight_plan_upserted_earlier_in_the_batch(make_writer):
+    writer = make_writer()
+    writer.add(plan('R1', 'FLYING', model='C68A'))
+    writer.add(plan('R2', 'FLYING'))
+
+    writer.flush()
+
+    # The plane pointed to R1 for part of the batch, so R1 is deleted and the model it brought carries over to R2
+    assert deleted(writer) == ['R1']
+    assert upserted(writer) == ['R2']
+    assert fleet_rows(writer) == [('N1QS', 'R2', 'C68A')]
+
+
+def test_unchanged_fleet_row_is_skipped(make_writer):
+    writer = make_writer(fleet=[('N1QS', 'R1', 'C68A')])
+    writer.add(plan('R1', 'FLYING', model='C68A'))
+
+    writer.flush()
+
+    assert fleet_rows(writer) == []
+    assert writer.stats['fleet_rows_unchanged'] == 1
+
+
+def test_upserts_are_grouped_by_the_columns_they_write(make_writer):
+    writer = make_writer()
+    writer.add(plan('R1', 'SCHEDULED'))
+    writer.add(plan('R2', 'SCHEDULED'))
+    writer.add(plan('R3', 'SCHEDULED', eta=1700000000))
+
+    writer.flush()
+
+    assert len(written(writer, "INSERT INTO flight_plans")) == 2
+    assert sorted(upserted(writer)) == ['R1', 'R2', 'R3']
+
+
+def test_deadlock_runs_the_whole_batch_again(make_writer):
+    writer = make_writer()
+    writer.database.fail(lambda sql, params: sql.startswith("INSERT INTO flight_plans"), deadlock(), times=1)
+    writer.add(plan('R1', 'CANCELED'))
+    writer.add(plan('R2', 'SCHEDULED'))
+
+    assert writer.flush() is True
+
+    assert writer.stats['retries'] == 1
+    assert writer.stats['split_flushes'] == 0
+    # Both statements ran in both attempts, and only the second was committed
+    assert deleted(writer) == ['R1', 'R1']
+    assert upserted(writer) == ['R2', 'R2']
+    assert writer.database.commits == 1
+    assert writer.pending == []
+
+
+def test_statement_error_sets_aside_only_the_operation_it_fails_on(make_writer):
+    writer = make_writer()
+    error = mysql.connector.errors.DataError(msg="Data too long for column 'acid'", errno=1406)
+    writer.database.fail(lambda sql, params: sql.startswith("INSERT INTO flight_plans") and 'R2' in params, error)
+    for flight_ref in ('R1', 'R2', 'R3'):
+        writer.add(plan(flight_ref, 'SCHEDULED'))
+
+    assert writer.flush() is True
+
+    assert writer.stats['split_flushes'] == 1
+    assert writer.stats['dropped_operations'] == 1
+    assert writer.written_flight_plans.changes(plan('R2', 'SCHEDULED'))[0] is not None
+    assert writer.written_flight_plans.changes(plan('R3', 'SCHEDULED'))[0] is None
+    with open(writer.dead_letter_file) as f:
+        records = [json.loads(line) for line in f]
+    assert [(record['operation'], record['flight_plan']['flight_ref']) for record in records] == [('upsert', 'R2')]
+    assert 'Data too long' in records[0]['error']
+
+
+def test_connection_error_leaves_the_operations_pending(make_writer):
+    writer = make_writer()
+    writer.database.unavailable = DatabaseUnavailable("Database is unreachable")
+    writer.add(plan('R1', 'FLYING', model='C68A'))
+    writer.add(plan('R2', 'CANCELED'))
+    operations = list(writer.pending)
+
+    assert writer.flush() is False
+
+    assert writer.pending == operations
+    assert writer.stats['failed_flushes'] == 1
+    assert writer.stats['dropped_operations'] == 0
+
+    # Once the database is back, the same operations are written
+    writer.database.unavailable = None
+    assert writer.flush() is True
+    assert writer.pending == []
+    assert upserted(writer) == ['R1']
+    assert deleted(writer) == ['R2']
@@ -0,0 +1,75 @@
+import pytest
+import xmltodict
+
+from message_header_filter import MessageHeaderFilter
+from pipeline_metrics import MESSAGES
+from sample_messages import SAMPLE_MESSAGES
+
+
+def message(msg_type):
+    return f'<fltdMessage msgType="{msg_type}" acid="N1QS" flightRef="1"><body/></fltdMessage>'
+
+
+def test_unknown_message_types_are_counted_as_other():
+    messageHeaderFilter = MessageHeaderFilter()
+    other_before = MESSAGES.labels('other', 'dropped').value
+
+    for msg_type in ('someNewType', 'anotherNewType', 'boundaryCrossingUpdate'):
+        assert messageHeaderFilter.accept(message(msg_type)) is None
+    assert messageHeaderFilter.accept('no root tag') is None
+
+    assert messageHeaderFilter.stats()['dropped'] == {'other': 3, 'boundaryCrossingUpdate': 1}
+    assert MESSAGES.labels('other', 'dropped').value - other_before == 3
+    assert ('someNewType', 'dropped') not in MESSAGES.children
+
+
+def test_configured_message_types_keep_their_own_label():
+    messageHeaderFilter = MessageHeaderFilter(accepted_msg_types=('customType',))
+
+    assert messageHeaderFilter.accept(message('customType')) is not None
+    messageHeaderFilter.accept(message('FlightTimes'))
+
+    assert messageHeaderFilter.stats() == {'accepted': {'customType': 1}, 'dropped': {'FlightTimes': 1}}
+
+
+@pytest.mark.parametrize('message, header', [
+    # Any attribute order
+    ('<fltdMessage flightRef="1" acid="N1QS" msgType="FlightTimes">', {'msgType': 'FlightTimes', 'acid': 'N1QS', 'flightRef': '1'}),
+    # Single or double quotes, and spaces around the equals sign
+    ("<fltdMessage msgType='FlightTimes' acid = 'N1QS' flightRef=\"1\">", {'msgType': 'FlightTimes', 'acid': 'N1QS', 'flightRef': '1'}),
+    # A quote of the other kind inside a value
+    ('<fltdMessage msgType="FlightTimes" acid="N\'1" flightRef=\'"1"\'>', {'msgType': 'FlightTimes', 'acid': "N'1", 'flightRef': '"1"'}),
+    # Missing attributes are None
+    ('<fltdMessage acid="N1QS"><flightRef>1</flightRef></fltdMessage>', {'msgType': None, 'acid': 'N1QS', 'flightRef': None}),
+    # The declaration and comments before the root tag are skipped, and only the root tag is read
+    ('<?xml version="1.0"?>\n<!-- msgType="FlightSectors" --><fltdMessage msgType="FlightTimes"><body acid="N2QS"/></fltdMessage>',
+     {'msgType': 'FlightTimes', 'acid': None, 'flightRef': None}),
+    # Attributes whose names only end like the header's don't count
+    ('<fltdMessage xmlns:fdm="urn:fdm" fdm:acid="N1QS" origMsgType="FlightTimes">', {'msgType': None, 'acid': None, 'flightRef': None}),
+    ('<fltdMessage msgType="FlightTimes"', None),
+    ('', None),
+])
+def test_read_header(message, header):
+    assert MessageHeaderFilter.read_header(message) == header
+
+
+@pytest.mark.parametrize('msg_type', sorted(SAMPLE_MESSAGES))
+def test_read_header_matches_the_parsed_sample_messages(msg_type):
+    message = SAMPLE_MESSAGES[msg_type]
+    root = xmltodict.parse(message)['fltdMessage']
+
+    assert MessageHeaderFilter.read_header(message) == {name: root.get('@' + name) for name in ('msgType', 'acid', 'flightRef')}
+
+
+def test_accepted_and_dropped_messages_are_counted_per_message_type():
+    messageHeaderFilter = MessageHeaderFilter()
+
+    for msg_type in ('FlightTimes', 'FlightTimes', 'arrivalInformation', 'FlightSectors'):
+        messageHeaderFilter.accept(message(msg_type))
+    # Without a msgType the message can't be processed
+    assert messageHeaderFilter.accept('<fltdMessage acid="N1QS" flightRef="1"/>') is None
+
+    assert messageHeaderFilter.stats() == {
+        'accepted': {'FlightTimes': 2, 'arrivalInformation': 1},
+        'dropped': {'FlightSectors': 1, 'other': 1},
+    }
@@ -0,0 +1,147 @@
+import math
+import re
+import urllib.error
+import urllib.request
+
+import pytest
+
+from common.metrics import CONTENT_TYPE, Registry, start_metrics_server
+
+# One sample line of the text exposition format (version 0.0.4): name, optional {labels}, value
+SAMPLE_PATTERN = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+# One label pair, the value with \\, \" and \n escaped
+LABEL_PATTERN = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\\n]|\\[\\"n])*)"(,|$)')
+VALUE_PATTERN = re.compile(r'^(NaN|[+-]Inf|[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?)$')
+
+
+def unescape(value):
+    return re.sub(r'\\([\\"n])', lambda match: "\n" if match.group(1) == "n" else match.group(1), value)
+
+
+def parse(text):
+    """
+    Parses an exposition by the rules of the text format, failing on any line that breaks them.
+    Returns ({name: (help, type)}, [(sample name, {label: value}, value)]).
+    """
+    assert text.endswith("\n")
+    families = dict()
+    samples = []
+    for line in text[:-1].split("\n"):
+        if line.startswith("# HELP "):
+            name, documentation = line[len("# HELP "):].split(" ", 1)
+            families[name] = [re.sub(r'\\([\\n])', lambda match: "\n" if match.group(1) == "n" else "\\", documentation), None]
+        elif line.startswith("# TYPE "):
+            name, kind = line[len("# TYPE "):].split(" ")
+            assert kind in ("counter", "gauge", "histogram", "summary", "untyped")
+            assert families[name][1] is None, "TYPE must come once, before the samples"
+            families[name][1] = kind
+        else:
+            match = SAMPLE_PATTERN.match(line)
+            assert match, line
+            name, labels, value = match.groups()
+            parsed_labels = dict()
+            if labels:
+                position = 0
+                while position < len(labels):
+                    label = LABEL_PATTERN.match(labels, position)
+                    assert label, line
+                    assert label.group(1) not in parsed_labels
+                    parsed_labels[label.group(1)] = unescape(label.group(2))
+                    position = label.end()
+            assert VALUE_PATTERN.match(value), line
+            family = re.sub(r'_(bucket|sum|count)$', '', name) if name not in families else name
+            assert families[family][1] is not None, "samples come after their family's TYPE"
+            samples.append((name, parsed_labels, float(value)))
+    return {name: tuple(family) for name, family in families.items()}, samples
+
+
+def values(samples, name):
+    return {tuple(sorted(labels.items())): value for sample_name, labels, value in samples if sample_name == name}
+
+
+def test_counters_and_gauges_follow_the_text_format():
+    registry = Registry()
+    requests = registry.counter('requests_total', 'Requests\\handled\nby path', ('path',))
+    temperature = registry.gauge('temperature', 'Current temperature')
+    broken = registry.gauge('broken', 'A gauge whose function fails')
+
+    requests.labels('/a').inc()
+    requests.labels(path='/a').inc(2)
+    requests.labels('say "hi"\\\n').inc()
+    temperature.set(-1.5)
+    broken.set_function(lambda: 1 / 0)
+
+    families, samples = parse(registry.render().decode('utf-8'))
+
+    assert families['requests_total'] == ('Requests\\handled\nby path', 'counter')
+    assert families['temperature'][1] == 'gauge'
+    assert values(samples, 'requests_total') == {(('path', '/a'),): 3, (('path', 'say "hi"\\\n'),): 1}
+    assert values(samples, 'temperature') == {(): -1.5}
+    assert math.isnan(values(samples, 'broken')[()])
+
+
+def test_metrics_without_labels_are_exposed_before_they_are_used():
+    registry = Registry()
+    registry.counter('errors_total', 'Errors')
+    registry.histogram('latency_seconds', 'Latency', buckets=(1,))
+    registry.counter('by_kind_total', 'Errors by kind', ('kind',))
+
+    _, samples = parse(registry.render().decode('utf-8'))
+
+    assert values(samples, 'errors_total') == {(): 0}
+    assert values(samples, 'latency_seconds_count') == {(): 0}
+    assert values(samples, 'by_kind_total') == {}
+
+
+def test_histogram_buckets_are_cumulative_and_end_with_inf():
+    registry = Registry()
+    latency = registry.histogram('latency_seconds', 'Latency', ('stage',), buckets=(0.5, 0.1, 1))
+    for value in (0.05, 0.1, 0.7, 3):
+        latency.labels('parse').observe(value)
+    with latency.labels('publish').time():
+        pass
+
+    _, samples = parse(registry.render().decode('utf-8'))
+
+    buckets = [(labels['le'], value) for name, labels, value in samples if name == 'latency_seconds_bucket' and labels['stage'] == 'parse']
+    # The bounds are sorted, and a value on a bound counts in that bucket
+    assert buckets == [('0.1', 2), ('0.5', 2), ('1.0', 3), ('+Inf', 4)]
+    assert values(samples, 'latency_seconds_count')[(('stage', 'parse'),)] == 4
+    assert values(samples, 'latency_seconds_sum')[(('stage', 'parse'),)] == pytest.approx(3.85)
+    assert values(samples, 'latency_seconds_count')[(('stage', 'publish'),)] == 1
+
+
+def test_registering_a_name_again_returns_the_same_metric():
+    registry = Registry()
+    first = registry.counter('errors_total', 'Errors', ('component',))
+
+    assert registry.counter('errors_total', 'Errors', ('component',)) is first
+
+
+def test_labels_must_match_the_label_names():
+    registry = Registry()
+    errors = registry.counter('errors_total', 'Errors', ('component',))
+
+    with pytest.raises(ValueError):
+        errors.labels('a', 'b')
+    with pytest.raises(ValueError):
+        errors.inc()
+
+
+def test_metrics_server_serves_the_registry():
+    registry = Registry()
+    registry.counter('errors_total', 'Errors').inc(4)
+    server = start_metrics_server(0, registry)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(url + "/metrics") as response:
+            assert response.headers['Content-Type'] == CONTENT_TYPE
+            _, samples = parse(response.read().decode('utf-8'))
+        assert values(samples, 'errors_total') == {(): 4}
+
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url + "/other")
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,26 @@
+from message_header_filter import MessageHeaderFilter
+from parsing_workers import ParsingWorkers
+from pipeline_metrics import PARSE_ERRORS, PARSE_SECONDS
+from sample_messages import SAMPLE_MESSAGES
+
+# Gets past the header filter, but its body can't be parsed
+BROKEN_MESSAGE = '<fltdMessage msgType="trackInformation" flightRef="95012345" acid="N123QS"><trackInformation><qualifiedAircraftId>'
+
+
+def test_workers_parse_errors_are_counted_in_the_main_process():
+    messages = [SAMPLE_MESSAGES['trackInformation'], BROKEN_MESSAGE, SAMPLE_MESSAGES['departureInformation'], None]
+    published = []
+    errors_before = PARSE_ERRORS.unlabelled().value
+    parsed_before = sum(PARSE_SECONDS.unlabelled().counts)
+
+    parsingWorkers = ParsingWorkers(1, batch_size=10)
+    try:
+        fetched = iter(messages)
+        while parsingWorkers.pump(lambda: next(fetched, None), MessageHeaderFilter(), published.append, idle_wait=5) or parsingWorkers.in_flight:
+            pass
+    finally:
+        parsingWorkers.close()
+
+    assert [flight_plan.flight_ref for flight_plan in published] == ['95012345', '95012345']
+    assert PARSE_ERRORS.unlabelled().value - errors_before == 1
+    assert sum(PARSE_SECONDS.unlabelled().counts) - parsed_before == 2
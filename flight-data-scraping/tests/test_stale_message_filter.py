@@ -0,0 +1,192 @@
+import random
+
+import pytest
+
+from common.flight_plan import FlightPlan
+from stale_message_filter import StaleMessageFilter
+
+ROW_FIELDS = ('dep_arpt', 'arr_arpt', 'etd', 'eta', 'status')
+
+
+class Database:
+    """
+    What the database manager makes of the published flight plans: flight_plans rows, and netjets_fleet as acid -> (flight ref, model).
+    """
+    def __init__(self):
+        self.flight_plans = dict()
+        self.fleet = dict()
+
+    def write(self, flight_plan):
+        if flight_plan.status == "CANCELED":
+            self.flight_plans.pop(flight_plan.flight_ref, None)
+            return
+        if flight_plan.flight_ref is None or flight_plan.acid is None:
+            return
+
+        row = self.flight_plans.setdefault(flight_plan.flight_ref, dict())
+        row['acid'] = flight_plan.acid
+        for field in ROW_FIELDS:
+            if getattr(flight_plan, field) is not None:
+                row[field] = getattr(flight_plan, field)
+
+        if flight_plan.status == "FLYING":
+            # The flight plan the plane pointed to before is deleted
+            previous = self.fleet.get(flight_plan.acid)
+            if previous is not None and previous[0] != flight_plan.flight_ref:
+                self.flight_plans.pop(previous[0], None)
+            model = flight_plan.model if flight_plan.model is not None else (previous[1] if previous else None)
+            self.fleet[flight_plan.acid] = (flight_plan.flight_ref, model)
+
+    def state(self):
+        return self.flight_plans, self.fleet
+
+
+def written(messages):
+    stale_message_filter = StaleMessageFilter()
+    database = Database()
+    for message in messages:
+        for flight_plan in stale_message_filter.filter(message.copy()):
+            database.write(flight_plan)
+    return database.state()
+
+
+def message(flight_ref, source_time, status=None, acid="N1QS", **fields):
+    return FlightPlan(flight_ref=flight_ref, acid=acid, status=status, source_time=source_time, **fields)
+
+
+@pytest.fixture
+def stale_message_filter():
+    return StaleMessageFilter()
+
+
+def test_messages_in_order_pass_through(stale_message_filter):
+    messages = [message("R1", 10, "SCHEDULED", eta=100), message("R1", 20, "FLYING", model="C68A"), message("R1", 30, "ARRIVED")]
+
+    assert [stale_message_filter.filter(flight_plan) for flight_plan in messages] == [[flight_plan] for flight_plan in messages]
+    assert stale_message_filter.stats()['passed'] == 3
+
+
+def test_older_fields_are_trimmed(stale_message_filter):
+    stale_message_filter.filter(message("R1", 20, "SCHEDULED", eta=200))
+
+    published = stale_message_filter.filter(message("R1", 10, "SCHEDULED", eta=100, arr_arpt="KTEB"))
+
+    assert published == [message("R1", 10, arr_arpt="KTEB")]
+    assert stale_message_filter.filter(message("R1", 5, "SCHEDULED", eta=50)) == []
+    assert stale_message_filter.stats()['trimmed'] == 1
+    assert stale_message_filter.stats()['dropped'] == 1
+
+
+def test_messages_older_than_a_cancellation_are_dropped(stale_message_filter):
+    stale_message_filter.filter(message("R1", 10, "SCHEDULED"))
+    stale_message_filter.filter(message("R1", 20, "CANCELED"))
+
+    assert stale_message_filter.filter(message("R1", 15, "SCHEDULED", eta=150)) == []
+    assert stale_message_filter.filter(message("R1", 25, "SCHEDULED", eta=250)) == [message("R1", 25, "SCHEDULED", eta=250)]
+
+
+def test_late_cancellation_deletes_the_flight_and_publishes_what_came_after_it(stale_message_filter):
+    stale_message_filter.filter(message("R1", 10, "SCHEDULED", eta=100, arr_arpt="KTEB"))
+    stale_message_filter.filter(message("R1", 30, "SCHEDULED", eta=300))
+
+    published = stale_message_filter.filter(message("R1", 20, "CANCELED"))
+
+    assert published == [message("R1", 20, "CANCELED"), FlightPlan(flight_ref="R1", acid="N1QS", status="SCHEDULED", eta=300)]
+    assert stale_message_filter.stats()['late_cancellations'] == 1
+
+
+def test_late_flying_message_of_a_superseded_flight_is_dropped_and_the_flight_deleted(stale_message_filter):
+    stale_message_filter.filter(message("R1", 10, "SCHEDULED", eta=100))
+    stale_message_filter.filter(message("R2", 30, "FLYING", eta=300))
+
+    published = stale_message_filter.filter(message("R1", 20, "FLYING", eta=200))
+
+    # In order, the plane would have pointed at R1 until R2 took off, and the database manager deletes R1 then
+    assert published == [FlightPlan(flight_ref="R1", acid="N1QS", status="CANCELED")]
+    assert stale_message_filter.stats()['superseded'] == 1
+
+
+def test_late_flying_message_still_points_the_plane_at_the_flight(stale_message_filter):
+    stale_message_filter.filter(message("R1", 10, "SCHEDULED"))
+    stale_message_filter.filter(message("R1", 30, "ARRIVED"))
+
+    published = stale_message_filter.filter(message("R1", 20, "FLYING", model="C68A"))
+
+    assert published == [message("R1", 20, "FLYING", model="C68A"), FlightPlan(flight_ref="R1", acid="N1QS", status="ARRIVED")]
+
+
+def test_late_flying_message_points_the_plane_at_a_cancelled_flight_without_bringing_the_row_back(stale_message_filter):
+    stale_message_filter.filter(message("R1", 10, "SCHEDULED"))
+    stale_message_filter.filter(message("R1", 30, "CANCELED"))
+
+    published = stale_message_filter.filter(message("R1", 20, "FLYING"))
+
+    assert published == [message("R1", 20, "FLYING"), FlightPlan(flight_ref="R1", acid="N1QS", status="CANCELED")]
+
+
+def test_model_of_a_superseded_flight_goes_to_the_plane():
+    in_order = [message("R1", 10, "SCHEDULED"), message("R1", 20, "FLYING", model="E55P"), message("R2", 30, "FLYING")]
+
+    flight_plans, fleet = written([in_order[0], in_order[2], in_order[1]])
+
+    assert flight_plans == {'R2': {'acid': 'N1QS', 'status': 'FLYING'}}
+    assert fleet == {'N1QS': ('R2', 'E55P')}
+    assert written(in_order) == (flight_plans, fleet)
+
+
+def test_messages_without_a_source_time_pass_through(stale_message_filter):
+    flight_plan = FlightPlan(flight_ref="R1", acid="N1QS", status="SCHEDULED")
+
+    assert stale_message_filter.filter(flight_plan) == [flight_plan]
+
+
+def test_finished_flights_are_forgotten_after_the_ttl():
+    stale_message_filter = StaleMessageFilter(finished_ttl=100)
+    stale_message_filter.filter(message("R1", 10, "ARRIVED"))
+    stale_message_filter.filter(message("R2", 50, "SCHEDULED"))
+    assert "R1" in stale_message_filter.flights
+
+    stale_message_filter.filter(message("R2", 110, "SCHEDULED"))
+
+    assert "R1" not in stale_message_filter.flights
+    assert stale_message_filter.stats()['tracked_flights'] == 1
+
+
+def test_least_recently_updated_flights_are_forgotten_first():
+    stale_message_filter = StaleMessageFilter(max_flights=2)
+    for number, flight_ref in enumerate(("R1", "R2", "R1", "R3")):
+        stale_message_filter.filter(message(flight_ref, number, "SCHEDULED"))
+
+    assert list(stale_message_filter.flights) == ["R1", "R3"]
+
+
+def lifecycles(generator, flights):
+    """
+    Messages for a few flights of two planes, in the order they were sent: each flight is scheduled, then updated, flown,
+    landed or cancelled at random (a cancelled flight is filed again).
+    """
+    messages = []
+    source_time = 0
+    for number in range(flights):
+        acid = generator.choice(("N1QS", "N2QS"))
+        statuses = ["SCHEDULED"]
+        for _ in range(generator.randint(1, 5)):
+            statuses.append("SCHEDULED" if statuses[-1] == "CANCELED" else generator.choice(("SCHEDULED", "FLYING", "ARRIVED", "CANCELED", None)))
+        for status in statuses:
+            source_time += generator.randint(1, 50)
+            messages.append(message(f"R{number}", source_time, status, acid=acid,
+                                    model=generator.choice(("C68A", "E55P", None)) if status == "FLYING" else None,
+                                    eta=source_time * 7 if generator.random() < 0.7 else None,
+                                    arr_arpt=generator.choice(("KTEB", "KPBI", None))))
+    return messages
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_database_ends_up_as_if_the_messages_arrived_in_order(seed):
+    generator = random.Random(seed)
+    for _ in range(250):
+        messages = lifecycles(generator, generator.randint(1, 5))
+        shuffled = list(messages)
+        generator.shuffle(shuffled)
+
+        assert written(shuffled) == written(messages), shuffled
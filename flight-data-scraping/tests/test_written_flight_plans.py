@@ -0,0 +1,79 @@
+from common.flight_plan import FlightPlan
+from written_flight_plans import Written_flight_plans
+
+
+def written(**settings):
+    flight_plans = Written_flight_plans(**settings)
+    flight_plans.apply(FlightPlan(flight_ref="R1", acid="N1QS", dep_arpt="KTEB", arr_arpt="KPBI", etd=1000, eta=9000, status="SCHEDULED", fbo_id=3))
+    return flight_plans
+
+
+def test_unknown_flight_plan_is_written_whole():
+    flight_plan = FlightPlan(flight_ref="R2", acid="N2QS", status="SCHEDULED")
+
+    assert written().changes(flight_plan) == (flight_plan, 0)
+
+
+def test_same_values_need_no_statement():
+    flight_plan = FlightPlan(flight_ref="R1", acid="N1QS", arr_arpt="KPBI", status="SCHEDULED")
+
+    assert written().changes(flight_plan) == (None, 2)
+
+
+def test_only_changed_columns_are_sent():
+    flight_plan = FlightPlan(flight_ref="R1", acid="N1QS", arr_arpt="KPBI", eta=9600, status="FLYING")
+
+    changed, unchanged = written().changes(flight_plan)
+
+    assert changed == FlightPlan(flight_ref="R1", acid="N1QS", eta=9600, status="FLYING")
+    assert unchanged == 1
+
+
+def test_small_eta_changes_do_not_count():
+    flight_plans = written(eta_threshold=60)
+
+    assert flight_plans.changes(FlightPlan(flight_ref="R1", acid="N1QS", eta=9059)) == (None, 1)
+    assert flight_plans.changes(FlightPlan(flight_ref="R1", acid="N1QS", eta=8941)) == (None, 1)
+    assert flight_plans.changes(FlightPlan(flight_ref="R1", acid="N1QS", eta=9060))[0] == FlightPlan(flight_ref="R1", acid="N1QS", eta=9060)
+
+
+def test_a_new_acid_is_a_change():
+    changed, unchanged = written().changes(FlightPlan(flight_ref="R1", acid="N7QS", status="SCHEDULED"))
+
+    assert changed == FlightPlan(flight_ref="R1", acid="N7QS")
+    assert unchanged == 1
+
+
+def test_a_row_deleted_in_the_same_transaction_is_written_whole():
+    flight_plan = FlightPlan(flight_ref="R1", acid="N1QS", arr_arpt="KPBI", status="SCHEDULED")
+
+    assert written().changes(flight_plan, deleted=True) == (flight_plan, 0)
+
+
+def test_apply_merges_into_the_row():
+    flight_plans = written()
+    flight_plans.apply(FlightPlan(flight_ref="R1", acid="N1QS", status="ARRIVED", eta=9300))
+
+    assert flight_plans.flight_plans["R1"] == FlightPlan(flight_ref="R1", acid="N1QS", dep_arpt="KTEB", arr_arpt="KPBI", etd=1000, eta=9300,
+                                                          status="ARRIVED", fbo_id=3)
+    # The threshold is measured from what was written, so small changes can't creep up on it
+    assert flight_plans.changes(FlightPlan(flight_ref="R1", acid="N1QS", eta=9330)) == (None, 1)
+
+
+def test_least_recently_written_flight_plans_are_forgotten():
+    flight_plans = Written_flight_plans(max_size=2)
+    for flight_ref in ("R1", "R2"):
+        flight_plans.apply(FlightPlan(flight_ref=flight_ref, acid="N1QS", status="SCHEDULED"))
+    flight_plans.apply(FlightPlan(flight_ref="R1", acid="N1QS", status="FLYING"))
+    flight_plans.apply(FlightPlan(flight_ref="R3", acid="N1QS", status="SCHEDULED"))
+
+    assert list(flight_plans.flight_plans) == ["R1", "R3"]
+    assert flight_plans.size() == 2
+
+
+def test_removed_flight_plan_is_written_whole_again():
+    flight_plans = written()
+    flight_plans.remove("R1")
+    flight_plan = FlightPlan(flight_ref="R1", acid="N1QS", status="SCHEDULED")
+
+    assert flight_plans.changes(flight_plan) == (flight_plan, 0)